@@ -0,0 +1,118 @@
+"""Split orders into an order header and order_items lines
+
+Legacy rows stored one product per order. Rows written by one checkout share
+a stripe_session_id; they are folded into the lowest order_id of the group,
+which becomes the header, and every legacy row becomes one order item.
+Rows without a session (the legacy createOrder endpoint) each become an order
+with a single item.
+
+Revision ID: 0002_order_items
+Revises: 0001_baseline
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_order_items"
+down_revision: Union[str, Sequence[str], None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # The application may already have created the table through create_all
+    if "order_items" not in inspector.get_table_names():
+        op.create_table(
+            "order_items",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("order_id", sa.Integer(), nullable=False),
+            sa.Column("product_id", sa.Integer(), nullable=False),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("unit_price", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["order_id"], ["orders.order_id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_order_items_id", "order_items", ["id"])
+        op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+    order_columns = {column["name"] for column in inspector.get_columns("orders")}
+    if "created_at" not in order_columns:
+        with op.batch_alter_table("orders") as batch_op:
+            batch_op.add_column(sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    if "product_id" not in order_columns:
+        return
+
+    op.execute("""
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+        SELECT grouped.head_id, grouped.product_id, grouped.quantity,
+               COALESCE(grouped.total_amount / NULLIF(grouped.quantity, 0), products.price, 0)
+        FROM (
+            SELECT CASE WHEN stripe_session_id IS NULL THEN order_id
+                        ELSE MIN(order_id) OVER (PARTITION BY user_id, stripe_session_id)
+                   END AS head_id,
+                   order_id, product_id, quantity, total_amount
+            FROM orders
+        ) AS grouped
+        LEFT JOIN products ON products.id = grouped.product_id
+        ORDER BY grouped.order_id
+    """)
+    # Headers of multi-row checkouts carry the total of the whole group
+    op.execute("""
+        UPDATE orders SET total_amount = (
+            SELECT SUM(order_items.quantity * order_items.unit_price)
+            FROM order_items WHERE order_items.order_id = orders.order_id
+        )
+        WHERE stripe_session_id IS NOT NULL
+    """)
+    op.execute("DELETE FROM orders WHERE order_id NOT IN (SELECT DISTINCT order_id FROM order_items)")
+
+    with op.batch_alter_table("orders") as batch_op:
+        batch_op.drop_column("product_id")
+        batch_op.drop_column("quantity")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("orders") as batch_op:
+        batch_op.add_column(sa.Column("product_id", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("quantity", sa.Integer(), nullable=True))
+
+    # Every item after the first becomes its own legacy order row
+    op.execute("""
+        INSERT INTO orders (user_id, address, stripe_session_id, payment_status, total_amount, created_at,
+                            product_id, quantity)
+        SELECT orders.user_id, orders.address, orders.stripe_session_id, orders.payment_status,
+               order_items.unit_price * order_items.quantity, orders.created_at,
+               order_items.product_id, order_items.quantity
+        FROM order_items JOIN orders ON orders.order_id = order_items.order_id
+        WHERE order_items.id <> (SELECT MIN(first.id) FROM order_items AS first
+                                 WHERE first.order_id = order_items.order_id)
+    """)
+    op.execute("""
+        UPDATE orders SET
+            product_id = (SELECT order_items.product_id FROM order_items
+                          WHERE order_items.order_id = orders.order_id ORDER BY order_items.id LIMIT 1),
+            quantity = (SELECT order_items.quantity FROM order_items
+                        WHERE order_items.order_id = orders.order_id ORDER BY order_items.id LIMIT 1),
+            total_amount = (SELECT order_items.unit_price * order_items.quantity FROM order_items
+                            WHERE order_items.order_id = orders.order_id ORDER BY order_items.id LIMIT 1)
+        WHERE product_id IS NULL
+    """)
+    op.execute("DELETE FROM orders WHERE product_id IS NULL")
+
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
+    op.drop_index("ix_order_items_id", table_name="order_items")
+    op.drop_table("order_items")
+    with op.batch_alter_table("orders") as batch_op:
+        batch_op.drop_column("created_at")
+        batch_op.alter_column("product_id", existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column("quantity", existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key("orders_product_id_fkey", "products", ["product_id"], ["id"], ondelete="CASCADE")
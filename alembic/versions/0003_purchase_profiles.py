@@ -0,0 +1,62 @@
+"""Materialized purchase profiles for checkout suggestions
+
+Existing orders start with profiled_at NULL and are folded in by the
+refresh_pending_purchase_profiles beat task (or python -m app.purchase_profile catch-up).
+
+Revision ID: 0003_purchase_profiles
+Revises: 0002_order_items
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_purchase_profiles"
+down_revision: Union[str, Sequence[str], None] = "0002_order_items"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_category_affinity",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("purchase_count", sa.Integer(), nullable=False),
+        sa.Column("last_purchased_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["category_id"], ["categories.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "category_id"),
+    )
+    op.create_table(
+        "product_popularity",
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("units_sold", sa.Integer(), nullable=False),
+        sa.Column("last_ordered_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.create_index("ix_product_popularity_score", "product_popularity", ["score"])
+
+    with op.batch_alter_table("orders") as batch_op:
+        batch_op.add_column(sa.Column("profiled_at", sa.DateTime(), nullable=True))
+    op.create_index(
+        "ix_orders_unprofiled", "orders", ["order_id"],
+        postgresql_where=sa.text("profiled_at IS NULL"), sqlite_where=sa.text("profiled_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_orders_unprofiled", table_name="orders")
+    with op.batch_alter_table("orders") as batch_op:
+        batch_op.drop_column("profiled_at")
+    op.drop_index("ix_product_popularity_score", table_name="product_popularity")
+    op.drop_table("product_popularity")
+    op.drop_table("user_category_affinity")
@@ -0,0 +1,61 @@
+"""Indexes for foreign-key lookup paths and unique cart/wishlist entries
+
+Duplicate cart and wishlist rows are collapsed onto the oldest row, which
+takes the summed cart quantity, before the unique constraints are added. On
+PostgreSQL the indexes are built concurrently so the tables stay writable
+during the migration.
+
+Revision ID: 0005_lookup_indexes
+Revises: 0004_product_neighbors
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_lookup_indexes"
+down_revision: Union[str, Sequence[str], None] = "0004_product_neighbors"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_products_category", "products", ["category"]),
+    ("ix_ratings_product_id", "ratings", ["product_id"]),
+    ("ix_comments_product_id", "comments", ["product_id"]),
+    ("ix_orders_user_id_order_id", "orders", ["user_id", "order_id"]),
+    ("ix_order_items_product_id_order_id", "order_items", ["product_id", "order_id"]),
+    ("ix_wishlist_product_id", "wishlist", ["product_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "UPDATE cart SET quantity = (SELECT SUM(duplicate.quantity) FROM cart AS duplicate "
+        "WHERE duplicate.user_id = cart.user_id AND duplicate.product_id = cart.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute("DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id)")
+    op.execute("DELETE FROM wishlist WHERE id NOT IN (SELECT MIN(id) FROM wishlist GROUP BY user_id, product_id)")
+    with op.batch_alter_table("cart") as batch_op:
+        batch_op.create_unique_constraint("uq_cart_user_product", ["user_id", "product_id"])
+    with op.batch_alter_table("wishlist") as batch_op:
+        batch_op.create_unique_constraint("uq_wishlist_user_product", ["user_id", "product_id"])
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    with op.batch_alter_table("wishlist") as batch_op:
+        batch_op.drop_constraint("uq_wishlist_user_product", type_="unique")
+    with op.batch_alter_table("cart") as batch_op:
+        batch_op.drop_constraint("uq_cart_user_product", type_="unique")
@@ -0,0 +1,40 @@
+"""updated_at columns on catalog tables for ETag validators
+
+Existing rows get the migration time, so the first request after the upgrade
+sees new ETags once. On PostgreSQL 11+ adding a column with a constant
+default does not rewrite the table.
+
+Revision ID: 0006_updated_at
+Revises: 0005_lookup_indexes
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_updated_at"
+down_revision: Union[str, Sequence[str], None] = "0005_lookup_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["products", "categories", "ratings", "comments"]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(
+                sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now())
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("updated_at")
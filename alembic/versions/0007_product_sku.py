@@ -0,0 +1,38 @@
+"""sku column on products for bulk imports
+
+Imports upsert on sku, so it carries a unique index. Products created before
+this migration have no sku; NULLs do not collide in the index. On PostgreSQL
+the index is built concurrently.
+
+Revision ID: 0007_product_sku
+Revises: 0006_updated_at
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_product_sku"
+down_revision: Union[str, Sequence[str], None] = "0006_updated_at"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("sku", sa.String(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index("ix_products_sku", "products", ["sku"], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_products_sku", table_name="products", postgresql_concurrently=True)
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("sku")
@@ -0,0 +1,65 @@
+"""Review listings: helpful votes, author display names, keyset indexes
+
+The single-column product_id indexes on comments and ratings are replaced by
+composite ones that also serve the listing order. On PostgreSQL the indexes
+are built and dropped concurrently.
+
+Revision ID: 0008_review_listing
+Revises: 0007_product_sku
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_review_listing"
+down_revision: Union[str, Sequence[str], None] = "0007_product_sku"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_INDEXES = [
+    ("ix_comments_product_id_id", "comments", ["product_id", "id"]),
+    ("ix_comments_product_id_helpful_count_id", "comments", ["product_id", "helpful_count", "id"]),
+    ("ix_ratings_product_id_id", "ratings", ["product_id", "id"]),
+    ("ix_ratings_product_id_rating_id", "ratings", ["product_id", "rating", "id"]),
+]
+OLD_INDEXES = [
+    ("ix_comments_product_id", "comments", ["product_id"]),
+    ("ix_ratings_product_id", "ratings", ["product_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("display_name", sa.String(), nullable=True))
+    with op.batch_alter_table("comments") as batch_op:
+        batch_op.add_column(sa.Column("helpful_count", sa.Integer(), nullable=False, server_default="0"))
+    op.create_table(
+        "comment_votes",
+        sa.Column("comment_id", sa.Integer(), sa.ForeignKey("comments.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    )
+    with op.get_context().autocommit_block():
+        for name, table, columns in NEW_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+        for name, table, _columns in OLD_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in OLD_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+        for name, table, _columns in reversed(NEW_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.drop_table("comment_votes")
+    with op.batch_alter_table("comments") as batch_op:
+        batch_op.drop_column("helpful_count")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("display_name")
@@ -0,0 +1,55 @@
+"""Wishlist alerts: pending/sent alert rows and a keyset index on wishlist
+
+ix_wishlist_product_id is replaced by (product_id, id) so a product's
+wishlisters can be paged by id. On PostgreSQL the indexes are built and
+dropped concurrently.
+
+Revision ID: 0009_wishlist_alerts
+Revises: 0008_review_listing
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_wishlist_alerts"
+down_revision: Union[str, Sequence[str], None] = "0008_review_listing"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "wishlist_alerts",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("old_price", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+    )
+    pending = sa.text("sent_at IS NULL")
+    op.create_index(
+        "uq_wishlist_alerts_pending", "wishlist_alerts", ["user_id", "product_id", "kind"], unique=True,
+        postgresql_where=pending, sqlite_where=pending,
+    )
+    op.create_index("ix_wishlist_alerts_product_id_user_id", "wishlist_alerts", ["product_id", "user_id"])
+    with op.get_context().autocommit_block():
+        op.create_index("ix_wishlist_product_id_id", "wishlist", ["product_id", "id"], postgresql_concurrently=True)
+        op.drop_index("ix_wishlist_product_id", table_name="wishlist", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index("ix_wishlist_product_id", "wishlist", ["product_id"], postgresql_concurrently=True)
+        op.drop_index("ix_wishlist_product_id_id", table_name="wishlist", postgresql_concurrently=True)
+    op.drop_index("ix_wishlist_alerts_product_id_user_id", table_name="wishlist_alerts")
+    op.drop_index("uq_wishlist_alerts_pending", table_name="wishlist_alerts")
+    op.drop_table("wishlist_alerts")
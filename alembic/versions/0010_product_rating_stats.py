@@ -0,0 +1,40 @@
+"""Running rating count and total on products for rating filters and facets
+
+Existing ratings are summed into the new columns.
+
+Revision ID: 0010_product_rating_stats
+Revises: 0009_wishlist_alerts
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_product_rating_stats"
+down_revision: Union[str, Sequence[str], None] = "0009_wishlist_alerts"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("rating_count", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("rating_total", sa.Integer(), nullable=False, server_default="0"))
+    op.execute(
+        "UPDATE products SET "
+        "rating_count = (SELECT count(*) FROM ratings WHERE ratings.product_id = products.id), "
+        "rating_total = (SELECT coalesce(sum(rating), 0) FROM ratings WHERE ratings.product_id = products.id) "
+        "WHERE EXISTS (SELECT 1 FROM ratings WHERE ratings.product_id = products.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("rating_total")
+        batch_op.drop_column("rating_count")
@@ -0,0 +1,49 @@
+"""Sales rollups per hour and day, and watermarks for incremental jobs
+
+Revision ID: 0011_sales_rollups
+Revises: 0010_product_rating_stats
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_sales_rollups"
+down_revision: Union[str, Sequence[str], None] = "0010_product_rating_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "sales_rollups",
+        sa.Column("period", sa.String(length=4), primary_key=True),
+        sa.Column("dimension", sa.String(length=8), primary_key=True),
+        sa.Column("entity_id", sa.Integer(), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime(), primary_key=True),
+        sa.Column("category_id", sa.Integer(), nullable=True),
+        sa.Column("orders", sa.Integer(), nullable=False),
+        sa.Column("units", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.BigInteger(), nullable=False),
+    )
+    op.create_index(
+        "ix_sales_rollups_period_dimension_bucket_start", "sales_rollups", ["period", "dimension", "bucket_start"]
+    )
+    op.create_table(
+        "job_watermarks",
+        sa.Column("name", sa.String(), primary_key=True),
+        sa.Column("value", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("job_watermarks")
+    op.drop_index("ix_sales_rollups_period_dimension_bucket_start", table_name="sales_rollups")
+    op.drop_table("sales_rollups")
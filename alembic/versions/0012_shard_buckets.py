@@ -0,0 +1,34 @@
+"""Bucket to shard map for per-user data
+
+Revision ID: 0012_shard_buckets
+Revises: 0011_sales_rollups
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012_shard_buckets"
+down_revision: Union[str, Sequence[str], None] = "0011_sales_rollups"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Empty until the rebalance tool runs: every bucket is on shard 0, the primary
+    op.create_table(
+        "shard_buckets",
+        sa.Column("bucket", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("moving", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("shard_buckets")
@@ -0,0 +1,59 @@
+"""Image blob references and checkout stock reservations
+
+Both tables were wrongly part of 0001_baseline, so databases stamped with it
+never got them. Databases built from that baseline already have them and
+are left as they are.
+
+Revision ID: 0013_image_blobs_stock_reservations
+Revises: 0012_shard_buckets
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0013_image_blobs_stock_reservations"
+down_revision: Union[str, Sequence[str], None] = "0012_shard_buckets"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("image_blobs"):
+        op.create_table(
+            "image_blobs",
+            sa.Column("digest", sa.String(length=64), nullable=False),
+            sa.Column("content_type", sa.String(), nullable=False),
+            sa.Column("size", sa.Integer(), nullable=False),
+            sa.Column("ref_count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("digest"),
+        )
+    if not inspector.has_table("stock_reservations"):
+        op.create_table(
+            "stock_reservations",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("product_id", sa.Integer(), nullable=False),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("stripe_session_id", sa.String(), nullable=True),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_stock_reservations_id", "stock_reservations", ["id"])
+        op.create_index("ix_stock_reservations_stripe_session_id", "stock_reservations", ["stripe_session_id"])
+        op.create_index("ix_stock_reservations_expires_at", "stock_reservations", ["expires_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("stock_reservations")
+    op.drop_table("image_blobs")
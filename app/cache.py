@@ -0,0 +1,165 @@
+"""
+Small JSON cache in front of Redis.
+
+When Redis cannot be reached the cache falls back to a bounded in-process
+store and stops retrying Redis for a short cool-down, so an outage costs cache
+hit rate rather than request latency.
+"""
+from redis.exceptions import RedisError
+import json
+import os
+import threading
+import time
+import redis
+from app.telemetry import CACHE_REQUESTS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "ecomm:")
+LOCAL_MAX_ENTRIES = 10_000
+RETRY_AFTER_SECONDS = 30
+
+_client = None
+_redis_down_until = 0.0
+_local: dict[str, tuple[float, str | bytes]] = {}
+_local_lock = threading.Lock()
+
+
+def _redis():
+    global _client
+    if time.monotonic() < _redis_down_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.1, socket_connect_timeout=0.1)
+    return _client
+
+
+def _mark_down():
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + RETRY_AFTER_SECONDS
+
+
+def _local_get(key: str) -> str | bytes | None:
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _local[key]
+            return None
+        return entry[1]
+
+
+def _local_set(key: str, raw: str | bytes, ttl: int) -> None:
+    with _local_lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            # Drop the oldest insertions; dicts keep insertion order
+            for stale in list(_local)[: LOCAL_MAX_ENTRIES // 10]:
+                del _local[stale]
+        _local[key] = (time.monotonic() + ttl, raw)
+
+
+def get_json(key: str):
+    """Returns the cached value for `key`, or None on a miss."""
+    client = _redis()
+    raw = None
+    if client is not None:
+        try:
+            raw = client.get(CACHE_PREFIX + key)
+        except RedisError:
+            _mark_down()
+            raw = _local_get(key)
+    else:
+        raw = _local_get(key)
+    CACHE_REQUESTS.inc("miss" if raw is None else "hit")
+    return None if raw is None else json.loads(raw)
+
+
+def set_json(key: str, value, ttl: int) -> None:
+    raw = json.dumps(value, default=str)
+    client = _redis()
+    if client is not None:
+        try:
+            client.set(CACHE_PREFIX + key, raw, ex=ttl)
+            return
+        except RedisError:
+            _mark_down()
+    _local_set(key, raw, ttl)
+
+
+def get_range(key: str, start: int, end: int) -> tuple[int, bytes] | None:
+    """
+    Bytes `start` to `end` (inclusive) of a value stored with set_bytes and
+    the value's full length, in one round trip. None on a miss.
+    """
+    client = _redis()
+    found = None
+    if client is not None:
+        try:
+            exists, size, raw = client.pipeline(transaction=False).exists(CACHE_PREFIX + key).strlen(
+                CACHE_PREFIX + key
+            ).getrange(CACHE_PREFIX + key, start, end).execute()
+            found = (size, raw) if exists else None
+        except RedisError:
+            _mark_down()
+            client = None
+    if client is None:
+        raw = _local_get(key)
+        found = None if raw is None else (len(raw), raw[start:end + 1])
+    CACHE_REQUESTS.inc("miss" if found is None else "hit")
+    return found
+
+
+def set_bytes(key: str, raw: bytes, ttl: int) -> None:
+    client = _redis()
+    if client is not None:
+        try:
+            client.set(CACHE_PREFIX + key, raw, ex=ttl)
+            return
+        except RedisError:
+            _mark_down()
+    _local_set(key, raw, ttl)
+
+
+def add(key: str, value: str, ttl: int) -> bool:
+    """Stores `value` only if `key` is not set yet. True when it was stored."""
+    client = _redis()
+    if client is not None:
+        try:
+            return bool(client.set(CACHE_PREFIX + key, value, ex=ttl, nx=True))
+        except RedisError:
+            _mark_down()
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return False
+    _local_set(key, value, ttl)
+    return True
+
+
+def delete(*keys: str) -> None:
+    if not keys:
+        return
+    with _local_lock:
+        for key in keys:
+            _local.pop(key, None)
+    client = _redis()
+    if client is not None:
+        try:
+            client.delete(*(CACHE_PREFIX + key for key in keys))
+        except RedisError:
+            _mark_down()
+
+
+def ping() -> bool:
+    """Whether Redis answers. A failure starts the same cool-down as any other call."""
+    client = _redis()
+    if client is None:
+        return False
+    try:
+        return bool(client.ping())
+    except RedisError:
+        _mark_down()
+        return False
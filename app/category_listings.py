@@ -0,0 +1,136 @@
+"""
+Precomputed category listings.
+
+Each category's product ids are kept in cache once per sort order, packed
+as an ``array('i')``. A page is a ``GETRANGE`` over the packed bytes
+followed by one primary-key fetch of the rows, so the cost of a page does
+not depend on its offset or the size of the category.
+
+A refresh rebuilds a category's listings in full: one indexed query per
+sort order, off the request path. Product writes hand the categories they
+touched to ``refresh``, which coalesces them. The first write to a category
+sets a ``listing-refresh`` marker and queues the ``refresh_category_listings``
+task LISTING_REFRESH_DELAY_SECONDS later. Further writes see the marker and
+queue nothing, so a burst of edits to one category costs a single rebuild.
+The rebuild clears the marker before it reads, and a write landing during
+the rebuild queues the next one. Celery beat rebuilds every category each
+LISTING_REFRESH_SECONDS to pick up popularity changes from new orders. A
+listing missing from cache is built on the request that needs it. Until a
+refresh lands, a page can show a product in its old position. Rows that
+were deleted or moved to another category since the build are skipped.
+
+Pages filtered by price, stock or rating (app.facets) are queried directly.
+"""
+from array import array
+from enum import Enum
+from sqlalchemy import Connection, func, select
+from sqlalchemy.orm import Session
+from app.celery_app import celery_app
+from app.models import models
+from app import cache
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LISTING_REFRESH_SECONDS = int(os.getenv("LISTING_REFRESH_SECONDS", "600"))
+# Outlives a few refreshes so a stalled beat falls back to building on demand
+LISTING_TTL_SECONDS = int(os.getenv("LISTING_TTL_SECONDS", "3600"))
+# Writes within this window after the first one share its rebuild
+LISTING_REFRESH_DELAY_SECONDS = int(os.getenv("LISTING_REFRESH_DELAY_SECONDS", "5"))
+ITEM_SIZE = array("i").itemsize
+
+
+class ListingSort(str, Enum):
+    newest = "newest"
+    price = "price"
+    price_desc = "price_desc"
+    popular = "popular"
+
+
+def listing_key(category_id: int, sort: ListingSort) -> str:
+    return f"listing:{category_id}:{sort.value}"
+
+
+def refresh_key(category_id: int) -> str:
+    return f"listing-refresh:{category_id}"
+
+
+def _ordered_ids(category_id: int, sort: ListingSort, conditions=()):
+    Product = models.Product
+    query = select(Product.id).where(Product.category == category_id, *conditions)
+    if sort is ListingSort.newest:
+        return query.order_by(Product.id.desc())
+    if sort is ListingSort.price:
+        return query.order_by(Product.price, Product.id.desc())
+    if sort is ListingSort.price_desc:
+        return query.order_by(Product.price.desc(), Product.id.desc())
+    return query.outerjoin(
+        models.ProductPopularity, models.ProductPopularity.product_id == Product.id
+    ).order_by(func.coalesce(models.ProductPopularity.score, 0).desc(), Product.id.desc())
+
+
+def build(db: Session | Connection, category_id: int, sort: ListingSort) -> bytes:
+    """Stores and returns the packed ids of a category in `sort` order."""
+    ids = array("i", db.execute(_ordered_ids(category_id, sort)).scalars())
+    raw = ids.tobytes()
+    cache.set_bytes(listing_key(category_id, sort), raw, LISTING_TTL_SECONDS)
+    return raw
+
+
+def rebuild(db: Session, category_ids=None) -> int:
+    """Rebuilds every sort of `category_ids`, or of all categories with products. Returns the categories built."""
+    if category_ids is None:
+        category_ids = [category_id for (category_id,) in db.query(models.Product.category).filter(
+            models.Product.category.isnot(None)
+        ).distinct().all()]
+    # Writes from here on queue another refresh
+    cache.delete(*(refresh_key(category_id) for category_id in category_ids))
+    for category_id in category_ids:
+        for sort in ListingSort:
+            build(db, category_id, sort)
+    db.commit()
+    return len(category_ids)
+
+
+def page_ids(db: Session | Connection, category_id: int, sort: ListingSort, offset: int, limit: int) -> tuple[list[int], int]:
+    """The ids at `offset` in a category listing and the listing's length, building it on a miss."""
+    start, end = offset * ITEM_SIZE, (offset + limit) * ITEM_SIZE - 1
+    found = cache.get_range(listing_key(category_id, sort), start, end)
+    if found is None:
+        raw = build(db, category_id, sort)
+        found = (len(raw), raw[start:end + 1])
+    size, raw = found
+    ids = array("i")
+    ids.frombytes(raw)
+    return ids.tolist(), size // ITEM_SIZE
+
+
+def filtered_page_ids(db: Session | Connection, category_id: int, sort: ListingSort, conditions: list, offset: int,
+                      limit: int) -> tuple[list[int], int]:
+    """
+    Like page_ids for a listing narrowed by `conditions` (app.facets). These
+    are not precomputed: the page and the count are queried.
+    """
+    ids = list(db.execute(_ordered_ids(category_id, sort, conditions).offset(offset).limit(limit)).scalars())
+    total = db.execute(select(func.count(models.Product.id)).where(
+        models.Product.category == category_id, *conditions
+    )).scalar()
+    return ids, total
+
+
+def refresh(*category_ids) -> None:
+    """
+    Queues a rebuild of the listings of `category_ids`, unless one is
+    already queued. Call after the write is committed.
+    """
+    # The marker outlives the delay so a lost task only holds refreshes back until it expires
+    ttl = 2 * LISTING_REFRESH_DELAY_SECONDS + 60
+    category_ids = sorted({
+        category_id for category_id in category_ids
+        if category_id is not None and cache.add(refresh_key(category_id), "1", ttl)
+    })
+    if category_ids:
+        # By name: app.tasks imports this module
+        celery_app.send_task("app.tasks.refresh_category_listings", args=[category_ids],
+                             countdown=LISTING_REFRESH_DELAY_SECONDS)
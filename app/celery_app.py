@@ -1,6 +1,8 @@
-from celery import Celery
+from celery import Celery, signals
 from dotenv import load_dotenv
+from app.telemetry import TASK_QUEUE_WAIT_SECONDS, TASK_RUNTIME_SECONDS
 import os
+import time
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,4 +20,56 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
-)
\ No newline at end of file
+    beat_schedule={
+        "release-expired-reservations": {
+            "task": "app.tasks.release_expired_reservations",
+            "schedule": 60.0,
+        },
+        "refresh-pending-purchase-profiles": {
+            "task": "app.tasks.refresh_pending_purchase_profiles",
+            "schedule": 300.0,
+        },
+        "build-recommendations": {
+            "task": "app.tasks.build_recommendations",
+            "schedule": 3600.0,
+        },
+        "roll-up-sales": {
+            "task": "app.tasks.roll_up_sales",
+            "schedule": float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60")),
+        },
+        "refresh-category-listings": {
+            "task": "app.tasks.refresh_category_listings",
+            "schedule": float(os.getenv("LISTING_REFRESH_SECONDS", "600")),
+        },
+        "send-wishlist-digests": {
+            "task": "app.tasks.send_wishlist_digests",
+            "schedule": float(os.getenv("WISHLIST_DIGEST_INTERVAL_SECONDS", "300")),
+        },
+    },
+)
+
+
+# Task metrics: the publisher stamps each message, the worker measures how
+# long it waited in the queue and how long it ran
+_task_started: dict[str, float] = {}
+
+
+@signals.before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@signals.task_prerun.connect
+def _task_prerun(task_id=None, task=None, **kwargs):
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is not None:
+        TASK_QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - published_at), task.name)
+    _task_started[task_id] = time.perf_counter()
+
+
+@signals.task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME_SECONDS.observe(time.perf_counter() - started, task.name, state or "UNKNOWN")
@@ -1,30 +1,315 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from app.telemetry import DB_POOL_WAIT_SECONDS
 from dotenv import load_dotenv
+import itertools
 import os
+import threading
+import time
 
 
 load_dotenv()
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
-if SQLALCHEMY_DATABASE_URL is None:
-    raise ValueError("DATABASE_URL environment variable is not set")
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Load shedding (app.rate_limit) looks at the mean pool wait over this many seconds
+POOL_WAIT_WINDOW_SECONDS = int(os.getenv("POOL_WAIT_WINDOW_SECONDS", "5"))
+
+
+class WaitWindow:
+    """Mean of values recorded over the last few seconds, in one-second buckets."""
+
+    def __init__(self, seconds: int):
+        self.buckets = [[-1, 0.0, 0] for _ in range(max(1, seconds))]
+        self.lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        now = int(time.monotonic())
+        bucket = self.buckets[now % len(self.buckets)]
+        with self.lock:
+            if bucket[0] != now:
+                bucket[:] = [now, 0.0, 0]
+            bucket[1] += value
+            bucket[2] += 1
+
+    def mean(self) -> float:
+        now = int(time.monotonic())
+        total, count = 0.0, 0
+        for second, bucket_total, bucket_count in self.buckets:
+            if now - second < len(self.buckets):
+                total += bucket_total
+                count += bucket_count
+        return total / count if count else 0.0
+
+
+POOL_WAITS = WaitWindow(POOL_WAIT_WINDOW_SECONDS)
+
+
+class WaitTimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            POOL_WAITS.add(waited)
+            DB_POOL_WAIT_SECONDS.observe(waited)
+
+
+def recent_pool_wait() -> float:
+    """Mean seconds a checkout waited for a connection over the last POOL_WAIT_WINDOW_SECONDS."""
+    return POOL_WAITS.mean()
+
+
+def _engine_options(url: str) -> dict:
+    # In-memory SQLite needs its default single-connection pool
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {"poolclass": WaitTimedQueuePool}
+
+
+# The engine is created on first use rather than at import, so importing the
+# app (workers, tests, CLI tools) never blocks on the database
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                database_url = os.getenv("DATABASE_URL")
+                if database_url is None:
+                    raise ValueError("DATABASE_URL environment variable is not set")
+                _engine = create_engine(database_url, pool_pre_ping=True, **_engine_options(database_url))
+                _session_factory.configure(bind=_engine)
+    return _engine
+
+
+def dispose_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+    dispose_replicas()
+    dispose_shards()
+
+
+def SessionLocal():
+    """Opens a session on the (lazily created) engine."""
+    get_engine()
+    return _session_factory()
+
+
+def _pool_counts(pool) -> dict[str, int]:
+    counts = {}
+    for state, method in (("size", "size"), ("checked_out", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            counts[state] = getattr(pool, method)()
+    if "overflow" in counts:
+        # QueuePool counts overflow from -size while the pool is filling up
+        counts["overflow"] = max(0, counts["overflow"])
+    return counts
+
+
+def pool_stats() -> dict[tuple[str, str], int]:
+    """Connection counts of the engines created so far, keyed by (engine, state)."""
+    engines = [("primary", _engine)] + [(f"replica{i}", replica.engine) for i, replica in enumerate(_replicas or [])]
+    return {
+        (name, state): count
+        for name, engine in engines if engine is not None
+        for state, count in _pool_counts(engine.pool).items()
+    }
+
+
+def check_connection() -> bool:
+    try:
+        with get_engine().connect():
+            print("Database connection successful (SQLAlchemy)")
+        return True
+    except SQLAlchemyError as e:
+        print("Database connection failed!")
+        print("Error:", e)
+        return False
 
-try:
-    with engine.connect() as conn:
-        print("Database connection successful (SQLAlchemy)")
-except SQLAlchemyError as e:
-    print("Database connection failed!")
-    print("Error:", e)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Read replicas. Handlers that only read catalog data can depend on
+# get_read_db instead of get_db; anything that writes, or must see its own
+# writes (checkout, orders, cart), stays on the primary.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# A replica further behind the primary than this is skipped
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# How long a health check result is trusted before the replica is probed again
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+
+_LAG_QUERIES = {
+    # An idle replica that has replayed everything it received is not behind
+    "postgresql": (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_engine(url, pool_pre_ping=True, **_engine_options(url))
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = float("-inf")
+        self.lock = threading.Lock()
+
+    def measure_lag(self) -> float:
+        """Seconds the replica is behind the primary; 0 where the backend cannot tell."""
+        with self.engine.connect() as connection:
+            lag_query = _LAG_QUERIES.get(self.engine.dialect.name)
+            if lag_query is None:
+                connection.execute(text("SELECT 1"))
+                return 0.0
+            return float(connection.execute(text(lag_query)).scalar() or 0.0)
+
+    def is_usable(self) -> bool:
+        """
+        Re-probes the replica once per check interval. Only one caller probes
+        at a time; the others use the last known state meanwhile.
+        """
+        if time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL_SECONDS and self.lock.acquire(blocking=False):
+            try:
+                self.lag = self.measure_lag()
+                self.healthy = True
+            except SQLAlchemyError:
+                self.healthy = False
+            finally:
+                self.checked_at = time.monotonic()
+                self.lock.release()
+        return self.healthy and self.lag <= REPLICA_MAX_LAG_SECONDS
+
+    def mark_down(self) -> None:
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+
+_replicas: list[Replica] | None = None
+_replica_cycle = None
+_replica_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_replicas() -> list[Replica]:
+    global _replicas, _replica_cycle
+    if _replicas is None:
+        with _engine_lock:
+            if _replicas is None:
+                replicas = [Replica(url) for url in DATABASE_REPLICA_URLS]
+                _replica_cycle = itertools.cycle(range(len(replicas))) if replicas else None
+                _replicas = replicas
+    return _replicas
+
+
+def dispose_replicas():
+    global _replicas, _replica_cycle
+    with _engine_lock:
+        for replica in _replicas or []:
+            replica.engine.dispose()
+        _replicas = None
+        _replica_cycle = None
+
+
+def pick_replica() -> Replica | None:
+    """
+    Round-robins over the replicas, skipping any that failed their last health
+    check or lag too far behind. Returns None when none is usable.
+    """
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    start = next(_replica_cycle)
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        if replica.is_usable():
+            return replica
+    return None
+
+
+def ReadSessionLocal():
+    """Opens a session on a healthy replica, or on the primary when there is none."""
+    replica = pick_replica()
+    if replica is None:
+        return SessionLocal()
+    db = _replica_session_factory(bind=replica.engine)
+    db.info["replica"] = replica
+    return db
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    except OperationalError:
+        replica = db.info.get("replica")
+        if replica is not None:
+            # Take it out of rotation until its next health check
+            replica.mark_down()
+        raise
+    finally:
+        db.close()
+
+
+def get_read_connection():
+    """
+    A pooled connection for anonymous catalog reads, from a healthy replica or
+    the primary. It runs in autocommit mode, so there is no BEGIN/COMMIT
+    around the statements, and no Session: handlers execute Core statements
+    and get plain rows. Nothing that writes may use it.
+    """
+    replica = pick_replica()
+    engine = replica.engine if replica is not None else get_engine()
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            yield connection
+        except OperationalError:
+            if replica is not None:
+                replica.mark_down()
+            raise
+
+
+# Extra databases for per-user data (app.sharding), numbered from 1; shard 0
+# is the primary
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+_shard_engines: dict[int, object] = {}
+
+
+def get_shard_engine(shard: int):
+    if shard == 0:
+        return get_engine()
+    engine = _shard_engines.get(shard)
+    if engine is None:
+        with _engine_lock:
+            engine = _shard_engines.get(shard)
+            if engine is None:
+                url = SHARD_DATABASE_URLS[shard - 1]
+                engine = _shard_engines[shard] = create_engine(url, pool_pre_ping=True, **_engine_options(url))
+    return engine
+
+
+def dispose_shards():
+    with _engine_lock:
+        for engine in _shard_engines.values():
+            engine.dispose()
+        _shard_engines.clear()
@@ -0,0 +1,124 @@
+"""
+Product filters and facet counts for search and category listings.
+
+Facets come from one grouped query over the products that match the text
+query. Each output row is a cell keyed by every facet dimension: category,
+price bucket, whole-star average rating, in stock, and whether the price
+falls in the requested range. The cells are bounded by the number of
+categories times a few dozen, however large the catalog. Each facet then
+sums the cells that pass every filter except its own. Selecting a category
+therefore still counts the other categories, and picking a price range
+still shows the other ranges.
+
+Average ratings come from the running ``rating_count`` and
+``rating_total`` on products, so no ratings are read.
+"""
+from sqlalchemy import Connection, and_, case, func, select
+from sqlalchemy.orm import Session
+from app.models import models
+from app.schemas import schemas
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bounds of the price buckets, in the whole currency units Product.price
+# holds (checkout multiplies by 100 for Stripe); the last bucket is open-ended
+PRICE_FACET_BOUNDS = [int(bound) for bound in os.getenv("PRICE_FACET_BOUNDS", "10,25,50,100,250").split(",")]
+RATING_STEPS = range(1, 6)
+
+
+def average_rating_at_least(stars: int):
+    Product = models.Product
+    return (Product.rating_count > 0) & (Product.rating_total >= stars * Product.rating_count)
+
+
+def price_in_range(filters: schemas.ProductFilters):
+    conditions = []
+    if filters.min_price is not None:
+        conditions.append(models.Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(models.Product.price <= filters.max_price)
+    return conditions
+
+
+def filter_conditions(filters: schemas.ProductFilters) -> list:
+    """WHERE conditions for a listing restricted by `filters`."""
+    conditions = price_in_range(filters)
+    if filters.in_stock:
+        conditions.append(models.Product.stock > 0)
+    if filters.min_rating is not None:
+        conditions.append(average_rating_at_least(filters.min_rating))
+    return conditions
+
+
+def _price_bucket():
+    return case(
+        *[(models.Product.price < bound, index) for index, bound in enumerate(PRICE_FACET_BOUNDS)],
+        else_=len(PRICE_FACET_BOUNDS),
+    )
+
+
+def _cells(db: Session | Connection, conditions: list, filters: schemas.ProductFilters) -> list:
+    Product = models.Product
+    bucket = _price_bucket().label("bucket")
+    # Whole stars of the average: floor(total / count), integer division
+    stars = case((Product.rating_count > 0, Product.rating_total // Product.rating_count), else_=0).label("stars")
+    in_stock = case((Product.stock > 0, 1), else_=0).label("in_stock")
+    dimensions = [Product.category, bucket, stars, in_stock]
+    in_range = price_in_range(filters)
+    if in_range:
+        dimensions.append(case((and_(*in_range), 1), else_=0).label("in_price_range"))
+    return db.execute(
+        select(*dimensions, func.count().label("count")).where(*conditions).group_by(*dimensions)
+    ).all()
+
+
+def facet_counts(db: Session | Connection, conditions: list, filters: schemas.ProductFilters, category: int | None = None) -> dict:
+    """
+    Facet counts for the products matching `conditions` (e.g. the text
+    query). Each facet applies `filters` and `category` except its own
+    filter. Runs one grouped query.
+    """
+    cells = _cells(db, conditions, filters)
+    has_price_range = bool(price_in_range(filters))
+
+    def passes(cell, skip: str) -> bool:
+        return (
+            (skip == "category" or category is None or cell.category == category)
+            and (skip == "price" or not has_price_range or cell.in_price_range)
+            and (skip == "stock" or not filters.in_stock or cell.in_stock)
+            and (skip == "rating" or filters.min_rating is None or cell.stars >= filters.min_rating)
+        )
+
+    categories: dict = {}
+    prices = [0] * (len(PRICE_FACET_BOUNDS) + 1)
+    ratings = dict.fromkeys(RATING_STEPS, 0)
+    total = in_stock = 0
+    for cell in cells:
+        if passes(cell, "category"):
+            categories[cell.category] = categories.get(cell.category, 0) + cell.count
+        if passes(cell, "price"):
+            prices[cell.bucket] += cell.count
+        if passes(cell, "rating"):
+            for stars in RATING_STEPS:
+                if cell.stars >= stars:
+                    ratings[stars] += cell.count
+        if passes(cell, "stock") and cell.in_stock:
+            in_stock += cell.count
+        if passes(cell, ""):
+            total += cell.count
+    lower_bounds = [0] + PRICE_FACET_BOUNDS
+    return {
+        "total": total,
+        "in_stock": in_stock,
+        "categories": [
+            {"category": category_id, "count": count}
+            for category_id, count in sorted(categories.items(), key=lambda item: -item[1])
+        ],
+        "prices": [
+            {"min_price": lower_bounds[index], "max_price": PRICE_FACET_BOUNDS[index] - 1 if index < len(PRICE_FACET_BOUNDS) else None, "count": count}
+            for index, count in enumerate(prices)
+        ],
+        "ratings": [{"min_rating": stars, "count": count} for stars, count in sorted(ratings.items(), reverse=True)],
+    }
@@ -0,0 +1,60 @@
+"""
+Liveness and readiness of an API process.
+
+A process is ready once its warm-up (app.warmup) has run, while the primary
+database answers, and until it starts draining. Redis is reported but does
+not decide readiness: the cache and the rate limiter fall back to
+in-process state while it is down.
+
+The draining flag lives in shared memory created at import, so a runner that
+imports the app before forking (app.server) can flip it for every worker at
+once when it receives SIGTERM.
+"""
+from multiprocessing.sharedctypes import RawValue
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import get_engine, get_replicas
+from app import cache
+import ctypes
+
+_draining = RawValue(ctypes.c_bool, False)
+_warm = False
+
+
+def mark_warm() -> None:
+    global _warm
+    _warm = True
+
+
+def start_draining() -> None:
+    _draining.value = True
+
+
+def database_up() -> bool:
+    try:
+        with get_engine().connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except SQLAlchemyError:
+        return False
+
+
+def readiness() -> tuple[bool, dict]:
+    """(ready, report) for the readiness endpoint."""
+    database = database_up()
+    replicas = get_replicas()
+    if _draining.value:
+        status = "draining"
+    elif not _warm:
+        status = "warming"
+    elif not database:
+        status = "unavailable"
+    else:
+        status = "ready"
+    return status == "ready", {
+        "status": status,
+        "database": "up" if database else "down",
+        "replicas_usable": sum(replica.is_usable() for replica in replicas),
+        "replicas": len(replicas),
+        "redis": "up" if cache.ping() else "down",
+    }
@@ -0,0 +1,109 @@
+"""
+Conditional GET and CDN headers for catalog responses.
+
+Handlers derive an ETag from a version query before loading the body, and
+answer a matching ``If-None-Match`` with 304 straight away. The version
+query reads a row's ``updated_at``, the ids and ``updated_at`` of a page, or
+the row count and newest ``updated_at`` of a list: any write changes one of
+them. The paged review endpoints (app.routers.reviews) read narrow keyset
+pages and tag the page they loaded.
+
+Public responses carry ``Surrogate-Key`` headers naming what they contain,
+e.g. ``product-12 category-3``, and may be kept by the CDN for
+``CDN_MAX_AGE_SECONDS``. Writes call ``purge`` with the affected keys, which
+hands them to the CDN's purge API in the background. Browsers always
+revalidate.
+"""
+from datetime import datetime
+from fastapi import Request, Response, status
+from app.tasks import CDN_PURGE_URL, purge_surrogate_keys
+import hashlib
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CDN_MAX_AGE_SECONDS = int(os.getenv("CDN_MAX_AGE_SECONDS", "300"))
+PUBLIC_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+# Bodies behind authentication are revalidated by the client but never shared
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# Bump when a response's shape changes so clients do not keep old bodies
+RESPONSE_VERSION = "1"
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the values that determine a response, e.g. loaded rows' ids and updated_at."""
+    raw = "|".join([RESPONSE_VERSION] + [
+        part.isoformat() if isinstance(part, datetime) else str(part) for part in parts
+    ])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def cache_headers(etag: str, surrogate_keys: list[str] | None = None) -> dict[str, str]:
+    if surrogate_keys is None:
+        return {"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL}
+    return {
+        "ETag": etag,
+        "Cache-Control": PUBLIC_CACHE_CONTROL,
+        "Surrogate-Control": f"max-age={CDN_MAX_AGE_SECONDS}",
+        "Surrogate-Key": " ".join(surrogate_keys),
+    }
+
+
+def conditional(request: Request, response: Response, etag: str, surrogate_keys: list[str] | None = None):
+    """
+    Returns a 304 response when the client already has `etag`. Otherwise sets
+    the cache headers on `response` and returns None, and the handler builds
+    the body. Pass `surrogate_keys` only for responses the CDN may share.
+    """
+    headers = cache_headers(etag, surrogate_keys)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def product_key(product_id) -> str:
+    return f"product-{product_id}"
+
+
+def category_key(category_id) -> str:
+    return f"category-{category_id}"
+
+
+def reviews_key(product_id) -> str:
+    return f"reviews-{product_id}"
+
+
+CATEGORIES_KEY = "categories"
+SEARCH_KEY = "search"
+
+
+def row_versions(rows) -> list:
+    return [(row.id, row.updated_at) for row in rows]
+
+
+def product_keys(*products) -> list[str]:
+    """Keys of every cached response that shows these products."""
+    keys = {SEARCH_KEY}
+    for product in products:
+        keys.add(product_key(product.id))
+        if product.category is not None:
+            keys.add(category_key(product.category))
+    return sorted(keys)
+
+
+def purge(*keys: str) -> None:
+    """Asks the CDN to drop responses tagged with any of `keys`, off the request path."""
+    if keys and CDN_PURGE_URL:
+        purge_surrogate_keys.delay(sorted(set(keys)))
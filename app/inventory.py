@@ -0,0 +1,146 @@
+"""
+Atomic stock accounting.
+
+Stock is only ever changed with conditional UPDATE statements, so two requests
+racing for the last unit cannot both succeed, no matter how many workers run.
+Checkout holds stock through time-boxed reservations: stock is taken when the
+Stripe session is created and given back if payment never completes.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, cast, column, func, update, values
+from sqlalchemy.orm import Session
+from app.models import models
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Stripe only accepts checkout session expiries between 30 minutes and 24 hours
+# away; the extra minute covers the time until the request reaches Stripe
+STRIPE_MIN_SESSION_MINUTES = 31
+RESERVATION_TTL_MINUTES = max(STRIPE_MIN_SESSION_MINUTES, int(os.getenv("RESERVATION_TTL_MINUTES", "31")))
+# Extra time before an expired reservation is released, so a payment completed
+# just before expiry can still be confirmed against its reservation
+RESERVATION_RELEASE_GRACE_MINUTES = int(os.getenv("RESERVATION_RELEASE_GRACE_MINUTES", "10"))
+
+
+def decrement_stock(db: Session, product_id: int, quantity: int) -> bool:
+    """
+    Takes `quantity` units of a product in a single
+    ``UPDATE ... WHERE stock >= :quantity`` statement.
+    Returns False, leaving stock untouched, when not enough is available.
+    """
+    if quantity <= 0:
+        return False
+    updated = db.query(models.Product).filter(
+        models.Product.id == product_id, models.Product.stock >= quantity
+    ).update({models.Product.stock: models.Product.stock - quantity}, synchronize_session=False)
+    return updated == 1
+
+
+def increment_stock(db: Session, product_id: int, quantity: int) -> None:
+    db.query(models.Product).filter(models.Product.id == product_id).update(
+        {models.Product.stock: models.Product.stock + quantity}, synchronize_session=False
+    )
+
+
+def apply_stock_price_changes(db: Session, changes: dict[int, tuple[int, int | None]]) -> list:
+    """
+    Applies ``{product_id: (stock_delta, price)}`` and returns the (id,
+    category, stock, price) rows of the products changed, with their new values. Deltas are added to the stock
+    the database holds at that moment, so they compose with checkouts and
+    other syncs instead of overwriting them. A product whose delta would take
+    stock below zero is left untouched, price included. A None price keeps
+    the current one.
+
+    PostgreSQL gets one ``UPDATE ... FROM (VALUES ...)``. Other backends
+    (SQLite in development) cannot alias VALUES columns, so the same
+    conditional UPDATE runs once per product in the caller's transaction.
+    """
+    Product = models.Product
+    if not changes:
+        return []
+    if db.bind.dialect.name != "postgresql":
+        updated = []
+        for product_id, (stock_delta, price) in changes.items():
+            updated += db.execute(
+                update(Product).where(Product.id == product_id, Product.stock + stock_delta >= 0).values(
+                    stock=Product.stock + stock_delta, price=price if price is not None else Product.price
+                ).returning(Product.id, Product.category, Product.stock, Product.price)
+            ).all()
+        return updated
+    rows = values(
+        column("id", Integer), column("stock_delta", Integer), column("price", Integer), name="changes"
+    ).data([(product_id, stock_delta, price) for product_id, (stock_delta, price) in changes.items()])
+    return db.execute(
+        update(Product).where(Product.id == rows.c.id, Product.stock + rows.c.stock_delta >= 0).values(
+            stock=Product.stock + rows.c.stock_delta,
+            # The cast keeps the column an integer when every price in the batch is NULL
+            price=func.coalesce(cast(rows.c.price, Integer), Product.price),
+        ).returning(Product.id, Product.category, Product.stock, Product.price)
+    ).all()
+
+
+def reservation_expiry() -> datetime:
+    """Expiry for a checkout session created now; also used for its reservations."""
+    return datetime.utcnow() + timedelta(minutes=RESERVATION_TTL_MINUTES)
+
+
+def reserve(db: Session, user_id: int, product_id: int, quantity: int, expires_at: datetime):
+    """
+    Takes stock for a pending checkout and records the reservation.
+    Returns the reservation, or None when not enough stock is available.
+    """
+    if not decrement_stock(db, product_id, quantity):
+        return None
+    reservation = models.StockReservation(
+        user_id=user_id, product_id=product_id, quantity=quantity, status="pending", expires_at=expires_at
+    )
+    db.add(reservation)
+    return reservation
+
+
+def commit_reservation(db: Session, reservation) -> bool:
+    """
+    Marks a reservation as fulfilled by a paid order. A reservation that was
+    already released is re-taken from stock if still available.
+    Returns False if the stock is gone.
+    """
+    claimed = db.query(models.StockReservation).filter(
+        models.StockReservation.id == reservation.id, models.StockReservation.status == "pending"
+    ).update({models.StockReservation.status: "committed"}, synchronize_session=False)
+    if claimed:
+        return True
+    if reservation.status != "released" or not decrement_stock(db, reservation.product_id, reservation.quantity):
+        return False
+    db.query(models.StockReservation).filter(models.StockReservation.id == reservation.id).update(
+        {models.StockReservation.status: "committed"}, synchronize_session=False
+    )
+    return True
+
+
+def release_reservation(db: Session, reservation) -> bool:
+    """Returns reserved stock to the product unless the reservation was already settled."""
+    released = db.query(models.StockReservation).filter(
+        models.StockReservation.id == reservation.id, models.StockReservation.status == "pending"
+    ).update({models.StockReservation.status: "released"}, synchronize_session=False)
+    if released:
+        increment_stock(db, reservation.product_id, reservation.quantity)
+    return released == 1
+
+
+def release_expired_reservations(db: Session, batch_size: int = 500) -> int:
+    """Releases pending reservations whose checkout window has passed. Returns the count released."""
+    cutoff = datetime.utcnow() - timedelta(minutes=RESERVATION_RELEASE_GRACE_MINUTES)
+    released = 0
+    while True:
+        expired = db.query(models.StockReservation).filter(
+            models.StockReservation.status == "pending", models.StockReservation.expires_at < cutoff
+        ).order_by(models.StockReservation.id).limit(batch_size).all()
+        if not expired:
+            return released
+        for reservation in expired:
+            released += release_reservation(db, reservation)
+        db.commit()
+        if len(expired) < batch_size:
+            return released
@@ -1,16 +1,35 @@
-from fastapi import FastAPI
-from .models import models
-from .database import engine
-from .routers import users, product, categories, order, comment, ratings, search, addToCart, wishlists, checkout
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from .database import check_connection, dispose_engine
+from .warmup import warm_worker
+from . import health
+from .compression import CompressionMiddleware
+from .rate_limit import RateLimitMiddleware
+from . import query_stats
+from .telemetry import HTTP_IN_PROGRESS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+import time
+from .routers import auth, users, product, categories, order, comment, ratings, search, addToCart, wishlists, checkout, images, metrics, exports, reviews, analytics, health as health_routes
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema is managed by Alembic (`alembic upgrade head`), not created here
+    check_connection()
+    # Before uvicorn accepts connections, so no request meets a cold worker
+    warm_worker()
+    health.mark_warm()
+    yield
+    dispose_engine()
+
 
 app = FastAPI(
     title="E-Commerce API",
     description="Advanced e-commerce platform with Stripe payment integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-models.Base.metadata.create_all(bind=engine)
-
+app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(product.router)
 app.include_router(categories.router)
@@ -21,5 +40,38 @@ app.include_router(search.router)
 app.include_router(addToCart.router)
 app.include_router(wishlists.router)
 app.include_router(checkout.router)
+app.include_router(images.router)
+app.include_router(metrics.router)
+app.include_router(exports.router)
+app.include_router(reviews.router)
+app.include_router(analytics.router)
+app.include_router(health_routes.router)
+
+# Registered before instrument_request so it runs inside it: BaseHTTPMiddleware
+# re-streams every response, which would hide the body size from the threshold
+app.add_middleware(CompressionMiddleware)
+# Outside compression, so refused requests cost as little as possible
+app.add_middleware(RateLimitMiddleware)
+
 
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    started = time.perf_counter()
+    stats, token = query_stats.start_request()
+    HTTP_IN_PROGRESS.inc(request.method)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        query_stats.end_request(token)
+        HTTP_IN_PROGRESS.dec(request.method)
+        route = request.scope.get("route")
+        # The route template, not the raw path, keeps label cardinality bounded
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route_path)
+        HTTP_REQUESTS.inc(request.method, route_path, status_code)
+    query_stats.record(route_path, stats)
+    response.headers.append("Server-Timing", stats.server_timing())
+    return response
 
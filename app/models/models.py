@@ -1,8 +1,7 @@
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-
-Base = declarative_base()
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Float, Index, UniqueConstraint, false, func
+from datetime import datetime
+from app.database import Base
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +11,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     refresh_token = Column(String, nullable=True)
     role = Column(String, default='customer')
+    display_name = Column(String, nullable=True)
 
     orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
     ratings = relationship("Rating", back_populates="user", cascade="all, delete-orphan")
@@ -22,24 +22,38 @@ class User(Base):
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer,primary_key = True,index = True,autoincrement=True)
+    sku = Column(String, nullable=True, unique=True, index=True)
     name = Column(String,nullable=False)
     price = Column(Integer, nullable = False)
     description = Column(String, nullable = True)
     image_url = Column(String, nullable = True)
-    category= Column(Integer,ForeignKey("categories.id",ondelete="SET NULL"), nullable=True)
+    category= Column(Integer,ForeignKey("categories.id",ondelete="SET NULL"), nullable=True, index=True)
     stock = Column(Integer,nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+    # Running totals kept by the rating routes, for rating filters and facets
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_total = Column(Integer, nullable=False, default=0, server_default="0")
+
+    order_items = relationship("OrderItem",back_populates="product", cascade="all, delete-orphan")
+    ratings = relationship("Rating",back_populates="product", cascade="all, delete-orphan")
+    comments = relationship("Comment",back_populates="product", cascade="all, delete-orphan")
+    cart_items = relationship("Cart",back_populates="product", cascade="all, delete-orphan")
+    wishlist = relationship("Wishlist",back_populates="product", cascade="all, delete-orphan")
+
 
-    orders = relationship("Order",lazy="joined", innerjoin=True,back_populates="product", cascade="all, delete-orphan")
-    ratings = relationship("Rating",lazy="joined", innerjoin=True,back_populates="product", cascade="all, delete-orphan")
-    comments = relationship("Comment",lazy="joined", innerjoin=True,back_populates="product", cascade="all, delete-orphan")
-    cart_items = relationship("Cart",lazy="joined", innerjoin=True,back_populates="product", cascade="all, delete-orphan")
-    wishlist = relationship("Wishlist",lazy="joined", innerjoin=True,back_populates="product", cascade="all, delete-orphan")
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+    digest = Column(String(64), primary_key=True)
+    content_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
 
 
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
 
 class Rating(Base):
     __tablename__ = "ratings"
@@ -47,6 +61,13 @@ class Rating(Base):
     product_id = Column(Integer,ForeignKey("products.id",ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
     rating = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+
+    # Keyset pagination per product: newest first, or by score
+    __table_args__ = (
+        Index("ix_ratings_product_id_id", "product_id", "id"),
+        Index("ix_ratings_product_id_rating_id", "product_id", "rating", "id"),
+    )
 
     user = relationship("User",lazy="joined", innerjoin=True,back_populates="ratings")
     product = relationship("Product",lazy="joined", innerjoin=True,back_populates="ratings")
@@ -57,24 +78,96 @@ class Comment(Base):
     product_id = Column(Integer,ForeignKey("products.id",ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"), nullable=False)
     comment = Column(String, nullable=True)
+    helpful_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+
+    # Keyset pagination per product: newest first, or most helpful first
+    __table_args__ = (
+        Index("ix_comments_product_id_id", "product_id", "id"),
+        Index("ix_comments_product_id_helpful_count_id", "product_id", "helpful_count", "id"),
+    )
 
     user = relationship("User",lazy="joined", innerjoin=True,back_populates="comments")
     product = relationship("Product",lazy="joined", innerjoin=True,back_populates="comments")
 
 
+class CommentVote(Base):
+    """One "helpful" vote per user and comment; Comment.helpful_count is the running total."""
+    __tablename__ = "comment_votes"
+    comment_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+
 class Order(Base):
     __tablename__ = "orders"
     order_id = Column(Integer,primary_key = True,index = True,autoincrement=True)
-    product_id = Column(Integer,ForeignKey("products.id",ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"), nullable=False)
-    quantity = Column(Integer, nullable=False)
     address = Column(String, nullable=False)
     stripe_session_id = Column(String, nullable=True, index=True)
     payment_status = Column(String, default="pending")
     total_amount = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    profiled_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_orders_user_id_order_id", "user_id", "order_id"),
+        # Only orders not yet folded into purchase profiles are indexed
+        Index("ix_orders_unprofiled", "order_id", postgresql_where=profiled_at.is_(None), sqlite_where=profiled_at.is_(None)),
+    )
+
+    user = relationship("User", back_populates="orders")
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan", order_by="OrderItem.id")
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_order_items_product_id_order_id", "product_id", "order_id"),
+    )
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product", back_populates="order_items")
+
+
+class UserCategoryAffinity(Base):
+    __tablename__ = "user_category_affinity"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    purchase_count = Column(Integer, nullable=False, default=0)
+    last_purchased_at = Column(DateTime, nullable=False)
+
 
-    user = relationship("User",lazy="joined", innerjoin=True,back_populates="orders")
-    product = relationship("Product",lazy="joined", innerjoin=True,back_populates="orders")
+class ProductPopularity(Base):
+    __tablename__ = "product_popularity"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False, default=0, index=True)
+    units_sold = Column(Integer, nullable=False, default=0)
+    last_ordered_at = Column(DateTime, nullable=False)
+
+
+class ProductNeighbor(Base):
+    __tablename__ = "product_neighbors"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    related_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    co_orders = Column(Integer, nullable=False)
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    stripe_session_id = Column(String, nullable=True, index=True)
+    status = Column(String, nullable=False, default="pending")
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 class Cart(Base):
@@ -84,14 +177,84 @@ class Cart(Base):
     product_id = Column(Integer,ForeignKey("products.id",ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False)
 
-    user = relationship("User",lazy="joined", innerjoin=True, back_populates="cart_items")
-    product = relationship("Product",lazy="joined", innerjoin=True, back_populates="cart_items")
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_cart_user_product"),
+    )
+
+    # Not eager-joined: on a shard (app.sharding) users and products live in another database
+    user = relationship("User", back_populates="cart_items")
+    product = relationship("Product", back_populates="cart_items")
 
 class Wishlist(Base):
      __tablename__ = "wishlist"
-     id = Column(Integer,primary_key=True,nullabale=False,autoincrement = True)
+     id = Column(Integer,primary_key=True,nullable=False,autoincrement = True)
      user_id = Column(Integer,ForeignKey("users.id",ondelete = "CASCADE"),nullable=False)
      product_id = Column(Integer,ForeignKey("products.id",ondelete = "CASCADE"),nullable=False)
 
-     user = relationship("User",lazy="joined", innerjoin=True, back_populates="wishlist")
-     product = relationship("Product",lazy="joined", innerjoin=True,back_populates="wishlist")
\ No newline at end of file
+     __table_args__ = (
+         UniqueConstraint("user_id", "product_id", name="uq_wishlist_user_product"),
+         # Serves the keyset walk over a product's wishlisters (app.wishlist_alerts)
+         Index("ix_wishlist_product_id_id", "product_id", "id"),
+     )
+
+     user = relationship("User", back_populates="wishlist")
+     product = relationship("Product", back_populates="wishlist")
+
+
+class WishlistAlert(Base):
+    """A price drop or restock waiting to go out in a user's digest; kept after sending for the cooldown."""
+    __tablename__ = "wishlist_alerts"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(16), nullable=False)
+    old_price = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # One pending alert per user, product and kind; also walked by user for the digests
+        Index("uq_wishlist_alerts_pending", "user_id", "product_id", "kind", unique=True,
+              postgresql_where=sent_at.is_(None), sqlite_where=sent_at.is_(None)),
+        Index("ix_wishlist_alerts_product_id_user_id", "product_id", "user_id"),
+    )
+
+
+class SalesRollup(Base):
+    """
+    Order totals per hour or day (app.sales_rollups), for all sales, one
+    category or one product. No foreign keys: history outlives deleted products.
+    """
+    __tablename__ = "sales_rollups"
+    period = Column(String(4), primary_key=True)
+    dimension = Column(String(8), primary_key=True)
+    # Product or category id; 0 for the totals and for uncategorised products
+    entity_id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    # On product rows, the product's category when the orders were rolled up
+    category_id = Column(Integer, nullable=True)
+    orders = Column(Integer, nullable=False)
+    units = Column(Integer, nullable=False)
+    revenue = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        # Rankings over a range: every category or product in a span of buckets
+        Index("ix_sales_rollups_period_dimension_bucket_start", "period", "dimension", "bucket_start"),
+    )
+
+
+class JobWatermark(Base):
+    """How far an incremental background job has read, e.g. the last order id rolled up."""
+    __tablename__ = "job_watermarks"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ShardBucket(Base):
+    """The shard holding the carts, wishlists and orders of one bucket of users (app.sharding)."""
+    __tablename__ = "shard_buckets"
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(Integer, nullable=False)
+    # Set while the rebalance tool copies the bucket; writes for its users are refused meanwhile
+    moving = Column(Boolean, nullable=False, default=False, server_default=false())
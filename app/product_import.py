@@ -0,0 +1,203 @@
+"""
+Bulk product import.
+
+Input is CSV with a header row, or NDJSON, read a line at a time. Rows are
+validated in chunks of IMPORT_BATCH_SIZE and each chunk is upserted on sku
+with one ``INSERT ... ON CONFLICT (sku) DO UPDATE`` and committed, so a
+failure part way through keeps the chunks before it. Invalid rows are
+reported by line number and skipped without failing their chunk. When a sku
+appears twice in a chunk, the later row wins.
+
+After each chunk the CDN keys of the touched products and categories are
+purged, cached related-product lists that show an updated product are
+dropped, and price drops and restocks are handed to app.wishlist_alerts.
+The category listings touched are rebuilt once, after the last chunk.
+
+    python -m app.product_import catalog.csv --batch-size 2000
+"""
+from datetime import datetime
+from itertools import islice
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import models
+from app.schemas import schemas
+from app.storage import acquire_image, release_image
+from app.related import stale_related_keys
+from app.http_cache import product_keys, purge
+from app.wishlist_alerts import alert_events, queue_alerts
+from app.category_listings import refresh as refresh_listings
+from app import cache
+import argparse
+import csv
+import orjson
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Every failed row is counted, but only this many are described in the result
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+FORMATS = ("csv", "ndjson")
+FIELDS = list(schemas.ProductImportRow.model_fields)
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def format_for(filename: str | None) -> str:
+    return "csv" if filename and filename.lower().endswith(".csv") else "ndjson"
+
+
+def read_csv(stream):
+    """Yields (line, record); empty cells count as missing."""
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, {key: value for key, value in record.items() if key and value not in ("", None)}
+
+
+def read_ndjson(stream):
+    """Yields (line, record), or (line, ValueError) for a line that is not JSON."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_number, ValueError(f"invalid JSON: {e}")
+
+
+def read_records(stream, format: str):
+    return read_csv(stream) if format == "csv" else read_ndjson(stream)
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors())
+
+
+class ProductImporter:
+    def __init__(self, db: Session, batch_size: int = IMPORT_BATCH_SIZE, max_errors: int = IMPORT_MAX_ERRORS):
+        dialect = db.bind.dialect.name
+        if dialect not in _UPSERTS:
+            raise ValueError(f"Bulk import needs PostgreSQL or SQLite, not {dialect}")
+        self.db = db
+        self.upsert = _UPSERTS[dialect]
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.category_ids = {category_id for (category_id,) in db.query(models.Category.id).all()}
+        self.touched_categories: set[int | None] = set()
+        self.inserted = self.updated = self.failed = 0
+        self.errors: list[dict] = []
+
+    def fail(self, line: int, sku, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line, "sku": sku, "error": message})
+
+    def validate(self, chunk) -> dict[str, tuple[int, schemas.ProductImportRow]]:
+        rows = {}
+        for line, record in chunk:
+            if isinstance(record, Exception):
+                self.fail(line, None, str(record))
+                continue
+            try:
+                row = schemas.ProductImportRow.model_validate(record)
+            except ValidationError as e:
+                self.fail(line, record.get("sku") if isinstance(record, dict) else None, _describe(e))
+                continue
+            if row.category is not None and row.category not in self.category_ids:
+                self.fail(line, row.sku, f"category: unknown category {row.category}")
+                continue
+            rows[row.sku] = (line, row)
+        return rows
+
+    def write(self, rows: dict[str, tuple[int, schemas.ProductImportRow]]) -> None:
+        db = self.db
+        existing = {
+            row.sku: row for row in db.query(
+                models.Product.sku, models.Product.id, models.Product.category, models.Product.image_url,
+                models.Product.price, models.Product.stock,
+            ).filter(models.Product.sku.in_(list(rows))).all()
+        }
+        now = datetime.utcnow()
+        statement = self.upsert(models.Product)
+        statement = statement.on_conflict_do_update(
+            index_elements=[models.Product.sku],
+            set_={name: statement.excluded[name] for name in FIELDS + ["updated_at"] if name != "sku"},
+        ).returning(models.Product.id, models.Product.category)
+        try:
+            written = db.execute(statement, [{**row.model_dump(), "updated_at": now} for _, row in rows.values()]).all()
+            for sku, (_, row) in rows.items():
+                previous = existing.get(sku)
+                if previous is None:
+                    acquire_image(db, row.image_url)
+                elif previous.image_url != row.image_url:
+                    release_image(db, previous.image_url)
+                    acquire_image(db, row.image_url)
+            stale_related = stale_related_keys(db, [row.id for row in existing.values()])
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            for sku, (line, _) in rows.items():
+                self.fail(line, sku, f"rejected by the database: {e.orig}")
+            return
+        self.updated += len(existing)
+        self.inserted += len(rows) - len(existing)
+        cache.delete(*stale_related)
+        purge(*product_keys(*written, *existing.values()))
+        self.touched_categories.update(row.category for row in (*written, *existing.values()))
+        queue_alerts([event for sku, previous in existing.items() for event in alert_events(
+            previous.id, previous.price, rows[sku][1].price, previous.stock, rows[sku][1].stock
+        )])
+
+    def run(self, records) -> dict:
+        started = time.perf_counter()
+        records = iter(records)
+        while chunk := list(islice(records, self.batch_size)):
+            rows = self.validate(chunk)
+            if rows:
+                self.write(rows)
+        refresh_listings(*self.touched_categories)
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+def import_products(db: Session, records, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Upserts `records` ((line, dict) pairs, see read_records) and returns the counts and row errors."""
+    return ProductImporter(db, batch_size=batch_size).run(records)
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Import products from CSV or NDJSON, upserting on sku")
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Defaults to csv for *.csv files, ndjson otherwise")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+    db = SessionLocal()
+    try:
+        result = import_products(db, read_records(stream, args.format or format_for(args.path)), args.batch_size)
+    finally:
+        db.close()
+        stream.close()
+    for error in result["errors"]:
+        print(f"line {error['row']} ({error['sku']}): {error['error']}", file=sys.stderr)
+    print(f"inserted {result['inserted']}, updated {result['updated']}, failed {result['failed']} "
+          f"in {result['seconds']}s")
+    if result["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
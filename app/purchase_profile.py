@@ -0,0 +1,262 @@
+"""
+Materialized purchase profiles used by checkout suggestions.
+
+Two tables are kept up to date incrementally as orders are created:
+
+* ``user_category_affinity``: units a user bought per category
+* ``product_popularity``: a time-decayed count of units ordered per product
+
+Popularity uses forward decay: an order placed at time ``t`` adds
+``quantity * 2 ** ((t - epoch) / half_life)``. Newer orders weigh more, and
+scores stay comparable without rewriting old rows, so ordering by score
+ranks products by recent order volume. Weights double every half-life and
+would overflow a float after about 1024 of them, so ``apply_pending`` moves
+the epoch forward once it is POPULARITY_REBASE_HALF_LIVES old and scales
+every score down by the same factor. The epoch is kept in ``job_watermarks``
+as days past POPULARITY_EPOCH. Folds hold a shared lock on that row and the
+rebase an exclusive one, so no weight is added against a stale epoch.
+
+``suggestion_candidates`` ranks products for checkout suggestions from these
+tables and the precomputed popular category listings (app.category_listings).
+
+Orders are folded in once, tracked by ``orders.profiled_at`` on the shard
+holding the order (app.sharding). To rebuild from scratch::
+
+    python -m app.purchase_profile rebuild
+"""
+from datetime import datetime, timedelta
+from typing import Iterator
+from sqlalchemy import exists, or_, select, true
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from app.category_listings import ListingSort, page_ids
+from app.models import models
+from app.sharding import BucketMoving, commit_pair, session_on, shard_count, shard_for
+import argparse
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "7"))
+POPULARITY_EPOCH = datetime(2025, 1, 1)
+# A weight of 2 ** 64 leaves plenty of headroom below the float limit
+POPULARITY_REBASE_HALF_LIVES = float(os.getenv("POPULARITY_REBASE_HALF_LIVES", "64"))
+EPOCH_WATERMARK = "popularity_epoch"
+# Candidate ids read per round trip when ranking suggestions
+SUGGESTION_CHUNK = 50
+# Candidates a suggestion request reads at most; a customer who bought all of
+# them gets fewer suggestions rather than a walk through the whole catalog
+SUGGESTION_MAX_CANDIDATES = int(os.getenv("SUGGESTION_MAX_CANDIDATES", "200"))
+
+
+def popularity_weight(at: datetime, epoch: datetime = POPULARITY_EPOCH) -> float:
+    half_lives = (at - epoch).total_seconds() / (POPULARITY_HALF_LIFE_DAYS * 86400)
+    return 2.0 ** half_lives
+
+
+def popularity_epoch(db: Session, lock: bool = False) -> datetime:
+    """The epoch current scores are weighted from. With `lock`, a rebase waits for this transaction."""
+    query = db.query(models.JobWatermark.value).filter(models.JobWatermark.name == EPOCH_WATERMARK)
+    if lock:
+        query = query.with_for_update(read=True)
+    return POPULARITY_EPOCH + timedelta(days=query.scalar() or 0)
+
+
+def rebase(db: Session, now: datetime | None = None) -> bool:
+    """Moves the epoch to today once it is POPULARITY_REBASE_HALF_LIVES old, scaling scores to match."""
+    query = db.query(models.JobWatermark).filter(models.JobWatermark.name == EPOCH_WATERMARK).with_for_update()
+    watermark = query.first()
+    if watermark is None:
+        try:
+            with db.begin_nested():
+                db.add(models.JobWatermark(name=EPOCH_WATERMARK, value=0))
+        except IntegrityError:
+            pass
+        watermark = query.one()
+    epoch = POPULARITY_EPOCH + timedelta(days=watermark.value)
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    if (today - epoch).total_seconds() < POPULARITY_REBASE_HALF_LIVES * POPULARITY_HALF_LIFE_DAYS * 86400:
+        db.rollback()
+        return False
+    factor = 1 / popularity_weight(today, epoch)
+    db.query(models.ProductPopularity).update(
+        {models.ProductPopularity.score: models.ProductPopularity.score * factor}, synchronize_session=False
+    )
+    watermark.value = (today - POPULARITY_EPOCH).days
+    db.commit()
+    return True
+
+
+def _add_affinity(db: Session, user_id: int, category_id: int, quantity: int, at: datetime) -> None:
+    query = db.query(models.UserCategoryAffinity).filter(
+        models.UserCategoryAffinity.user_id == user_id, models.UserCategoryAffinity.category_id == category_id
+    )
+    values = {
+        models.UserCategoryAffinity.purchase_count: models.UserCategoryAffinity.purchase_count + quantity,
+        models.UserCategoryAffinity.last_purchased_at: at,
+    }
+    if query.update(values, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.UserCategoryAffinity(
+                user_id=user_id, category_id=category_id, purchase_count=quantity, last_purchased_at=at
+            ))
+    except IntegrityError:
+        query.update(values, synchronize_session=False)
+
+
+def _add_popularity(db: Session, product_id: int, quantity: int, at: datetime, epoch: datetime) -> None:
+    query = db.query(models.ProductPopularity).filter(models.ProductPopularity.product_id == product_id)
+    score = quantity * popularity_weight(at, epoch)
+    values = {
+        models.ProductPopularity.score: models.ProductPopularity.score + score,
+        models.ProductPopularity.units_sold: models.ProductPopularity.units_sold + quantity,
+        models.ProductPopularity.last_ordered_at: at,
+    }
+    if query.update(values, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.ProductPopularity(product_id=product_id, score=score, units_sold=quantity, last_ordered_at=at))
+    except IntegrityError:
+        query.update(values, synchronize_session=False)
+
+
+def apply_order(db: Session, order_id: int, user_id: int | None = None) -> bool:
+    """
+    Folds one order into the profiles. Safe to call more than once per order:
+    only the call that claims ``profiled_at`` applies it. The order is read
+    from `user_id`'s shard, or from the primary without one.
+    """
+    with session_on(db, 0 if user_id is None else shard_for(user_id)) as order_db:
+        claimed = order_db.query(models.Order).filter(
+            models.Order.order_id == order_id, models.Order.profiled_at.is_(None)
+        ).update({models.Order.profiled_at: datetime.utcnow()}, synchronize_session=False)
+        if not claimed:
+            order_db.rollback()
+            return False
+        user_id, ordered_at = order_db.query(models.Order.user_id, models.Order.created_at).filter(
+            models.Order.order_id == order_id
+        ).one()
+        lines = order_db.query(models.OrderItem.product_id, models.OrderItem.quantity).filter(
+            models.OrderItem.order_id == order_id
+        ).all()
+        categories = dict(db.query(models.Product.id, models.Product.category).filter(
+            models.Product.id.in_({product_id for product_id, _ in lines})
+        ).all())
+
+        epoch = popularity_epoch(db, lock=True)
+        per_category: dict[int, int] = {}
+        for product_id, quantity in lines:
+            # Lines of deleted products are skipped
+            if product_id not in categories:
+                continue
+            _add_popularity(db, product_id, quantity, ordered_at, epoch)
+            category_id = categories[product_id]
+            if category_id is not None:
+                per_category[category_id] = per_category.get(category_id, 0) + quantity
+        for category_id, quantity in per_category.items():
+            _add_affinity(db, user_id, category_id, quantity, ordered_at)
+
+        def unclaim():
+            order_db.query(models.Order).filter(models.Order.order_id == order_id).update(
+                {models.Order.profiled_at: None}, synchronize_session=False
+            )
+
+        # On a shard the claim commits first and is undone if the profiles fail
+        commit_pair(order_db, db, undo=unclaim)
+    return True
+
+
+def apply_pending(db: Session, batch_size: int = 500) -> int:
+    """Folds in orders whose profile update never ran, e.g. a lost task or a backfill. Rebases first if due."""
+    rebase(db)
+    applied = 0
+    for shard in range(shard_count()):
+        with session_on(db, shard) as order_db:
+            after = 0
+            while True:
+                pending = order_db.query(models.Order.order_id, models.Order.user_id).filter(
+                    models.Order.profiled_at.is_(None), models.Order.order_id > after
+                ).order_by(models.Order.order_id).limit(batch_size).all()
+                for order_id, user_id in pending:
+                    try:
+                        applied += apply_order(db, order_id, user_id)
+                    except BucketMoving:
+                        # Picked up on its new shard by a later run
+                        continue
+                if len(pending) < batch_size:
+                    break
+                after = pending[-1].order_id
+    return applied
+
+
+def rebuild(db: Session) -> int:
+    """Recomputes both tables from the full order history."""
+    db.query(models.UserCategoryAffinity).delete(synchronize_session=False)
+    db.query(models.ProductPopularity).delete(synchronize_session=False)
+    for shard in range(shard_count()):
+        with session_on(db, shard) as order_db:
+            order_db.query(models.Order).update({models.Order.profiled_at: None}, synchronize_session=False)
+            order_db.commit()
+    db.commit()
+    return apply_pending(db)
+
+
+def suggestion_candidates(db: Session, user_id: int) -> Iterator[int]:
+    """
+    Product ids in suggestion order, read SUGGESTION_CHUNK at a time: the
+    popular listing of each category the user bought from, most bought
+    first, then other products by popularity, then the never ordered ones.
+    Nothing is filtered for purchases; the caller reads at most
+    SUGGESTION_MAX_CANDIDATES of them.
+    """
+    category_ids = list(db.execute(select(models.UserCategoryAffinity.category_id).where(
+        models.UserCategoryAffinity.user_id == user_id
+    ).order_by(models.UserCategoryAffinity.purchase_count.desc(), models.UserCategoryAffinity.category_id)).scalars())
+    for category_id in category_ids:
+        offset, total = 0, 1
+        while offset < total:
+            ids, total = page_ids(db, category_id, ListingSort.popular, offset, SUGGESTION_CHUNK)
+            yield from ids
+            offset += SUGGESTION_CHUNK
+
+    Product, ProductPopularity = models.Product, models.ProductPopularity
+    elsewhere = or_(Product.category.is_(None), Product.category.notin_(category_ids)) if category_ids else true()
+    ranked = select(Product.id).join(ProductPopularity, ProductPopularity.product_id == Product.id).where(
+        elsewhere
+    ).order_by(ProductPopularity.score.desc(), Product.id)
+    unranked = select(Product.id).where(
+        elsewhere, ~exists().where(ProductPopularity.product_id == Product.id)
+    ).order_by(Product.id)
+    for query in (ranked, unranked):
+        offset = 0
+        while True:
+            ids = list(db.execute(query.offset(offset).limit(SUGGESTION_CHUNK)).scalars())
+            yield from ids
+            if len(ids) < SUGGESTION_CHUNK:
+                break
+            offset += SUGGESTION_CHUNK
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Purchase profile maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("rebuild", help="Recompute affinity and popularity from all orders")
+    subcommands.add_parser("catch-up", help="Apply orders that were not profiled yet")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        applied = rebuild(db) if args.command == "rebuild" else apply_pending(db)
+    finally:
+        db.close()
+    print(f"Applied {applied} order(s)")
+
+
+if __name__ == "__main__":
+    main()
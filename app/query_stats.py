@@ -0,0 +1,151 @@
+"""
+Per-request SQL statistics.
+
+SQLAlchemy engine events count the statements each request runs, the time
+spent in the database and the rows affected or returned. The middleware in
+app.main starts a ``RequestQueryStats`` for every request, reports it in a
+``Server-Timing`` header and folds it into per-route totals served at
+``/metrics/queries``.
+
+The N+1 detector groups statements by shape: the SQL text with placeholder
+lists collapsed, so ``IN (?, ?)`` and ``IN (?, ?, ?)`` count as one shape.
+When a shape runs more than ``QUERY_REPEAT_LIMIT`` times in one request,
+``QUERY_REPEAT_MODE=warn`` logs it and ``QUERY_REPEAT_MODE=raise`` fails the
+statement with ``RepeatedQueryError``, so the traceback points at the loop.
+"""
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# off, warn or raise; raise is meant for development and test runs
+QUERY_REPEAT_MODE = os.getenv("QUERY_REPEAT_MODE", "off").lower()
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "10"))
+
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RepeatedQueryError(RuntimeError):
+    pass
+
+
+class RequestQueryStats:
+    __slots__ = ("queries", "db_seconds", "rows", "shapes", "reported")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.shapes: dict[str, int] = {}
+        self.reported: set[str] = set()
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries, {self.rows} rows"'
+
+
+_current: ContextVar[RequestQueryStats | None] = ContextVar("request_query_stats", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def start_request() -> tuple[RequestQueryStats, object]:
+    stats = RequestQueryStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    shape = statement_shape(statement)
+    count = stats.shapes.get(shape, 0) + 1
+    stats.shapes[shape] = count
+    if count > QUERY_REPEAT_LIMIT and QUERY_REPEAT_MODE != "off" and shape not in stats.reported:
+        stats.reported.add(shape)
+        message = f"Statement ran more than {QUERY_REPEAT_LIMIT} times in one request: {shape[:300]}"
+        if QUERY_REPEAT_MODE == "raise":
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += time.perf_counter() - started
+    # DB-API drivers report -1 when the count is unknown, e.g. SQLite SELECTs
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+class RouteQueryTotals:
+    __slots__ = ("requests", "queries", "db_seconds", "rows", "max_queries")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.max_queries = 0
+
+
+_totals: dict[str, RouteQueryTotals] = {}
+_totals_lock = threading.Lock()
+
+
+def record(route: str, stats: RequestQueryStats) -> None:
+    with _totals_lock:
+        totals = _totals.get(route)
+        if totals is None:
+            totals = _totals[route] = RouteQueryTotals()
+        totals.requests += 1
+        totals.queries += stats.queries
+        totals.db_seconds += stats.db_seconds
+        totals.rows += stats.rows
+        totals.max_queries = max(totals.max_queries, stats.queries)
+
+
+def snapshot() -> dict[str, dict]:
+    """Per-route totals for this worker process, busiest routes first."""
+    with _totals_lock:
+        result = {
+            route: {
+                "requests": totals.requests,
+                "queries": totals.queries,
+                "queries_per_request": totals.queries / totals.requests,
+                "max_queries": totals.max_queries,
+                "db_ms": round(totals.db_seconds * 1000, 3),
+                "db_ms_per_request": round(totals.db_seconds * 1000 / totals.requests, 3),
+                "rows": totals.rows,
+            }
+            for route, totals in _totals.items()
+        }
+    return dict(sorted(result.items(), key=lambda item: -item[1]["db_ms"]))
+
+
+def reset() -> None:
+    with _totals_lock:
+        _totals.clear()
@@ -0,0 +1,226 @@
+"""
+Per-client rate limiting and load shedding.
+
+Every request takes a token from a bucket keyed by route and client: the
+user id from a valid bearer token, otherwise the client IP (run uvicorn with
+``--proxy-headers`` behind a load balancer so that is the real client).
+Buckets live in Redis and are updated by one Lua script, so all workers share
+them. While Redis is unreachable each process keeps its own buckets, which
+makes the limit per worker for the duration of the outage.
+
+Limits are ``capacity/seconds``: a client may burst `capacity` requests and
+then gets `capacity` per `seconds`. Routes without their own limit get
+RATE_LIMIT_DEFAULT, in a bucket per route template, so heavy use of one
+endpoint leaves the others alone. Override or add limits with, e.g.::
+
+    RATE_LIMITS="POST /login=5/60,GET /getProduct/{product_id}=60/10"
+
+When checkouts have waited more than LOAD_SHED_POOL_WAIT_MS on average for a
+database connection, a growing share of requests is refused with 503 before
+it queues for the pool. Checkout, order, metrics and health routes are never
+shed.
+"""
+from redis.exceptions import RedisError
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from app.database import recent_pool_wait
+from app.routers.Oauth2 import ALGORITHM, SECRET_KEY
+from app.telemetry import RATE_LIMITED_REQUESTS, SHED_REQUESTS
+import logging
+import math
+import os
+import random
+import time
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+RATE_LIMIT_PREFIX = os.getenv("RATE_LIMIT_PREFIX", "ecomm:rl:")
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "200/10")
+DEFAULT_RATE_LIMITS = {
+    # bcrypt on every attempt, and the obvious credential-stuffing target
+    "POST /login": "10/60",
+    "POST /refresh": "30/60",
+    "POST /createUser": "5/60",
+    # LIKE scans over the catalog
+    "GET /searchProducts": "30/10",
+    "POST /createRating": "10/60",
+    "POST /createComment": "10/60",
+}
+LOAD_SHED_POOL_WAIT_MS = float(os.getenv("LOAD_SHED_POOL_WAIT_MS", "200"))
+LOAD_SHED_EXEMPT_PREFIXES = tuple(
+    prefix.strip() for prefix in os.getenv("LOAD_SHED_EXEMPT_PREFIXES", "/api/checkout,/createOrder,/metrics,/health").split(",")
+    if prefix.strip()
+)
+# Always let some requests through, so the pool wait keeps being measured
+LOAD_SHED_MAX_FRACTION = 0.9
+LOCAL_MAX_BUCKETS = 100_000
+RETRY_AFTER_SECONDS = 30
+
+# Returns {allowed, retry_after}. Time comes from Redis so workers agree on it.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class Limit:
+    def __init__(self, name: str, spec: str):
+        capacity, _, seconds = spec.partition("/")
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(seconds)
+
+    def __repr__(self):
+        return f"Limit({self.name!r}, {self.capacity:g}/{self.capacity / self.rate:g}s)"
+
+
+def parse_limits(spec: str) -> dict[str, str]:
+    """Parses ``"METHOD /path=capacity/seconds,..."``."""
+    limits = {}
+    for item in spec.split(","):
+        route, _, limit = item.strip().rpartition("=")
+        if route:
+            limits[" ".join(route.split())] = limit.strip()
+    return limits
+
+
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **parse_limits(os.getenv("RATE_LIMITS", ""))}
+
+
+class TokenBuckets:
+    """Redis-backed token buckets, with in-process buckets while Redis is down."""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = RATE_LIMIT_PREFIX):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+        self.down_until = 0.0
+        self.local: dict[str, tuple[float, float]] = {}
+
+    async def take(self, key: str, limit: Limit) -> tuple[bool, float]:
+        """Takes one token. Returns (allowed, seconds until a token is available)."""
+        if time.monotonic() >= self.down_until:
+            try:
+                allowed, retry_after = await self.script(keys=[self.prefix + key], args=[limit.capacity, limit.rate])
+                return bool(allowed), float(retry_after)
+            # RuntimeError: the client is bound to another event loop (tests, reloads)
+            except (RedisError, OSError, RuntimeError):
+                self.down_until = time.monotonic() + RETRY_AFTER_SECONDS
+                logger.warning("Rate limit store unreachable; using per-process buckets for %ss", RETRY_AFTER_SECONDS)
+        return self.take_local(key, limit)
+
+    def take_local(self, key: str, limit: Limit) -> tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated_at = self.local.pop(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        if len(self.local) >= LOCAL_MAX_BUCKETS:
+            # Re-inserting on every take keeps the dict in last-used order
+            for stale in list(self.local)[: LOCAL_MAX_BUCKETS // 10]:
+                del self.local[stale]
+        self.local[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+def client_identity(scope) -> str:
+    """``user:<id>`` for a valid bearer token, else ``ip:<address>``."""
+    authorization = Headers(scope=scope).get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("id")
+            if user_id is not None:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def shed_fraction(pool_wait: float, threshold: float) -> float:
+    """Share of requests to refuse: none at the threshold, rising to the maximum at twice it."""
+    if threshold <= 0 or pool_wait <= threshold:
+        return 0.0
+    return min(LOAD_SHED_MAX_FRACTION, pool_wait / threshold - 1)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limits: dict[str, str] | None = None, default: str = RATE_LIMIT_DEFAULT,
+                 buckets: TokenBuckets | None = None, shed_pool_wait_ms: float = LOAD_SHED_POOL_WAIT_MS):
+        self.app = app
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.default = Limit("default", default) if default else None
+        self.buckets = buckets or TokenBuckets()
+        self.shed_threshold = shed_pool_wait_ms / 1000
+        self.routes = []
+        for name, spec in self.limits.items():
+            method, _, path = name.partition(" ")
+            self.routes.append((method, compile_path(path)[0], Limit(name, spec)))
+        # Path templates of the app, read from its OpenAPI schema on the first request
+        self.templates = None
+
+    def route_template(self, scope) -> str:
+        """``METHOD /path/{param}`` for the request; routing only runs after this middleware."""
+        if self.templates is None:
+            app = scope.get("app")
+            paths = app.openapi()["paths"] if hasattr(app, "openapi") else {}
+            self.templates = [(compile_path(path)[0], path) for path in paths]
+        for path_regex, path in self.templates:
+            if path_regex.match(scope["path"]):
+                return f"{scope['method']} {path}"
+        return f"{scope['method']} unmatched"
+
+    def limit_for(self, scope) -> tuple[Limit | None, str]:
+        """The limit for the request and the name of its bucket."""
+        for method, path_regex, limit in self.routes:
+            if scope["method"] == method and path_regex.match(scope["path"]):
+                return limit, limit.name
+        return self.default, self.route_template(scope) if self.default else ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        if not scope["path"].startswith(LOAD_SHED_EXEMPT_PREFIXES) and random.random() < shed_fraction(
+            recent_pool_wait(), self.shed_threshold
+        ):
+            SHED_REQUESTS.inc()
+            response = JSONResponse({"detail": "Server busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        limit, bucket = self.limit_for(scope)
+        if limit is not None:
+            allowed, retry_after = await self.buckets.take(f"{bucket}:{client_identity(scope)}", limit)
+            if not allowed:
+                RATE_LIMITED_REQUESTS.inc(limit.name)
+                response = JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
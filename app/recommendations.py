@@ -0,0 +1,215 @@
+"""
+"Frequently bought together" recommendations.
+
+An offline job counts, for every pair of products, how many orders contain
+both. Counting is vectorized: order lines become a sparse orders x products
+incidence matrix ``B`` and ``B.T @ B`` is the co-occurrence matrix, whose
+diagonal holds the number of orders per product. The top-k neighbours of each
+product, ranked by cosine similarity, are stored in ``product_neighbors`` and
+served through the cache by app.related.
+
+The matrix and the last processed order id of each shard (app.sharding) are
+kept in ``RECOMMENDER_MATRIX_PATH``, so each run only counts orders placed
+since the previous one and only re-ranks the products those orders touched::
+
+    python -m app.recommendations build          # incremental
+    python -m app.recommendations build --full   # recount all orders
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from scipy import sparse
+from app.models import models
+from app.sharding import session_on, shard_count
+from app import cache
+from app.related import related_cache_key
+import numpy as np
+import argparse
+import os
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RECOMMENDER_MATRIX_PATH = os.getenv("RECOMMENDER_MATRIX_PATH", "data/cooccurrence.npz")
+RECOMMENDER_TOP_K = int(os.getenv("RECOMMENDER_TOP_K", "20"))
+# Orders younger than this may still have uncommitted neighbours with lower ids
+ORDER_SETTLE_SECONDS = 60
+READ_CHUNK_SIZE = 50_000
+WRITE_CHUNK_SIZE = 1_000
+
+
+def count_cooccurrences(order_ids: np.ndarray, product_ids: np.ndarray, n_products: int) -> sparse.csr_matrix:
+    """
+    Returns the products x products matrix of how many orders contain both
+    products. The diagonal is the number of orders containing each product.
+    """
+    if len(order_ids) == 0:
+        return sparse.csr_matrix((n_products, n_products), dtype=np.int32)
+    _, rows = np.unique(order_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, product_ids)), shape=(int(rows.max()) + 1, n_products)
+    )
+    # An order listing the same product on two lines still counts once
+    baskets.data[:] = 1
+    return (baskets.T @ baskets).tocsr()
+
+
+def top_neighbors(matrix: sparse.csr_matrix, rows, k: int, allowed: np.ndarray | None = None):
+    """
+    Yields ``(product_id, related_ids, scores, co_orders)`` for each row, keeping
+    the k neighbours with the highest cosine similarity
+    ``co_orders / sqrt(orders(a) * orders(b))``. `allowed` is a boolean mask
+    over the matrix columns; neighbours outside it are dropped.
+    """
+    diagonal = matrix.diagonal().astype(np.float64)
+    for row in rows:
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols = matrix.indices[start:end]
+        counts = matrix.data[start:end]
+        keep = cols != row
+        if allowed is not None:
+            keep &= allowed[cols]
+        cols, counts = cols[keep], counts[keep]
+        if len(cols) == 0 or diagonal[row] == 0:
+            yield int(row), cols, np.empty(0), counts
+            continue
+        scores = counts / np.sqrt(diagonal[row] * diagonal[cols])
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        yield int(row), cols[top], scores[top], counts[top]
+
+
+def load_state(path: str = RECOMMENDER_MATRIX_PATH) -> tuple[sparse.csr_matrix | None, list[int]]:
+    """The matrix and the last order id counted on each shard."""
+    if not os.path.exists(path):
+        return None, []
+    with np.load(path) as state:
+        matrix = sparse.csr_matrix(
+            (state["data"], state["indices"], state["indptr"]), shape=tuple(state["shape"])
+        )
+        # Files from before sharding hold a single watermark
+        return matrix, [int(value) for value in np.atleast_1d(state["watermark"])]
+
+
+def save_state(matrix: sparse.csr_matrix, watermarks: list[int], path: str = RECOMMENDER_MATRIX_PATH) -> None:
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            np.savez(handle, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                     shape=np.array(matrix.shape), watermark=np.array(watermarks))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_order_lines(db: Session, after: int, upto: int) -> tuple[np.ndarray, np.ndarray]:
+    stmt = select(models.OrderItem.order_id, models.OrderItem.product_id).where(
+        models.OrderItem.order_id > after, models.OrderItem.order_id <= upto
+    ).execution_options(yield_per=READ_CHUNK_SIZE)
+    order_chunks, product_chunks = [], []
+    for partition in db.execute(stmt).partitions():
+        lines = np.array(partition, dtype=np.int64)
+        order_chunks.append(lines[:, 0])
+        product_chunks.append(lines[:, 1])
+    if not order_chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(order_chunks), np.concatenate(product_chunks)
+
+
+def _write_neighbors(db: Session, matrix: sparse.csr_matrix, rows: np.ndarray, k: int) -> None:
+    existing = np.array([row[0] for row in db.query(models.Product.id).all()], dtype=np.int64)
+    # One lookup per neighbour instead of a search through the product ids
+    allowed = np.zeros(matrix.shape[1], dtype=bool)
+    allowed[existing[existing < matrix.shape[1]]] = True
+    rows = rows[allowed[rows]]
+    for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+        chunk = rows[start:start + WRITE_CHUNK_SIZE]
+        db.query(models.ProductNeighbor).filter(
+            models.ProductNeighbor.product_id.in_(chunk.tolist())
+        ).delete(synchronize_session=False)
+        values = [
+            {"product_id": product_id, "related_id": int(related), "score": float(score), "co_orders": int(count)}
+            for product_id, related_ids, scores, counts in top_neighbors(matrix, chunk, k, allowed=allowed)
+            for related, score, count in zip(related_ids, scores, counts)
+        ]
+        if values:
+            db.execute(insert(models.ProductNeighbor), values)
+        cache.delete(*(related_cache_key(int(product_id)) for product_id in chunk))
+
+
+def build(db: Session, full: bool = False, k: int = RECOMMENDER_TOP_K, path: str = RECOMMENDER_MATRIX_PATH) -> dict:
+    """
+    Folds orders placed since the last run into the co-occurrence matrix and
+    refreshes the neighbours of every product they contain.
+    """
+    started = time.perf_counter()
+    matrix, watermarks = (None, []) if full else load_state(path)
+    watermarks += [0] * (shard_count() - len(watermarks))
+    settled = datetime.utcnow() - timedelta(seconds=ORDER_SETTLE_SECONDS)
+    uptos = list(watermarks)
+    # Order ids are only unique within a shard, so each shard is counted on its own
+    shard_lines = []
+    for shard in range(shard_count()):
+        with session_on(db, shard) as order_db:
+            upto = order_db.query(func.max(models.Order.order_id)).filter(
+                models.Order.order_id > watermarks[shard], models.Order.created_at < settled
+            ).scalar()
+            if upto is not None:
+                shard_lines.append(_read_order_lines(order_db, watermarks[shard], upto))
+                uptos[shard] = upto
+    if not shard_lines:
+        return {"orders_after": watermarks, "lines": 0, "products": 0, "seconds": time.perf_counter() - started}
+
+    product_ids = np.concatenate([products for _, products in shard_lines])
+    n_products = int(product_ids.max()) + 1 if len(product_ids) else 0
+    if matrix is not None:
+        n_products = max(n_products, matrix.shape[0])
+        matrix.resize((n_products, n_products))
+    delta = sum(count_cooccurrences(orders, products, n_products) for orders, products in shard_lines)
+    matrix = delta if matrix is None else (matrix + delta).tocsr()
+
+    if full:
+        db.query(models.ProductNeighbor).delete(synchronize_session=False)
+        touched = np.flatnonzero(matrix.diagonal())
+    else:
+        touched = np.unique(product_ids)
+    _write_neighbors(db, matrix, touched.astype(matrix.indices.dtype), k)
+    db.commit()
+    # Saved after the commit: if this fails the next run recounts the same
+    # orders against the previous matrix, which yields the same result
+    save_state(matrix, uptos, path)
+    return {
+        "orders_after": watermarks,
+        "orders_upto": uptos,
+        "lines": int(len(product_ids)),
+        "products": int(len(touched)),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Frequently-bought-together recommendations")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Count new orders and refresh neighbours")
+    build_parser.add_argument("--full", action="store_true", help="Recount the whole order history")
+    build_parser.add_argument("--top-k", type=int, default=RECOMMENDER_TOP_K)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        stats = build(db, full=args.full, k=args.top_k)
+    finally:
+        db.close()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Serving side of the "frequently bought together" recommendations.
+
+Kept apart from app.recommendations so the API does not import numpy and
+scipy, which only the offline build needs.
+"""
+from sqlalchemy import Connection, select
+from sqlalchemy.orm import Session
+from app.models import models
+from app import cache
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RELATED_LIMIT = int(os.getenv("RECOMMENDER_TOP_K", "20"))
+RELATED_CACHE_TTL = 3600
+
+
+def related_cache_key(product_id: int) -> str:
+    return f"related:{product_id}"
+
+
+def stale_related_keys(db: Session, product_ids) -> list[str]:
+    """Cache keys of the related lists that show any of `product_ids`, which repeat their name and price."""
+    if not product_ids:
+        return []
+    rows = db.query(models.ProductNeighbor.product_id).filter(
+        models.ProductNeighbor.related_id.in_(list(product_ids))
+    ).distinct().all()
+    return [related_cache_key(product_id) for (product_id,) in rows]
+
+
+def related_products(db: Session | Connection, product_id: int) -> list[dict]:
+    """Returns the stored neighbours of a product, best first, through the cache."""
+    key = related_cache_key(product_id)
+    cached = cache.get_json(key)
+    if cached is not None:
+        return cached
+    rows = db.execute(select(
+        models.Product.id, models.Product.name, models.Product.price, models.Product.image_url,
+        models.ProductNeighbor.score
+    ).join(
+        models.ProductNeighbor, models.ProductNeighbor.related_id == models.Product.id
+    ).where(
+        models.ProductNeighbor.product_id == product_id
+    ).order_by(models.ProductNeighbor.score.desc()).limit(RELATED_LIMIT)).all()
+    related = [dict(row._mapping) for row in rows]
+    cache.set_json(key, related, RELATED_CACHE_TTL)
+    return related
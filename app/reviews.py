@@ -0,0 +1,138 @@
+"""
+Comment and rating listings for product pages.
+
+Each page is one narrow select: the review columns, the author's display
+name and whether the author bought the product, joined in SQL. Nothing is
+loaded as ORM objects. Pages are keyset-paginated. The cursor carries the
+sort key of the last row, so later pages cost the same as the first. Every
+sort order is served by a (product_id, ..., id) index. With extra shards
+(app.sharding) orders are not next to the reviews, so the verified flag is
+looked up per shard for the page's authors instead.
+"""
+from sqlalchemy import Connection, exists, false, func, select, tuple_, update
+from sqlalchemy.orm import Session
+from app.models import models
+from app.sharding import session_on, shard_count, shards_of
+from types import SimpleNamespace
+import base64
+import orjson
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+ANONYMOUS_AUTHOR = "Customer"
+
+# sort name -> (sort columns, descending); every column sorts the same way so
+# the keyset condition is a single row-value comparison
+COMMENT_SORTS = {
+    "recent": ([models.Comment.id], True),
+    "helpful": ([models.Comment.helpful_count, models.Comment.id], True),
+}
+RATING_SORTS = {
+    "recent": ([models.Rating.id], True),
+    "highest": ([models.Rating.rating, models.Rating.id], True),
+    "lowest": ([models.Rating.rating, models.Rating.id], False),
+}
+
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(values))).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for a cursor this module did not produce."""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, orjson.JSONDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values, list) or not all(isinstance(value, int) for value in values):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def author_columns(review) -> list:
+    if shard_count() > 1:
+        # Filled in by _with_verified
+        verified = false()
+    else:
+        verified = exists().where(
+            models.OrderItem.product_id == review.product_id,
+            models.OrderItem.order_id == models.Order.order_id,
+            models.Order.user_id == review.user_id,
+            models.Order.payment_status == "paid",
+        )
+    return [
+        review.user_id.label("author_id"),
+        func.coalesce(models.User.display_name, ANONYMOUS_AUTHOR).label("author_name"),
+        verified.label("verified_purchase"),
+    ]
+
+
+def _with_verified(db: Session | Connection, product_id: int, rows) -> list:
+    buyers = set()
+    for shard, user_ids in shards_of(row.author_id for row in rows).items():
+        with session_on(db, shard) as order_db:
+            buyers.update(order_db.execute(select(models.Order.user_id).join(
+                models.OrderItem, models.OrderItem.order_id == models.Order.order_id
+            ).where(
+                models.OrderItem.product_id == product_id,
+                models.Order.user_id.in_(user_ids),
+                models.Order.payment_status == "paid",
+            ).distinct()).scalars())
+    return [SimpleNamespace(**{**row._mapping, "verified_purchase": row.author_id in buyers}) for row in rows]
+
+
+def _page(db: Session | Connection, review, columns: list, sort: tuple, product_id: int, cursor: str | None, limit: int):
+    """Returns (rows, next cursor or None)."""
+    sort_columns, descending = sort
+    query = select(*columns, *author_columns(review)).join(
+        models.User, models.User.id == review.user_id
+    ).where(review.product_id == product_id)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(sort_columns):
+            raise ValueError("invalid cursor")
+        key = tuple_(*sort_columns)
+        query = query.where(key < tuple_(*values) if descending else key > tuple_(*values))
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in sort_columns))
+    rows = db.execute(query.limit(limit + 1)).all()
+    if shard_count() > 1:
+        rows = _with_verified(db, product_id, rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], column.key) for column in sort_columns)
+
+
+def comment_page(db: Session | Connection, product_id: int, sort: str = "recent", cursor: str | None = None,
+                 limit: int = DEFAULT_PAGE_SIZE):
+    Comment = models.Comment
+    columns = [Comment.id, Comment.comment, Comment.helpful_count, Comment.updated_at]
+    return _page(db, Comment, columns, COMMENT_SORTS[sort], product_id, cursor, limit)
+
+
+def rating_page(db: Session | Connection, product_id: int, sort: str = "recent", cursor: str | None = None,
+                limit: int = DEFAULT_PAGE_SIZE):
+    Rating = models.Rating
+    columns = [Rating.id, Rating.rating, Rating.updated_at]
+    return _page(db, Rating, columns, RATING_SORTS[sort], product_id, cursor, limit)
+
+
+def rating_histogram(db: Session | Connection, product_id: int) -> list:
+    """(rating, count, newest updated_at) per score, in one grouped query."""
+    Rating = models.Rating
+    return db.execute(select(
+        Rating.rating, func.count().label("count"), func.max(Rating.updated_at).label("updated_at")
+    ).where(Rating.product_id == product_id).group_by(Rating.rating).order_by(Rating.rating)).all()
+
+
+def add_to_rating_stats(db: Session, product_id: int, rating: int, count: int = 1) -> None:
+    """
+    Adds a rating to the product's running count and total, or takes it away
+    with ``count=-1``. Leaves updated_at alone: product responses do not show ratings.
+    """
+    Product = models.Product
+    db.execute(update(Product).where(Product.id == product_id).values(
+        rating_count=Product.rating_count + count,
+        rating_total=Product.rating_total + count * rating,
+        updated_at=Product.updated_at,
+    ))
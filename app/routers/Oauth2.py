@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from ..schemas import schemas
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import models
+from app.sharding import SHARD_MAP_TTL_SECONDS, BucketMoving, session_on, shard_for
 import os
 from dotenv import load_dotenv
 
@@ -60,3 +61,13 @@ def getCurrentUser(token: str = Depends(oauth2_scheme),db: Session = Depends(get
     if user is None:
         raise credentials_exception
     return user
+
+def getUserDb(request: Request, db: Session = Depends(get_db), user: models.User = Depends(getCurrentUser)):
+    """Session on the shard holding the current user's cart, wishlist and orders (app.sharding)."""
+    try:
+        shard = shard_for(user.id, writing=request.method != "GET")
+    except BucketMoving:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Your account data is being moved, try again shortly",
+                            headers={"Retry-After": str(int(SHARD_MAP_TTL_SECONDS) + 1)})
+    with session_on(db, shard) as user_db:
+        yield user_db
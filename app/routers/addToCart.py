@@ -1,58 +1,77 @@
 from fastapi import FastAPI,Depends, HTTPException, status,APIRouter
 from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.exc import IntegrityError
 from app.models import models
 from app.schemas import schemas
-from .Oauth2 import getCurrentUser
+from app.database import get_db
+from .Oauth2 import getCurrentUser, getUserDb
 
 router =APIRouter()
 
 def UserRole(user = Depends(getCurrentUser)):
-    if user.role != ("admin","customer"):
+    if user.role not in ("admin","customer"):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access required")
     return user
 
+def productExists(db: Session, product_id: int):
+    return db.query(models.Product.id).filter(models.Product.id == product_id).first() is not None
+
+def commitCartItem(db: Session, user_db: Session, product_id: int):
+    """
+    Products live on the primary and carts may be on a shard without a foreign
+    key (app.sharding), so the product is checked up front. A rejected commit
+    is then a duplicate (uq_cart_user_product), or the product was deleted
+    in the meantime.
+    """
+    if not productExists(db, product_id):
+        user_db.rollback()
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
+    try:
+        user_db.commit()
+    except IntegrityError:
+        user_db.rollback()
+        if not productExists(db, product_id):
+            raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Item already in cart")
+
 @router.post("/addToCart",response_model=schemas.CartRead)
-def addtocart(cart: schemas.CartCreate, db: Session = Depends(get_db),user = Depends(UserRole)):
+def addtocart(cart: schemas.CartCreate, db: Session = Depends(get_db), user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    db_cart = db.query(models.Cart).filter(models.Cart.user_id == user.id, models.Cart.product_id == cart.product_id).first()
-    if db_cart:
-        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Item already in cart")
     cart_item = models.Cart(user_id = user.id, product_id = cart.product_id, quantity = cart.quantity)
-    db.add(cart_item)
-    db.commit()
-    db.refresh(cart_item)
+    user_db.add(cart_item)
+    commitCartItem(db, user_db, cart.product_id)
+    user_db.refresh(cart_item)
     return cart_item
 
 
 @router.get("/getAllCartItems",response_model = list[schemas.CartRead])
-def getallCartItem(db: Session = Depends(get_db),user = Depends(UserRole)):
+def getallCartItem(user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role != "customer" and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    cart_items = db.query(models.Cart).filter(models.Cart.user_id == user.id).all()
+    cart_items = user_db.query(models.Cart).filter(models.Cart.user_id == user.id).all()
     return cart_items
 
 @router.put("/updateCart",response_model = schemas.CartRead)
-def updateCart(id: int, cart_update: schemas.CartCreate,db: Session=Depends(get_db),user = Depends(UserRole)):
+def updateCart(id: int, cart_update: schemas.CartCreate,db: Session = Depends(get_db),user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role != "customer" and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access required")
-    cart_item = db.query(models.Cart).filter(models.Cart.id == id).first()
+    cart_item = user_db.query(models.Cart).filter(models.Cart.id == id, models.Cart.user_id == user.id).first()
     if not cart_item:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Cart item not found")
     setattr(cart_item, "product_id", cart_update.product_id)
     setattr(cart_item,"quantity", cart_update.quantity)
-    db.commit()
-    db.refresh(cart_item)
+    commitCartItem(db, user_db, cart_update.product_id)
+    user_db.refresh(cart_item)
     return cart_item
 
 @router.delete("/deleteCart/{cart_id}",response_model = schemas.CartRead)
-def deleteCart(id: int,db: Session = Depends(get_db),user = Depends(UserRole)):
+def deleteCart(id: int,user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role != "customer" and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access required")
-    cart_item = db.query(models.Cart).filter(models.Cart.id == id).first()
+    cart_item = user_db.query(models.Cart).filter(models.Cart.id == id, models.Cart.user_id == user.id).first()
     if not cart_item:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Cart item not found")
-    db.delete(cart_item)
-    db.commit()
+    user_db.delete(cart_item)
+    user_db.commit()
     return cart_item
\ No newline at end of file
@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from app.database import get_read_db
+from app.models import models
+from app.schemas import schemas
+from app.sales_rollups import TOTAL, CATEGORY, PRODUCT, bucket_start
+from .Oauth2 import getCurrentUser
+
+router = APIRouter(prefix="/admin/analytics", tags=["analytics"])
+
+# Longest span one request may cover, in buckets
+MAX_BUCKETS = {"hour": 24 * 31, "day": 366 * 2}
+DEFAULT_SPAN = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+
+class Period(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
+def adminUser(user = Depends(getCurrentUser)):
+    if user.role != "admin":
+        raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="admin access required")
+    return user
+
+
+def _utc(at: datetime | None) -> datetime | None:
+    """Rollups are stored in naive UTC, like orders.created_at."""
+    if at is None or at.tzinfo is None:
+        return at
+    return at.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_range(period: Period, start: datetime | None, end: datetime | None) -> tuple[datetime, datetime]:
+    """[start, end) aligned to `period`; defaults to the last DEFAULT_SPAN, up to the current bucket."""
+    start, end = _utc(start), _utc(end)
+    step = timedelta(hours=1) if period is Period.hour else timedelta(days=1)
+    end = bucket_start(end, period.value) if end else bucket_start(datetime.utcnow(), period.value) + step
+    start = bucket_start(start, period.value) if start else end - DEFAULT_SPAN[period.value]
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    if (end - start) / step > MAX_BUCKETS[period.value]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"at most {MAX_BUCKETS[period.value]} {period.value}s per request")
+    return start, end
+
+
+def _series(db: Session, period: Period, dimension: str, entity_id: int, start, end):
+    Rollup = models.SalesRollup
+    start, end = bucket_range(period, start, end)
+    rows = db.query(Rollup.bucket_start, Rollup.orders, Rollup.units, Rollup.revenue).filter(
+        Rollup.period == period.value, Rollup.dimension == dimension, Rollup.entity_id == entity_id,
+        Rollup.bucket_start >= start, Rollup.bucket_start < end,
+    ).order_by(Rollup.bucket_start).all()
+    db.commit()
+    return {"period": period.value, "start": start, "end": end, "buckets": rows}
+
+
+def _ranking(db: Session, period: Period, dimension: str, start, end, limit: int, category: int | None = None):
+    Rollup = models.SalesRollup
+    start, end = bucket_range(period, start, end)
+    query = db.query(
+        Rollup.entity_id, func.max(Rollup.category_id).label("category_id"), func.sum(Rollup.orders).label("orders"),
+        func.sum(Rollup.units).label("units"), func.sum(Rollup.revenue).label("revenue"),
+    ).filter(
+        Rollup.period == period.value, Rollup.dimension == dimension,
+        Rollup.bucket_start >= start, Rollup.bucket_start < end,
+    )
+    if category is not None:
+        query = query.filter(Rollup.category_id == category)
+    rows = query.group_by(Rollup.entity_id).order_by(func.sum(Rollup.revenue).desc()).limit(limit).all()
+    db.commit()
+    return rows
+
+
+@router.get("/revenue",response_model = schemas.SalesSeries)
+def getRevenue(period: Period = Period.day, start: datetime | None = None, end: datetime | None = None,
+               db: Session = Depends(get_read_db), user = Depends(adminUser)):
+    """All sales per hour or day. Buckets without sales are left out."""
+    return _series(db, period, TOTAL, 0, start, end)
+
+
+@router.get("/categories",response_model = list[schemas.SalesRanking])
+def getCategorySales(period: Period = Period.day, start: datetime | None = None, end: datetime | None = None,
+                     limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_read_db), user = Depends(adminUser)):
+    """Categories by revenue over the range; entity_id 0 is uncategorised products."""
+    return _ranking(db, period, CATEGORY, start, end, limit)
+
+
+@router.get("/categories/{category_id}",response_model = schemas.SalesSeries)
+def getCategorySeries(category_id: int, period: Period = Period.day, start: datetime | None = None, end: datetime | None = None,
+                      db: Session = Depends(get_read_db), user = Depends(adminUser)):
+    return _series(db, period, CATEGORY, category_id, start, end)
+
+
+@router.get("/products",response_model = list[schemas.SalesRanking])
+def getProductSales(period: Period = Period.day, start: datetime | None = None, end: datetime | None = None,
+                    category: int | None = None, limit: int = Query(50, ge=1, le=500),
+                    db: Session = Depends(get_read_db), user = Depends(adminUser)):
+    """Best-selling products by revenue over the range, optionally in one category."""
+    return _ranking(db, period, PRODUCT, start, end, limit, category)
+
+
+@router.get("/products/{product_id}",response_model = schemas.SalesSeries)
+def getProductSeries(product_id: int, period: Period = Period.day, start: datetime | None = None, end: datetime | None = None,
+                     db: Session = Depends(get_read_db), user = Depends(adminUser)):
+    return _series(db, period, PRODUCT, product_id, start, end)
@@ -5,7 +5,7 @@ from app.models import models
 from app.schemas import schemas
 from fastapi.security import OAuth2PasswordRequestForm
 from ..utils import hashPassword, verifyPassword
-from Oauth2 import create_token, create_refresh_token, getCurrentUser
+from .Oauth2 import create_token, create_refresh_token, getCurrentUser
 from datetime import timedelta
 from jose import JWTError, jwt
 from dotenv import load_dotenv
@@ -1,13 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Request, Response
 from ..schemas import schemas
 from ..models import models  
-from ..database import get_db
+from ..database import get_db, get_read_connection
+from sqlalchemy import Connection, func, select
 from sqlalchemy.orm import Session
 from .Oauth2 import getCurrentUser
+from ..http_cache import conditional, make_etag, product_keys, category_key, purge, CATEGORIES_KEY
+from ..serialization import schema_columns, rows_content, rows_response, orjson_response
 
 
 router = APIRouter()
 
+CATEGORY_ROWS = select(*schema_columns(schemas.CategoryRead, models.Category)).order_by(models.Category.id)
+# Any write changes the count or the newest updated_at
+CATEGORIES_VERSION = select(func.count(models.Category.id), func.max(models.Category.updated_at))
+
 def userRole(user = Depends(getCurrentUser)):
     if user.role !="admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="admin access required")
@@ -22,21 +29,23 @@ def createCategory(category: schemas.CategoryCreate,db: Session = Depends(get_db
     db.add(category)
     db.commit()
     db.refresh(category)
+    purge(CATEGORIES_KEY)
     return category
 
-@router.get("/getCategories",response_model = schemas.CategoryRead)
-def getCategories(db:Session = Depends(get_db)):
-    categotries = db.query(models.Category).all()
-    db.commit()
-    return categotries
+@router.get("/getCategories",response_model = list[schemas.CategoryRead])
+def getCategories(request: Request, response: Response, db: Connection = Depends(get_read_connection)):
+    not_modified = conditional(request, response, make_etag("categories", *db.execute(CATEGORIES_VERSION).one()), [CATEGORIES_KEY])
+    if not_modified:
+        return not_modified
+    categotries = db.execute(CATEGORY_ROWS).all()
+    return rows_response(categotries, schemas.CategoryRead, response)
 
 @router.get("/getCategory/{category_id}",response_model = schemas.CategoryRead)
-def getCategory(id: int, category: schemas.CategoryRead, db:Session = Depends(get_db)):
-    category = db.query(models.Category).filter(models.Category.id == id).first()
+def getCategory(id: int, category: schemas.CategoryRead, db: Connection = Depends(get_read_connection)):
+    category = db.execute(select(*schema_columns(schemas.CategoryRead, models.Category)).where(models.Category.id == id)).first()
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
-    db.commit()
-    return category
+    return orjson_response(rows_content([category], schemas.CategoryRead)[0])
 
 @router.put("/updateCategory/{category_id}",response_model = schemas.CategoryRead)
 def updateCategory(id:int,category_update: schemas.CategoryRead, db: Session = Depends(get_db),user = Depends(userRole)):
@@ -48,6 +57,7 @@ def updateCategory(id:int,category_update: schemas.CategoryRead, db: Session = D
     setattr(category,"name",category_update.name)
     db.commit()
     db.refresh(category)
+    purge(CATEGORIES_KEY)
     return category
 
 
@@ -58,7 +68,14 @@ def deleteCategory(id: int, db: Session = Depends(get_db),user = Depends(userRol
     category = db.query(models.Category).filter(models.Category.id == id).first()
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+    # Detach products here rather than through ON DELETE SET NULL so their
+    # updated_at moves and cached product pages are revalidated
+    products = db.query(models.Product).filter(models.Product.category == category.id).all()
+    keys = [CATEGORIES_KEY, category_key(category.id), *product_keys(*products)]
+    for product in products:
+        product.category = None
     db.delete(category)
     db.commit()
+    purge(*keys)
     return category
 
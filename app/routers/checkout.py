@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.routers.Oauth2 import getCurrentUser
-from app.tasks import send_email
+from app.routers.Oauth2 import getCurrentUser, getUserDb
+from app.tasks import send_email, refresh_purchase_profile
+from app.inventory import reserve, reservation_expiry, commit_reservation, release_reservation
+from app.sharding import commit_pair
+from app import purchase_profile
+from app.telemetry import time_external
+from datetime import timezone
+from itertools import islice
 import stripe
 import os
 from dotenv import load_dotenv
@@ -13,6 +20,9 @@ load_dotenv()
 
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
+# Lets load tests point at a local stub (benchmarks/stripe_stub.py)
+if os.getenv("STRIPE_API_BASE"):
+    stripe.api_base = os.getenv("STRIPE_API_BASE")
 
 if not stripe.api_key:
     raise ValueError("STRIPE_SECRET_KEY environment variable is not set")
@@ -23,17 +33,19 @@ router = APIRouter(prefix="/api/checkout", tags=["checkout"])
 @router.get("/suggestions", response_model=list[schemas.ProductSuggestionResponse])
 def get_product_suggestions(
     db: Session = Depends(get_db),
+    user_db: Session = Depends(getUserDb),
     user=Depends(getCurrentUser),
-    limit: int = 5
+    limit: int = Query(5, ge=1, le=50)
 ):
     """
     Get personalized product suggestions based on user's purchase history.
     
-    Returns products from categories the user has previously purchased.
-    If no purchase history exists, returns popular products.
+    Returns products the user has not bought yet, ranked by how much the user
+    bought from their category and then by recent popularity. Without purchase
+    history this is the popularity ranking.
     
     **Query Parameters:**
-    - limit: Number of suggestions to return (default: 5)
+    - limit: Number of suggestions to return (default: 5, at most 50)
     """
     if user.role != "customer":
         raise HTTPException(
@@ -41,43 +53,25 @@ def get_product_suggestions(
             detail="Only customers can view suggestions"
         )
     
-    # Get categories from user's past orders
-    user_categories = db.query(
-        models.Product.category
-    ).join(
-        models.Order,
-        models.Product.id == models.Order.product_id
-    ).filter(
-        models.Order.user_id == user.id
-    ).distinct().all()
-    
-    if not user_categories:
-        # If no purchase history, return popular/recent products
-        popular_products = db.query(models.Product).limit(limit).all()
-        return popular_products
-    
-    category_ids = [cat[0] for cat in user_categories]
-    
-    # Get products from same categories that user hasn't purchased
-    purchased_product_ids = db.query(
-        models.Order.product_id
-    ).filter(
-        models.Order.user_id == user.id
-    ).all()
-    purchased_ids = [p[0] for p in purchased_product_ids]
-    
-    suggested = db.query(models.Product).filter(
-        models.Product.category.in_(category_ids),
-        ~models.Product.id.in_(purchased_ids) if purchased_ids else True
-    ).limit(limit).all()
-    
-    return suggested
+    # Candidates come ranked from precomputed tables (app.purchase_profile);
+    # a bounded number is read and checked against the user's order lines once
+    candidates = list(islice(purchase_profile.suggestion_candidates(db, user.id), purchase_profile.SUGGESTION_MAX_CANDIDATES))
+    if not candidates:
+        return []
+    purchased = set(user_db.execute(select(models.OrderItem.product_id).join(models.Order).where(
+        models.Order.user_id == user.id, models.OrderItem.product_id.in_(candidates)
+    )).scalars())
+    # Listings can still hold deleted products until their next refresh, hence the spare ids
+    wanted = [product_id for product_id in candidates if product_id not in purchased][:2 * limit]
+    products = {product.id: product for product in db.query(models.Product).filter(models.Product.id.in_(wanted))}
+    return [products[product_id] for product_id in wanted if product_id in products][:limit]
 
 
 @router.post("/create-session", response_model=schemas.CheckoutSessionResponse)
 def create_checkout_session(
     checkout_data: schemas.CheckoutSessionCreate,
     db: Session = Depends(get_db),
+    user_db: Session = Depends(getUserDb),
     user=Depends(getCurrentUser)
 ):
     """
@@ -85,10 +79,12 @@ def create_checkout_session(
     
     This endpoint:
     1. Validates cart items
-    2. Checks product stock availability
+    2. Reserves stock for every cart item
     3. Creates a Stripe session with cart items
     4. Returns session details for frontend redirect
     
+    Reserved stock is released again if the session expires unpaid.
+    
     **Request Body:**
     - success_url: Redirect URL after successful payment
     - cancel_url: Redirect URL if payment is cancelled
@@ -101,7 +97,7 @@ def create_checkout_session(
         )
     
     # Get cart items
-    cart_items = db.query(models.Cart).filter(
+    cart_items = user_db.query(models.Cart).filter(
         models.Cart.user_id == user.id
     ).all()
     
@@ -111,27 +107,39 @@ def create_checkout_session(
             detail="Cart is empty"
         )
     
-    # Calculate total and prepare line items for Stripe
+    products = {
+        product.id: product
+        for product in db.query(models.Product).filter(
+            models.Product.id.in_([item.product_id for item in cart_items])
+        ).all()
+    }
+    
+    # Calculate total, reserve stock and prepare line items for Stripe
     line_items = []
+    reservations = []
     total_amount = 0
+    # Provisional: moved to the session's expiry once Stripe has created it
+    expires_at = reservation_expiry()
     
     for item in cart_items:
-        product = db.query(models.Product).filter(
-            models.Product.id == item.product_id
-        ).first()
+        product = products.get(item.product_id)
         
         if not product:
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Product {item.product_id} not found"
             )
         
-        # Check if enough stock is available
-        if product.stock < item.quantity:
+        # Atomically take the stock; fails if another checkout got there first
+        reservation = reserve(db, user.id, product.id, item.quantity, expires_at)
+        if reservation is None:
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough stock for {product.name}. Available: {product.stock}, Requested: {item.quantity}"
+                detail=f"Not enough stock for {product.name}. Requested: {item.quantity}"
             )
+        reservations.append(reservation)
         
         amount = product.price * item.quantity
         total_amount += amount
@@ -149,39 +157,57 @@ def create_checkout_session(
             "quantity": item.quantity,
         })
     
+    # Commit the reservations before calling Stripe so product rows are not
+    # locked for the duration of the API call
+    db.commit()
+    
+    # Computed just before the call: Stripe rejects expiries under 30 minutes away
+    expires_at = reservation_expiry()
     try:
         # Create Stripe checkout session
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=line_items,
-            mode="payment",
-            success_url=checkout_data.success_url,
-            cancel_url=checkout_data.cancel_url,
-            customer_email=user.email,
-            metadata={
-                "user_id": str(user.id),
-                "address": checkout_data.address,
-                "total_amount": str(total_amount)
-            }
-        )
-        
-        return {
-            "session_id": session.id,
-            "client_secret": session.client_secret,
-            "url": session.url
-        }
+        with time_external("stripe", "checkout.Session.create"):
+            session = stripe.checkout.Session.create(
+                payment_method_types=["card"],
+                line_items=line_items,
+                mode="payment",
+                success_url=checkout_data.success_url,
+                cancel_url=checkout_data.cancel_url,
+                customer_email=user.email,
+                expires_at=int(expires_at.replace(tzinfo=timezone.utc).timestamp()),
+                metadata={
+                    "user_id": str(user.id),
+                    "address": checkout_data.address,
+                    "total_amount": str(total_amount)
+                }
+            )
     
     except stripe.error.StripeError as e:
+        for reservation in reservations:
+            release_reservation(db, reservation)
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Stripe error: {str(e)}"
         )
+    
+    # The reservations hold the stock for as long as the session can be paid
+    for reservation in reservations:
+        reservation.stripe_session_id = session.id
+        reservation.expires_at = expires_at
+    db.commit()
+    
+    return {
+        "session_id": session.id,
+        "client_secret": session.client_secret,
+        "url": session.url
+    }
 
 
 @router.post("/confirm-payment", response_model=schemas.PaymentSuccessResponse)
 def confirm_payment(
     session_id: str,
     db: Session = Depends(get_db),
+    user_db: Session = Depends(getUserDb),
     user=Depends(getCurrentUser)
 ):
     """
@@ -189,8 +215,8 @@ def confirm_payment(
     
     This endpoint:
     1. Verifies payment status with Stripe
-    2. Creates order records from cart items
-    3. Updates product stock
+    2. Creates an order with one line item per stock reservation
+    3. Settles the reservations (stock was taken at session creation)
     4. Clears user's cart
     5. Sends confirmation email
     
@@ -198,7 +224,8 @@ def confirm_payment(
     - session_id: Stripe checkout session ID
     """
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with time_external("stripe", "checkout.Session.retrieve"):
+            session = stripe.checkout.Session.retrieve(session_id)
         
         if session.payment_status != "paid":
             raise HTTPException(
@@ -206,61 +233,91 @@ def confirm_payment(
                 detail="Payment not completed"
             )
         
+        # StripeObject no longer behaves like a dict
+        metadata = session.metadata.to_dict() if session.metadata else {}
+        
         # Verify the session belongs to the current user
-        if str(user.id) != session.metadata.get("user_id"):
+        if str(user.id) != metadata.get("user_id"):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Payment session does not belong to this user"
             )
         
-        # Get cart items
-        cart_items = db.query(models.Cart).filter(
-            models.Cart.user_id == user.id
+        reservations = db.query(models.StockReservation).filter(
+            models.StockReservation.stripe_session_id == session_id,
+            models.StockReservation.user_id == user.id,
+            models.StockReservation.status.in_(("pending", "released"))
         ).all()
         
-        if not cart_items:
+        if not reservations:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No items in cart"
+                detail="No pending items for this payment session"
             )
         
-        # Create orders and update stock
-        created_orders = []
-        address = session.metadata.get("address", "")
-        total_amount = int(session.metadata.get("total_amount", 0))
+        products = {
+            product.id: product
+            for product in db.query(models.Product).filter(
+                models.Product.id.in_([reservation.product_id for reservation in reservations])
+            ).all()
+        }
         
-        for item in cart_items:
-            product = db.query(models.Product).filter(
-                models.Product.id == item.product_id
-            ).first()
-            
-            if product:
-                # Create order with Stripe session tracking
-                order = models.Order(
-                    user_id=user.id,
-                    product_id=item.product_id,
-                    quantity=item.quantity,
-                    address=address,
-                    stripe_session_id=session_id,
-                    payment_status="paid",
-                    total_amount=product.price * item.quantity
+        # With sharding the order can be stored while settling the reservations
+        # failed; a retry then settles them without a second order
+        stored_order = user_db.query(models.Order).filter(
+            models.Order.stripe_session_id == session_id,
+            models.Order.user_id == user.id
+        ).first()
+        
+        # Create one order for the session and settle the reservations
+        address = metadata.get("address", "")
+        total_amount = int(metadata.get("total_amount", 0))
+        order = models.Order(
+            user_id=user.id,
+            address=address,
+            stripe_session_id=session_id,
+            payment_status="paid",
+            total_amount=0
+        )
+        
+        for reservation in reservations:
+            product = products.get(reservation.product_id)
+            if not product:
+                continue
+            if not commit_reservation(db, reservation):
+                db.rollback()
+                user_db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Reservation for {product.name} expired and the item is out of stock"
                 )
-                
-                # Update product stock
-                product.stock -= item.quantity
-                
-                db.add(order)
-                created_orders.append(order)
-                
-                # Delete from cart
-                db.delete(item)
+            
+            order.items.append(models.OrderItem(
+                product_id=reservation.product_id,
+                quantity=reservation.quantity,
+                unit_price=product.price
+            ))
+            order.total_amount += product.price * reservation.quantity
         
-        db.commit()
+        if stored_order is None:
+            user_db.add(order)
+        else:
+            order = stored_order
+        
+        # Clear the purchased items from the cart
+        user_db.query(models.Cart).filter(
+            models.Cart.user_id == user.id,
+            models.Cart.product_id.in_(list(products))
+        ).delete(synchronize_session=False)
+        
+        # The order first: reservations left pending are settled by a retry
+        commit_pair(user_db, db)
+        refresh_purchase_profile.delay(order.order_id, user.id)
         
         # Send confirmation email asynchronously
         order_details = "\n".join([
-            f"- Product: {db.get(models.Product, order.product_id).name}, Qty: {order.quantity}"
-            for order in created_orders
+            f"- Product: {products[item.product_id].name}, Qty: {item.quantity}"
+            for item in order.items
         ])
         
         email_body = f"""
@@ -280,8 +337,9 @@ def confirm_payment(
         )
         
         return {
-            "message": "Payment successful and orders created",
-            "orders_count": len(created_orders),
+            "message": "Payment successful and order created",
+            "order_id": order.order_id,
+            "orders_count": 1,
             "total_amount": total_amount
         }
     
@@ -301,7 +359,8 @@ def get_session_details(
     Retrieve Stripe session details for verification.
     """
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with time_external("stripe", "checkout.Session.retrieve"):
+            session = stripe.checkout.Session.retrieve(session_id)
         
         return {
             "session_id": session.id,
@@ -1,9 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Request, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.exc import IntegrityError
+from app.database import get_db, get_read_db
 from app.models import models
 from app.schemas import schemas
 from .Oauth2 import getCurrentUser
+from ..http_cache import conditional, make_etag, reviews_key, purge
 
 def userRole(user = Depends(getCurrentUser)):
     if user.role not in ("customer","admin","seller"):
@@ -17,22 +20,32 @@ router = APIRouter()
 def createComment(comment: schemas.CommentCreate, db: Session = Depends(get_db),user = Depends(userRole)):
     if user.role not in ("customer","admin","seller"):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Access denied")
-    comment = models.Comment(product_id = comment.product_id, user_id = comment.user_id, content = comment.comment)
+    comment = models.Comment(product_id = comment.product_id, user_id = comment.user_id, comment = comment.comment)
     db.add(comment)
     db.commit()
     db.refresh(comment)
+    purge(reviews_key(comment.product_id))
     return comment
 
-@router.get("/getComments/{product_id}",response_model = schemas.CommentRead)
-def getComments(product_id: int, db: Session = Depends(get_db),user = Depends(userRole)):
+@router.get("/getComments/{product_id}",response_model = list[schemas.CommentRead])
+def getComments(product_id: int, request: Request, response: Response, db: Session = Depends(get_read_db),user = Depends(userRole)):
     if user.role not in ("customer","admin","seller"):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Access denied")
-    comments = db.query(models.Comment).filter(models.Comment.product_id == product_id).limit(10).all()
+    # Any write to the product's comments changes the count or the newest updated_at
+    count, updated_at = db.query(func.count(models.Comment.id), func.max(models.Comment.updated_at)).filter(
+        models.Comment.product_id == product_id
+    ).one()
+    # Behind authentication: clients may revalidate, shared caches must not store
+    not_modified = conditional(request, response, make_etag("comments", product_id, count, updated_at))
+    if not_modified:
+        db.commit()
+        return not_modified
+    comments = db.query(models.Comment).filter(models.Comment.product_id == product_id).order_by(models.Comment.id).limit(10).all()
     db.commit()
     return comments
 
 @router.get("/getComment/{comment_id}",response_model = schemas.CommentRead)
-def getComment(id: int,db: Session = Depends(get_db),user = Depends(userRole)):
+def getComment(id: int,db: Session = Depends(get_read_db),user = Depends(userRole)):
     if user.role not in ("customer","admin","seller"):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Access denied")
     comment = db.query(models.Comment).filter(models.Comment.id == id).first()
@@ -49,11 +62,13 @@ def updateComment(id: int, comment_update: schemas.CommentCreate, db: Session =
     comment = db.query(models.Comment).filter(models.Comment.id == id).first()
     if not comment:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    previous_product_id = comment.product_id
     setattr(comment, "product_id", comment_update.product_id)
     setattr(comment, "user_id", comment_update.user_id)
     setattr(comment, "comment", comment_update.comment)
     db.commit()
     db.refresh(comment)
+    purge(reviews_key(previous_product_id), reviews_key(comment.product_id))
     return comment
 
 @router.delete("/deleteComment/{comment_id}",response_model = schemas.CommentRead)
@@ -63,6 +78,28 @@ def deleteComment(id: int, db: Session = Depends(get_db),user = Depends(userRole
     comment = db.query(models.Comment).filter(models.Comment.id == id).first()
     if not comment:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    key = reviews_key(comment.product_id)
     db.delete(comment)
     db.commit()
+    purge(key)
+    return comment
+
+@router.post("/comments/{comment_id}/helpful",response_model = schemas.CommentRead)
+def markCommentHelpful(comment_id: int, db: Session = Depends(get_db),user = Depends(userRole)):
+    """Counts one helpful vote per user; a second vote by the same user is refused."""
+    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    if not comment:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    db.add(models.CommentVote(comment_id = comment_id, user_id = user.id))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail="Already marked helpful")
+    db.query(models.Comment).filter(models.Comment.id == comment_id).update(
+        {models.Comment.helpful_count: models.Comment.helpful_count + 1}, synchronize_session=False
+    )
+    db.commit()
+    db.refresh(comment)
+    purge(reviews_key(comment.product_id))
     return comment
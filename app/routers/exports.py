@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from datetime import datetime
+from enum import Enum
+from sqlalchemy.orm import Session
+from app.database import ReadSessionLocal, get_shard_engine
+from app.models import models
+from app.sharding import shard_count
+from .Oauth2 import getCurrentUser
+import csv
+import io
+import orjson
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows fetched per round trip, and per chunk written to the client
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+router = APIRouter(prefix="/admin/export", tags=["exports"])
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {ExportFormat.ndjson: "application/x-ndjson", ExportFormat.csv: "text/csv; charset=utf-8"}
+
+ORDER_COLUMNS = [
+    models.Order.order_id, models.Order.user_id, models.Order.created_at, models.Order.payment_status,
+    models.Order.stripe_session_id, models.Order.total_amount, models.Order.address,
+    models.OrderItem.product_id, models.OrderItem.quantity, models.OrderItem.unit_price,
+]
+PRODUCT_COLUMNS = [
+    models.Product.id, models.Product.name, models.Product.description, models.Product.price,
+    models.Product.category, models.Product.stock, models.Product.image_url, models.Product.updated_at,
+]
+# Never export password hashes or refresh tokens
+USER_COLUMNS = [models.User.id, models.User.email, models.User.role, models.User.is_active]
+
+
+def adminUser(user = Depends(getCurrentUser)):
+    if user.role != "admin":
+        raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="admin access required")
+    return user
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _read_sessions(sharded: bool):
+    yield ReadSessionLocal()
+    if sharded:
+        for shard in range(1, shard_count()):
+            yield Session(bind=get_shard_engine(shard))
+
+
+def stream_rows(statement, export_format: ExportFormat, sharded: bool = False):
+    """
+    Yields the rows of `statement` encoded as NDJSON or CSV, one chunk per
+    batch; a `sharded` statement runs on each shard in turn (app.sharding).
+    Rows are read with a server-side cursor (yield_per), so memory does not
+    grow with the table. Sessions are opened here rather than injected,
+    because the body is produced after the handler has returned.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = True
+    for db in _read_sessions(sharded):
+        try:
+            result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            fields = list(result.keys())
+            if export_format == ExportFormat.csv and header:
+                writer.writerow(fields)
+                header = False
+            for batch in result.partitions():
+                if export_format == ExportFormat.ndjson:
+                    yield b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in batch)
+                    continue
+                writer.writerows([_csv_value(value) for value in row] for row in batch)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        finally:
+            db.close()
+    if export_format == ExportFormat.csv and buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(statement, name: str, export_format: ExportFormat, sharded: bool = False) -> StreamingResponse:
+    filename = f"{name}-{datetime.utcnow():%Y%m%dT%H%M%S}.{export_format.value}"
+    return StreamingResponse(
+        stream_rows(statement, export_format, sharded),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+@router.get("/orders")
+def exportOrders(format: ExportFormat = ExportFormat.ndjson, user = Depends(adminUser)):
+    """
+    Every order line with its order's fields; orders without lines appear
+    once with empty item fields. Shards follow one another, each in order id order.
+    """
+    statement = (
+        select(*ORDER_COLUMNS)
+        .outerjoin(models.OrderItem, models.OrderItem.order_id == models.Order.order_id)
+        .order_by(models.Order.order_id, models.OrderItem.id)
+    )
+    return export_response(statement, "orders", format, sharded=True)
+
+
+@router.get("/products")
+def exportProducts(format: ExportFormat = ExportFormat.ndjson, user = Depends(adminUser)):
+    return export_response(select(*PRODUCT_COLUMNS).order_by(models.Product.id), "products", format)
+
+
+@router.get("/users")
+def exportUsers(format: ExportFormat = ExportFormat.ndjson, user = Depends(adminUser)):
+    return export_response(select(*USER_COLUMNS).order_by(models.User.id), "users", format)
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app import health
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/health/live")
+def getLiveness():
+    """Answers while the process can serve requests; restart it when this fails."""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+def getReadiness():
+    """503 while warming up, draining or cut off from the database; route traffic elsewhere then."""
+    ready, report = health.readiness()
+    return JSONResponse(report, status_code=200 if ready else 503)
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import models
+from ..storage import blob_path, is_valid_digest
+from ..http_cache import etag_matches
+import os
+
+router = APIRouter(tags=["images"])
+
+# Blobs are addressed by content hash, so a given URL can never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/images/{digest}")
+def getImage(digest: str, request: Request, db: Session = Depends(get_db)):
+    if not is_valid_digest(digest):
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Image not found")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    blob = db.query(models.ImageBlob).filter(models.ImageBlob.digest == digest).first()
+    path = blob_path(digest)
+    if blob is None or not os.path.exists(path):
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return FileResponse(path, media_type=blob.content_type, headers=headers)
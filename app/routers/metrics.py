@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from app import query_stats
+from app.telemetry import CONTENT_TYPE, REGISTRY
+from .Oauth2 import getCurrentUser
+
+router = APIRouter(tags=["metrics"])
+
+
+def adminUser(user = Depends(getCurrentUser)):
+    if user.role != "admin":
+        raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="admin access required")
+    return user
+
+
+@router.get("/metrics")
+def getMetrics(user = Depends(adminUser)):
+    """Prometheus scrape endpoint; merges all worker processes when METRICS_MULTIPROC_DIR is set."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/metrics/queries")
+def getQueryMetrics(user = Depends(adminUser)):
+    """SQL statements, database time and rows per route, for this worker process."""
+    return query_stats.snapshot()
@@ -1,9 +1,12 @@
 from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from app.database import get_db
 from app.models import models
 from app.schemas import schemas
-from .Oauth2 import getCurrentUser
+from .Oauth2 import getCurrentUser, getUserDb
+from ..inventory import decrement_stock, increment_stock
+from ..sharding import commit_pair, user_session
+from ..tasks import refresh_purchase_profile
 
 router = APIRouter()
 
@@ -13,69 +16,70 @@ def userRole(user = Depends(getCurrentUser)):
     return user
 
 @router.post("/createOrder",response_model = schemas.OrderRead)
-def createOrder(order: schemas.OrderCreate, db: Session = Depends(get_db),user = Depends(userRole)):
+def createOrder(order: schemas.OrderCreate, db: Session = Depends(get_db), user_db: Session = Depends(getUserDb), user = Depends(userRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    # Fetch the product from the database
-    product = db.query(models.Product).filter(models.Product.id == order.product_id).first()
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    # Use the instance attribute for stock check and update
-    current_stock = product.__dict__.get('stock')
-    if current_stock is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Product stock not set")
-    if current_stock < order.quantity:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough stock available")
-    # Create the order
-    new_order = models.Order(user_id=order.user_id, product_id=order.product_id, quantity=order.quantity, address=order.address)
-    # Update the product stock (instance attribute)
-    product.__dict__['stock'] = current_stock - order.quantity
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    product_ids = [item.product_id for item in order.items]
+    products = {product.id: product for product in db.query(models.Product).filter(models.Product.id.in_(product_ids)).all()}
+    new_order = models.Order(user_id=user.id, address=order.address, total_amount=0)
+    for item in order.items:
+        product = products.get(item.product_id)
+        if not product:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product {item.product_id} not found")
+        if not decrement_stock(db, item.product_id, item.quantity):
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Not enough stock available for {product.name}")
+        new_order.items.append(models.OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price=product.price))
+        new_order.total_amount += product.price * item.quantity
+    user_db.add(new_order)
+
+    def restore_stock():
+        for item in order.items:
+            increment_stock(db, item.product_id, item.quantity)
+
+    # Stock lives on the primary, the order on the user's shard
+    commit_pair(db, user_db, undo=restore_stock)
+    user_db.refresh(new_order)
+    refresh_purchase_profile.delay(new_order.order_id, user.id)
     return new_order
 
-@router.get("/getOrders/{user_id}",response_model = schemas.OrderRead)
+@router.get("/getOrders/{user_id}",response_model = list[schemas.OrderRead])
 def getOrders(user_id: int, offset: int = 0, db: Session = Depends(get_db),user = Depends(userRole)):
-    if user.user_id != user_id and user.role != "admin":
+    if user.id != user_id and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access denied")
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).limit(10).offset(offset).all()
-    db.commit()
-    return orders
+    with user_session(db, user_id, writing=False) as user_db:
+        return user_db.query(models.Order).options(selectinload(models.Order.items)).filter(models.Order.user_id == user_id).order_by(models.Order.order_id.desc()).limit(10).offset(offset).all()
 
 @router.get("/getOrder/{order_id}",response_model = schemas.OrderRead)
-def getOrder(id: int,db: Session = Depends(get_db),user = Depends(userRole)):
+def getOrder(id: int,user_db: Session = Depends(getUserDb),user = Depends(userRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    order = db.query(models.Order).filter(models.Order.id == id).first()
+    order = user_db.query(models.Order).options(selectinload(models.Order.items)).filter(models.Order.order_id == id, models.Order.user_id == user.id).first()
     if order is None:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Order not found")
-    db.commit()
     return order
 
 @router.put("/updateOrder/{order_id}",response_model = schemas.OrderRead)
-def updateOrder(id: int, order_update: schemas.OrderCreate, db: Session = Depends(get_db),user = Depends(userRole)):
+def updateOrder(id: int, order_update: schemas.OrderUpdate, user_db: Session = Depends(getUserDb),user = Depends(userRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    order = db.query(models.Order).filter(models.Order.id == id).first()
+    order = user_db.query(models.Order).filter(models.Order.order_id == id, models.Order.user_id == user.id).first()
     if not order:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Order not found")
-    setattr(order, "user_id", order_update.user_id)
-    setattr(order, "product_id", order_update.product_id)
-    setattr(order, "quantity", order_update.quantity)
     setattr(order,"address",order_update.address)
-    db.commit()
-    db.refresh(order)
+    user_db.commit()
+    user_db.refresh(order)
     return order
 
 @router.delete("/deleteOrder/{order_id}",response_model = schemas.OrderRead)
-def deleteOrder(id: int, db: Session = Depends(get_db),user = Depends(userRole)):
+def deleteOrder(id: int, user_db: Session = Depends(getUserDb),user = Depends(userRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Customer access required")
-    order = db.query(models.Order).filter(models.Order.id == id).first()
+    order = user_db.query(models.Order).filter(models.Order.order_id == id, models.Order.user_id == user.id).first()
     if not order:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Order not found")
-    db.delete(order)
-    db.commit()
+    user_db.delete(order)
+    user_db.commit()
     return order
 
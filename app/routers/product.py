@@ -1,13 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, UploadFile, File, Request, Response, Query
+from sqlalchemy import Connection, bindparam, select
 from sqlalchemy.orm import Session  
-from app.database import get_db
+from app.database import get_db, get_read_connection
 from app.models import models
 from app.schemas import schemas
 from .Oauth2 import getCurrentUser
-from ..utils import save_image
+from ..storage import save_image, acquire_image, release_image
+from ..related import related_products, stale_related_keys
+from ..inventory import apply_stock_price_changes
+from .. import cache
+from ..http_cache import conditional, make_etag, row_versions, product_keys, product_key, category_key, purge
+from ..serialization import schema_columns, rows_content, rows_response, orjson_response
+from ..wishlist_alerts import alert_events, queue_alerts
+from ..category_listings import ListingSort, page_ids, filtered_page_ids, refresh as refresh_listings
+from ..facets import filter_conditions
+from ..product_import import IMPORT_BATCH_SIZE, format_for, import_products, read_records
+from typing import Annotated, Literal
+import io
 
 router = APIRouter()
 
+# Built once, so each request reuses the compiled form from the engine's statement cache
+PRODUCT_ROWS = select(models.Product.id, models.Product.updated_at, *schema_columns(schemas.ProductCreate, models.Product))
+PRODUCT_BY_ID = PRODUCT_ROWS.where(models.Product.id == bindparam("product_id"))
+PRODUCTS_BY_IDS = PRODUCT_ROWS.where(models.Product.id.in_(bindparam("ids", expanding=True)))
+# Version queries: just enough to build the ETag before the rows are loaded
+PRODUCT_VERSION = select(models.Product.id, models.Product.updated_at).where(models.Product.id == bindparam("product_id"))
+PRODUCT_VERSIONS = select(models.Product.id, models.Product.updated_at, models.Product.category).where(
+    models.Product.id.in_(bindparam("ids", expanding=True))
+)
+
 def userRole(user = Depends(getCurrentUser)):
     if user.role not in ("seller","admin","customer"):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access required")
@@ -20,28 +42,106 @@ def createProduct(id: int, product: schemas.ProductCreate, db: Session = Depends
     image_url = product.image_url 
     if image:
         try:
-            image_url = save_image(image)  
+            image_url = save_image(image, db)
         except HTTPException as e:
             raise HTTPException(status_code=e.status_code, detail=f"Image upload failed: {e.detail}")
-    product = models.Product(name = product.name, price= product.price, description = product.description, image_url = product.image_url, category=product.category,stock = product.stock)
+    else:
+        acquire_image(db, image_url)
+    product = models.Product(sku = product.sku, name = product.name, price= product.price, description = product.description, image_url = image_url, category=product.category,stock = product.stock)
     db.add(product)
     db.commit()
     db.refresh(product)
+    purge(*product_keys(product))
+    refresh_listings(product.category)
     return product
 
-@router.get("/getProducts/{category}",response_model = schemas.ProductCreate)
-def getProducts(category:str,db: Session = Depends(get_db)):
-    products = db.query(models.Product).filter(models.Product.category == category).limit(10).all()
+@router.post("/products/import",response_model = schemas.ProductImportResult)
+def importProducts(file: UploadFile = File(...), format: Literal["csv", "ndjson"] | None = None,
+                   batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10_000), db: Session = Depends(get_db), user = Depends(userRole)):
+    """Upserts products on sku from a CSV or NDJSON upload; see app/product_import.py."""
+    if user.role != "seller" and user.role != "admin":
+        raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Seller or admin access required")
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_products(db, read_records(stream, format or format_for(file.filename)), batch_size)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Import files must be UTF-8; rows before the bad byte were imported")
+
+@router.post("/products/bulk-update",response_model = schemas.BulkStockPriceResult)
+def bulkUpdateStockAndPrice(update: schemas.BulkStockPriceUpdate, db: Session = Depends(get_db), user = Depends(userRole)):
+    """
+    Adds stock deltas and sets prices for many products in one transaction.
+    Entries for the same product are merged: deltas add up, the last price wins.
+    """
+    if user.role != "seller" and user.role != "admin":
+        raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Seller or admin access required")
+    changes = {}
+    for change in update.changes:
+        stock_delta, price = changes.get(change.product_id, (0, None))
+        changes[change.product_id] = (stock_delta + change.stock_delta, change.price if change.price is not None else price)
+    # Locked so the previous prices, which decide the price-drop alerts, stay exact
+    old_prices = dict(db.query(models.Product.id, models.Product.price).filter(
+        models.Product.id.in_([product_id for product_id, (_, price) in changes.items() if price is not None])
+    ).with_for_update().all())
+    updated = apply_stock_price_changes(db, changes)
+    repriced = [row.id for row in updated if changes[row.id][1] is not None]
+    stale_related = stale_related_keys(db, repriced)
     db.commit()
-    return products
+    queue_alerts([event for row in updated for event in alert_events(
+        row.id, old_prices.get(row.id, row.price), row.price, row.stock - changes[row.id][0], row.stock
+    )])
+    missed = set(changes) - {row.id for row in updated}
+    found = {product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.id.in_(missed)).all()} if missed else set()
+    cache.delete(*stale_related)
+    purge(*product_keys(*updated))
+    refresh_listings(*(row.category for row in updated if changes[row.id][1] is not None))
+    return {
+        "updated": len(updated),
+        "rejected": [{"product_id": product_id, "reason": "insufficient stock" if product_id in found else "product not found"}
+                     for product_id in sorted(missed)],
+    }
+
+@router.get("/getProducts/{category}",response_model = list[schemas.ProductCreate])
+def getProducts(category: int, request: Request, response: Response, filters: Annotated[schemas.ProductFilters, Depends()],
+                sort: ListingSort = ListingSort.newest, offset: int = Query(0, ge=0), limit: int = Query(10, ge=1, le=100),
+                db: Connection = Depends(get_read_connection)):
+    """
+    One page of a category from its precomputed listing (app.category_listings),
+    or queried when filters are given. X-Total-Count carries the listing's length.
+    """
+    conditions = filter_conditions(filters)
+    if conditions:
+        ids, total = filtered_page_ids(db, category, sort, conditions, offset, limit)
+    else:
+        ids, total = page_ids(db, category, sort, offset, limit)
+    versions = db.execute(PRODUCT_VERSIONS, {"ids": ids}).all() if ids else []
+    # Skips rows deleted or moved to another category since the listing was built
+    by_id = {row.id: row for row in versions if row.category == category}
+    ids = [product_id for product_id in ids if product_id in by_id]
+    response.headers["X-Total-Count"] = str(total)
+    not_modified = conditional(request, response, make_etag("category", category, sort.value, offset, total, filters.model_dump_json(), *row_versions(by_id[product_id] for product_id in ids)), [category_key(category)])
+    if not_modified:
+        return not_modified
+    rows = {row.id: row for row in db.execute(PRODUCTS_BY_IDS, {"ids": ids})} if ids else {}
+    products = [rows[product_id] for product_id in ids if product_id in rows]
+    return rows_response(products, schemas.ProductCreate, response)
 
 @router.get("/getProduct/{product_id}",response_model = schemas.ProductCreate)
-def getProduct(id: int,db: Session = Depends(get_db)):
-    product = db.query(models.Product).filter(models.Product.id == id).first()
+def getProduct(id: int, request: Request, response: Response, db: Connection = Depends(get_read_connection)):
+    version = db.execute(PRODUCT_VERSION, {"product_id": id}).first()
+    if version is None:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
+    not_modified = conditional(request, response, make_etag("product", version.id, version.updated_at), [product_key(version.id)])
+    if not_modified:
+        return not_modified
+    product = db.execute(PRODUCT_BY_ID, {"product_id": id}).first()
     if product is None:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
-    db.commit()
-    return product
+    return orjson_response(rows_content([product], schemas.ProductCreate)[0], response)
+
+@router.get("/products/{product_id}/related",response_model = list[schemas.RelatedProduct])
+def getRelatedProducts(product_id: int, limit: int = 10, db: Connection = Depends(get_read_connection)):
+    return related_products(db, product_id)[:limit]
 
 @router.put("/updateProduct/{product_id}",response_model = schemas.ProductCreate)
 def updateProduct(id:int, product_update: schemas.ProductCreate,db: Session = Depends(get_db),user = Depends(userRole)):
@@ -50,14 +150,26 @@ def updateProduct(id:int, product_update: schemas.ProductCreate,db: Session = De
     product = db.query(models.Product).filter(models.Product.id == id).first()
     if not product:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
+    previous_keys = product_keys(product)
+    old_price, old_stock, old_category = product.price, product.stock, product.category
+    if product_update.sku is not None:
+        setattr(product, "sku",product_update.sku)
     setattr(product, "name",product_update.name)
     setattr(product, "price",product_update.price)
     setattr(product, "description",product_update.description)
+    if product.image_url != product_update.image_url:
+        release_image(db, product.image_url)
+        acquire_image(db, product_update.image_url)
     setattr(product, "image_url",product_update.image_url)
     setattr(product, "category",product_update.category)
-    setattr(product,"stock",product_update.stock)
+    # Stock is left alone: an absolute value read before a checkout would undo it.
+    # Stock changes go through /products/bulk-update as deltas.
     db.commit()
     db.refresh(product)
+    purge(*previous_keys, *product_keys(product))
+    queue_alerts(alert_events(product.id, old_price, product.price, old_stock, product.stock))
+    if (old_price, old_category) != (product.price, product.category):
+        refresh_listings(old_category, product.category)
     return product
 
 @router.delete("/deleteProduct/{product_id}",response_model = schemas.ProductCreate)
@@ -67,7 +179,12 @@ def deleteProduct(id: int, db: Session = Depends(get_db),user = Depends(userRole
     product = db.query(models.Product).filter(models.Product.id == id).first()
     if not product:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Product not found")
+    release_image(db, product.image_url)
+    keys = product_keys(product)
+    category = product.category
     db.delete(product)
     db.commit()
+    purge(*keys)
+    refresh_listings(category)
     return product
 
@@ -1,9 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Request, Response
 from ..schemas import schemas
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import models
 from .Oauth2 import getCurrentUser
+from ..http_cache import conditional, make_etag, product_keys, reviews_key, purge
+from ..reviews import add_to_rating_stats
 
 def userRole(user = Depends(getCurrentUser)):
     if user.role not in ("customer","admin"):
@@ -13,24 +16,39 @@ def userRole(user = Depends(getCurrentUser)):
 
 router = APIRouter()
 
+def listingKeys(db: Session, *product_ids):
+    """Search and category pages filtered by min_rating depend on the products' ratings."""
+    return product_keys(*db.query(models.Product.id, models.Product.category).filter(models.Product.id.in_(product_ids)).all())
+
 @router.post("/createRating",response_model = schemas.RatingRead)
 def createRating(rating:schemas.RatingCreate,db: Session = Depends(get_db)):
     rating = models.Rating(product_id = rating.product_id,user_id = rating.user_id, rating = rating.rating)
     db.add(rating)
+    add_to_rating_stats(db, rating.product_id, rating.rating)
     db.commit()
     db.refresh(rating)
+    purge(reviews_key(rating.product_id), *listingKeys(db, rating.product_id))
     return rating
 
-@router.get("/getRatings/{product_id}",response_model = schemas.RatingRead)
-def getRatings(product_id: int, db: Session = Depends(get_db),user = Depends(userRole)):
+@router.get("/getRatings/{product_id}",response_model = list[schemas.RatingRead])
+def getRatings(product_id: int, request: Request, response: Response, db: Session = Depends(get_read_db),user = Depends(userRole)):
     if user.role != "customer" and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access denied")
-    ratings = db.query(models.Rating).filter(models.Rating.product_id == product_id).limit(10).all()
+    # Any write to the product's ratings changes the count or the newest updated_at
+    count, updated_at = db.query(func.count(models.Rating.id), func.max(models.Rating.updated_at)).filter(
+        models.Rating.product_id == product_id
+    ).one()
+    # Behind authentication: clients may revalidate, shared caches must not store
+    not_modified = conditional(request, response, make_etag("ratings", product_id, count, updated_at))
+    if not_modified:
+        db.commit()
+        return not_modified
+    ratings = db.query(models.Rating).filter(models.Rating.product_id == product_id).order_by(models.Rating.id).limit(10).all()
     db.commit()
     return ratings
 
 @router.get("/getRating/{rating_id}",response_model = schemas.RatingRead)
-def getRating(id: int,db: Session = Depends(get_db),user = Depends(userRole)):
+def getRating(id: int,db: Session = Depends(get_read_db),user = Depends(userRole)):
     if user.role != "customer" and user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="access denied")
     rating = db.query(models.Rating).filter(models.Rating.id == id).first()
@@ -46,11 +64,15 @@ def updateRating(id: int, rating_update: schemas.RatingCreate, db: Session = Dep
     rating = db.query(models.Rating).filter(models.Rating.id == id).first()
     if not rating:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Rating not found")
+    previous_product_id = rating.product_id
+    add_to_rating_stats(db, rating.product_id, rating.rating, count=-1)
     setattr(rating, "product_id", rating_update.product_id)
     setattr(rating, "user_id", rating_update.user_id)
     setattr(rating, "rating", rating_update.rating)
+    add_to_rating_stats(db, rating.product_id, rating.rating)
     db.commit()
     db.refresh(rating)
+    purge(reviews_key(previous_product_id), reviews_key(rating.product_id), *listingKeys(db, previous_product_id, rating.product_id))
     return rating
 
 @router.delete("/deleteRating/{rating_id}",response_model = schemas.RatingRead)
@@ -60,6 +82,9 @@ def deleteRating(id: int, db: Session = Depends(get_db),user = Depends(userRole)
     rating = db.query(models.Rating).filter(models.Rating.id == id).first()
     if not rating:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Rating not found")
+    keys = [reviews_key(rating.product_id), *listingKeys(db, rating.product_id)]
+    add_to_rating_stats(db, rating.product_id, rating.rating, count=-1)
     db.delete(rating)
     db.commit()
+    purge(*keys)
     return rating
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import Connection
+from typing import Literal
+from app.database import get_read_connection
+from app.schemas import schemas
+from .. import reviews
+from ..http_cache import conditional, make_etag, row_versions, reviews_key
+from ..serialization import orjson_response, rows_content
+
+router = APIRouter(tags=["reviews"])
+
+SUMMARY_COMMENTS = 5
+
+
+@router.get("/products/{product_id}/comments",response_model = schemas.CommentPage)
+def listComments(product_id: int, request: Request, response: Response, sort: Literal["recent", "helpful"] = "recent",
+                 cursor: str | None = None, limit: int = Query(reviews.DEFAULT_PAGE_SIZE, ge=1, le=reviews.MAX_PAGE_SIZE),
+                 db: Connection = Depends(get_read_connection)):
+    try:
+        rows, next_cursor = reviews.comment_page(db, product_id, sort, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    etag = make_etag("comment-page", product_id, sort, cursor, limit, *row_versions(rows))
+    not_modified = conditional(request, response, etag, [reviews_key(product_id)])
+    if not_modified:
+        return not_modified
+    return orjson_response({"items": rows_content(rows, schemas.CommentListItem), "next_cursor": next_cursor}, response)
+
+
+@router.get("/products/{product_id}/ratings",response_model = schemas.RatingPage)
+def listRatings(product_id: int, request: Request, response: Response,
+                sort: Literal["recent", "highest", "lowest"] = "recent", cursor: str | None = None,
+                limit: int = Query(reviews.DEFAULT_PAGE_SIZE, ge=1, le=reviews.MAX_PAGE_SIZE),
+                db: Connection = Depends(get_read_connection)):
+    try:
+        rows, next_cursor = reviews.rating_page(db, product_id, sort, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    etag = make_etag("rating-page", product_id, sort, cursor, limit, *row_versions(rows))
+    not_modified = conditional(request, response, etag, [reviews_key(product_id)])
+    if not_modified:
+        return not_modified
+    return orjson_response({"items": rows_content(rows, schemas.RatingListItem), "next_cursor": next_cursor}, response)
+
+
+@router.get("/products/{product_id}/reviews/summary",response_model = schemas.ReviewSummary)
+def getReviewSummary(product_id: int, request: Request, response: Response, db: Connection = Depends(get_read_connection)):
+    """Rating histogram and the newest comments, for the product page in one request."""
+    histogram = reviews.rating_histogram(db, product_id)
+    comments, next_cursor = reviews.comment_page(db, product_id, "recent", None, SUMMARY_COMMENTS)
+    etag = make_etag("review-summary", product_id, *((row.rating, row.count, row.updated_at) for row in histogram),
+                     *row_versions(comments))
+    not_modified = conditional(request, response, etag, [reviews_key(product_id)])
+    if not_modified:
+        return not_modified
+    count = sum(row.count for row in histogram)
+    return orjson_response({
+        "product_id": product_id,
+        "rating_count": count,
+        "rating_average": round(sum(row.rating * row.count for row in histogram) / count, 2) if count else None,
+        "histogram": {str(row.rating): row.count for row in histogram},
+        "latest_comments": rows_content(comments, schemas.CommentListItem),
+        "next_cursor": next_cursor,
+    }, response)
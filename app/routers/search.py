@@ -1,25 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
-from sqlalchemy.orm import Session
-from typing import Optional
-from app.database import get_db
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Request, Response
+from sqlalchemy import Connection, bindparam, select
+from typing import Annotated, Optional
+from app.database import get_read_connection
 from app.models import models
 from app.schemas import schemas
 from .Oauth2 import getCurrentUser
+from ..http_cache import conditional, make_etag, row_versions, SEARCH_KEY
+from ..serialization import schema_columns, rows_response
+from ..facets import facet_counts, filter_conditions
+import orjson
 
 
 router = APIRouter()
 
-@router.get("/searchProducts",response_model = schemas.ProductCreate)
-def searchProducts(query: str, category: Optional[str] = None, db: Session = Depends(get_db)):
-    query_stmt = db.query(models.Product).filter(models.Product.name.ilike(f"%{query}%"))
+PRODUCTS_BY_IDS = select(*schema_columns(schemas.ProductCreate, models.Product), models.Product.id).where(
+    models.Product.id.in_(bindparam("ids", expanding=True))
+)
+
+@router.get("/searchProducts",response_model = list[schemas.ProductCreate])
+def searchProducts(query: str, request: Request, response: Response, filters: Annotated[schemas.ProductFilters, Depends()], category: Optional[int] = None, db: Connection = Depends(get_read_connection)):
+    # Matches are found reading ids and versions only; the rows are loaded after the ETag check
+    query_stmt = select(models.Product.id, models.Product.updated_at).where(
+        models.Product.name.ilike(f"%{query}%"), *filter_conditions(filters)
+    )
     if category:
-        query_stmt = query_stmt.filter(models.Product.category == category)
-    products = query_stmt.limit(100).all()
-    db.commit()
-    return products
+        query_stmt = query_stmt.where(models.Product.category == category)
+    versions = db.execute(query_stmt.order_by(models.Product.id).limit(100)).all()
+    not_modified = conditional(request, response, make_etag("search", query, category, *row_versions(versions)), [SEARCH_KEY])
+    if not_modified:
+        return not_modified
+    rows = {row.id: row for row in db.execute(PRODUCTS_BY_IDS, {"ids": [row.id for row in versions]})} if versions else {}
+    products = [rows[row.id] for row in versions if row.id in rows]
+    return rows_response(products, schemas.ProductCreate, response)
+
+@router.get("/searchProducts/facets",response_model = schemas.ProductFacets)
+def searchProductFacets(request: Request, response: Response, filters: Annotated[schemas.ProductFilters, Depends()], query: Optional[str] = None, category: Optional[int] = None, db: Connection = Depends(get_read_connection)):
+    """
+    Facet counts for a search or, without `query`, a category listing.
+    Takes the same filters as the listings.
+    """
+    conditions = [models.Product.name.ilike(f"%{query}%")] if query else []
+    facets = facet_counts(db, conditions, filters, category)
+    # Counts have no cheap version to check first, so the ETag covers the body
+    not_modified = conditional(request, response, make_etag("facets", orjson.dumps(facets).decode()), [SEARCH_KEY])
+    if not_modified:
+        return not_modified
+    return facets
 
-@router.get("/getCategories",response_model = schemas.CategoryRead)
-def searchCategory(query: str, db: Session = Depends(get_db)):
-    categories = db.query(models.Category).filter(models.Category.name.ilike(f"%{query}%")).limit(10).all()
-    db.commit()
-    return categories
\ No newline at end of file
+@router.get("/getCategories",response_model = list[schemas.CategoryRead])
+def searchCategory(query: str, db: Connection = Depends(get_read_connection)):
+    categories = db.execute(select(*schema_columns(schemas.CategoryRead, models.Category)).where(
+        models.Category.name.ilike(f"%{query}%")
+    ).limit(10)).all()
+    return rows_response(categories, schemas.CategoryRead)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import models
 from app.schemas import schemas
+from ..sharding import delete_user_rows
 from ..utils import hashPassword
 from .Oauth2 import getCurrentUser  
 
@@ -21,14 +22,14 @@ def createUser(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    user = models.User(email = user.email,password = hashPassword(user.password))
+    user = models.User(email = user.email,password = hashPassword(user.password),display_name = user.display_name)
     db.add(user)
     db.commit()
     db.refresh(user)
 
     return user
 
-@router.get("/getUsers",response_model = schemas.UserCreate)
+@router.get("/getUsers",response_model = list[schemas.UserCreate])
 def getUsers(db: Session = Depends(get_db),user = Depends(UserRole)):
     if user.role != "admin":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Admin access required")
@@ -64,6 +65,8 @@ def deleteUser(user_id: int, db:Session = Depends(get_db)):
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="Access denied")
     db.delete(user)
     db.commit()
+    # The cascade only reaches the user's rows on the primary
+    delete_user_rows(db, user_id)
     return user
 
 @router.put("/updatePassword/{user_id}",response_model = schemas.UserCreate)
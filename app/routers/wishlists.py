@@ -1,9 +1,9 @@
 from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
 from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.exc import IntegrityError
 from app.models import models
 from app.schemas import schemas
-from .Oauth2 import getCurrentUser
+from .Oauth2 import getCurrentUser, getUserDb
 
 router = APIRouter()
 
@@ -13,34 +13,35 @@ def UserRole(user = Depends(getCurrentUser)):
     return user
 
 @router.post("/createWishlist",response_model = schemas.WishListRead)
-def createwishlist(wishlist: schemas.WishlistCreate,db: Session = Depends(get_db),user = Depends(UserRole)):
+def createwishlist(wishlist: schemas.WishlistCreate,user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="you need to be logged in ")
-    # Use the correct reference for Wishlist model
-    existingProduct = db.query(models.Wishlist).filter(models.Wishlist.user_id == user.id, models.Wishlist.product_id == wishlist.product_id).first()
-    if existingProduct:
-        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Product already in wishlist")
     wishlist = models.Wishlist(user_id = user.id, product_id = wishlist.product_id)
-    db.add(wishlist)
-    db.commit()
-    db.refresh(wishlist)
+    user_db.add(wishlist)
+    try:
+        user_db.commit()
+    except IntegrityError:
+        # uq_wishlist_user_product rejects duplicates
+        user_db.rollback()
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail="Product already in wishlist")
+    user_db.refresh(wishlist)
     return wishlist
 
-@router.get("/getWishlist",response_model = schemas.WishListRead)
-def getWishList(db:Session = Depends(get_db),user=Depends(UserRole)):
+@router.get("/getWishlist",response_model = list[schemas.WishListRead])
+def getWishList(user_db: Session = Depends(getUserDb),user=Depends(UserRole)):
     if user.role != "customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="you need to be logged in ")
-    wishlist = db.query(models.Wishlist).filter(models.Wishlist.user_id == user.id).all()
-    db.commit()
+    wishlist = user_db.query(models.Wishlist).filter(models.Wishlist.user_id == user.id).all()
+    user_db.commit()
     return wishlist
 
 @router.delete("/deleteWishlist/{wishlist_id}",response_model = schemas.WishListRead)
-def deleteWishlist(id: int, db: Session = Depends(get_db),user = Depends(UserRole)):
+def deleteWishlist(id: int, user_db: Session = Depends(getUserDb),user = Depends(UserRole)):
     if user.role !="customer":
         raise HTTPException(status_code = status.HTTP_403_FORBIDDEN, detail="you need to be logged in ")
-    deleteWishlist = db.query(models.Wishlist).filter(models.Wishlist.id == id, models.Wishlist.user_id == user.id).first()
+    deleteWishlist = user_db.query(models.Wishlist).filter(models.Wishlist.id == id, models.Wishlist.user_id == user.id).first()
     if not deleteWishlist:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail="Wishlist item not found")
-    db.delete(deleteWishlist)
-    db.commit()
+    user_db.delete(deleteWishlist)
+    user_db.commit()
     return deleteWishlist
\ No newline at end of file
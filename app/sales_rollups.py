@@ -0,0 +1,215 @@
+"""
+Sales rollups for the admin analytics endpoints.
+
+``sales_rollups`` holds order count, units and revenue per hour and per day,
+for three dimensions: all sales (``total``), each category, and each
+product. Reports read a few hundred rows by primary key instead of
+scanning ``orders``. A row exists only for a bucket that had sales.
+
+Celery beat runs ``apply_pending`` every ROLLUP_INTERVAL_SECONDS. It folds
+orders whose id is past the ``sales_rollups`` watermark in ``job_watermarks``
+and that are older than ORDER_SETTLE_SECONDS. Each extra shard of orders
+(app.sharding) has its own watermark, ``sales_rollups:<shard>``. Each batch of
+ROLLUP_BATCH_ORDERS order ids is added with upserts in the same
+transaction that advances the watermark, under a row lock on it. An order
+is therefore counted exactly once, however many runs overlap.
+
+Only paid orders are counted, like the verified purchases in app.reviews.
+Checkout records an order as paid when it creates it and the status never
+changes afterwards, so an order is paid or not by the time it is folded.
+Orders placed through ``/createOrder`` stay pending and are left out.
+
+Every order is counted as it was recorded at creation. A product is counted
+under the category it has when its order is rolled up. Deleted orders stay
+in the rollups until a rebuild::
+
+    python -m app.sales_rollups rebuild                     # from scratch
+    python -m app.sales_rollups rebuild --since 2026-09-01  # re-fold days from a date
+    python -m app.sales_rollups catch-up
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import models
+from app.sharding import session_on, shard_count
+import argparse
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+ROLLUP_BATCH_ORDERS = int(os.getenv("ROLLUP_BATCH_ORDERS", "5000"))
+# Orders younger than this may still have uncommitted neighbours with lower ids
+ORDER_SETTLE_SECONDS = 60
+WATERMARK = "sales_rollups"
+PAID = "paid"
+
+PERIODS = ("hour", "day")
+TOTAL, CATEGORY, PRODUCT = "total", "category", "product"
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def bucket_start(at: datetime, period: str) -> datetime:
+    if period == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _watermark_name(shard: int) -> str:
+    return WATERMARK if shard == 0 else f"{WATERMARK}:{shard}"
+
+
+def _lock_watermark(db: Session, shard: int = 0):
+    """The shard's watermark row, locked until the transaction ends; created on first use."""
+    name = _watermark_name(shard)
+    query = db.query(models.JobWatermark).filter(models.JobWatermark.name == name).with_for_update()
+    watermark = query.first()
+    if watermark is None:
+        try:
+            with db.begin_nested():
+                db.add(models.JobWatermark(name=name, value=0))
+        except IntegrityError:
+            pass
+        watermark = query.one()
+    return watermark
+
+
+def _fold(db: Session, order_db: Session, after: int, upto: int, since: datetime | None = None) -> int:
+    """Adds the lines of paid orders ``after < order_id <= upto`` (placed from `since`) on `order_db`'s shard to the rollups."""
+    query = order_db.query(
+        models.OrderItem.order_id, models.Order.created_at, models.OrderItem.product_id,
+        models.OrderItem.quantity, models.OrderItem.unit_price,
+    ).join(models.Order, models.Order.order_id == models.OrderItem.order_id).filter(
+        models.OrderItem.order_id > after, models.OrderItem.order_id <= upto, models.Order.payment_status == PAID
+    )
+    if since is not None:
+        query = query.filter(models.Order.created_at >= since)
+    order_lines = query.all()
+    # Products are on the primary, orders may be on a shard (app.sharding)
+    categories = dict(db.query(models.Product.id, models.Product.category).filter(
+        models.Product.id.in_({line.product_id for line in order_lines})
+    ).all())
+
+    totals: dict[tuple, list] = {}
+    orders_seen: set[tuple] = set()
+    for order_id, created_at, product_id, quantity, unit_price in order_lines:
+        category_id = categories.get(product_id)
+        for period in PERIODS:
+            bucket = bucket_start(created_at, period)
+            for dimension, entity_id in ((TOTAL, 0), (CATEGORY, category_id or 0), (PRODUCT, product_id)):
+                key = (period, dimension, entity_id, bucket)
+                row = totals.get(key)
+                if row is None:
+                    row = totals[key] = [category_id if dimension == PRODUCT else None, 0, 0, 0]
+                if (key, order_id) not in orders_seen:
+                    orders_seen.add((key, order_id))
+                    row[1] += 1
+                row[2] += quantity
+                row[3] += quantity * unit_price
+    if totals:
+        Rollup = models.SalesRollup
+        statement = _UPSERTS[db.bind.dialect.name](Rollup)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Rollup.period, Rollup.dimension, Rollup.entity_id, Rollup.bucket_start],
+            set_={
+                "category_id": statement.excluded.category_id,
+                "orders": Rollup.orders + statement.excluded.orders,
+                "units": Rollup.units + statement.excluded.units,
+                "revenue": Rollup.revenue + statement.excluded.revenue,
+            },
+        )
+        db.execute(statement, [
+            {"period": period, "dimension": dimension, "entity_id": entity_id, "bucket_start": bucket,
+             "category_id": category_id, "orders": orders, "units": units, "revenue": revenue}
+            for (period, dimension, entity_id, bucket), (category_id, orders, units, revenue) in totals.items()
+        ])
+    return len(order_lines)
+
+
+def _apply_shard(db: Session, shard: int, batch_orders: int) -> dict:
+    settled = datetime.utcnow() - timedelta(seconds=ORDER_SETTLE_SECONDS)
+    with session_on(db, shard) as order_db:
+        start = _lock_watermark(db, shard).value
+        upto = order_db.query(func.max(models.Order.order_id)).filter(
+            models.Order.order_id > start, models.Order.created_at < settled
+        ).scalar()
+        db.commit()
+        lines = 0
+        while upto is not None:
+            watermark = _lock_watermark(db, shard)
+            if watermark.value >= upto:
+                db.commit()
+                break
+            batch_upto = min(watermark.value + batch_orders, upto)
+            lines += _fold(db, order_db, watermark.value, batch_upto)
+            watermark.value = batch_upto
+            db.commit()
+    return {"shard": shard, "orders_after": start, "orders_upto": upto, "lines": lines}
+
+
+def apply_pending(db: Session, batch_orders: int = ROLLUP_BATCH_ORDERS) -> dict:
+    """Folds settled orders past each shard's watermark, one transaction per batch of order ids."""
+    shards = [_apply_shard(db, shard, batch_orders) for shard in range(shard_count())]
+    return {"lines": sum(shard["lines"] for shard in shards), "shards": shards}
+
+
+def rebuild(db: Session, since: date | None = None, batch_orders: int = ROLLUP_BATCH_ORDERS) -> dict:
+    """
+    Recomputes the rollups from the order history: all of it, or the days
+    from `since` on up to each shard's watermark. Run apply_pending
+    afterwards (the CLI does) to fold anything newer.
+    """
+    Rollup = models.SalesRollup
+    watermarks = [_lock_watermark(db, shard) for shard in range(shard_count())]
+    if since is None:
+        db.query(Rollup).delete(synchronize_session=False)
+        for watermark in watermarks:
+            watermark.value = 0
+        db.commit()
+        return apply_pending(db, batch_orders)
+    since_at = datetime.combine(since, datetime.min.time())
+    db.query(Rollup).filter(Rollup.bucket_start >= since_at).delete(synchronize_session=False)
+    uptos = [watermark.value for watermark in watermarks]
+    db.commit()
+    shards = []
+    for shard, upto in enumerate(uptos):
+        with session_on(db, shard) as order_db:
+            first = order_db.query(func.min(models.Order.order_id)).filter(
+                models.Order.created_at >= since_at, models.Order.order_id <= upto
+            ).scalar()
+            lines = 0
+            after = (first or upto + 1) - 1
+            while after < upto:
+                batch_upto = min(after + batch_orders, upto)
+                lines += _fold(db, order_db, after, batch_upto, since_at)
+                db.commit()
+                after = batch_upto
+        shards.append({"shard": shard, "orders_after": (first or upto + 1) - 1, "orders_upto": upto, "lines": lines})
+    return {"lines": sum(shard["lines"] for shard in shards), "shards": shards}
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Sales rollup maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_command = subcommands.add_parser("rebuild", help="Recompute the rollups from the order history")
+    rebuild_command.add_argument("--since", type=date.fromisoformat, help="Only recompute days from this date (YYYY-MM-DD)")
+    subcommands.add_parser("catch-up", help="Fold orders placed since the last run")
+    parser.add_argument("--batch-orders", type=int, default=ROLLUP_BATCH_ORDERS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(rebuild(db, args.since, args.batch_orders))
+        print(apply_pending(db, args.batch_orders))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
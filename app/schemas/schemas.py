@@ -1,10 +1,12 @@
 from fastapi import FastAPI
 from pydantic import BaseModel, Field 
+from datetime import datetime
 
 
 class UserBase(BaseModel):
     email: str
     password: str = Field(..., min_length=3, max_length=128)
+    display_name: str | None = Field(None, max_length=64)
 
 class UserCreate(UserBase):
     pass
@@ -13,11 +15,12 @@ class UserCreate(UserBase):
         from_attributes = True
 
 class ProductBase(BaseModel):
+    sku: str | None = None
     name: str
     description: str
     price: int
     image_url: str
-    category: str
+    category: int | None = None
     stock: int
 
 class ProductCreate(ProductBase):
@@ -26,19 +29,32 @@ class ProductCreate(ProductBase):
     class Config:
         from_attributes = True
 
-class OrderCreate(BaseModel):
-    user_id: int
+class OrderItemCreate(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(..., gt=0)
+
+class OrderItemRead(OrderItemCreate):
+    id: int
+    unit_price: int
+
+    class Config:
+        from_attributes = True
+
+class OrderCreate(BaseModel):
     address: str
-    
+    items: list[OrderItemCreate] = Field(..., min_length=1)
 
-class OrderRead(OrderCreate):
+class OrderUpdate(BaseModel):
+    address: str
+
+class OrderRead(BaseModel):
     order_id: int
     user_id: int
-    product_id: int
-    quantity: int
     address: str
+    payment_status: str | None = None
+    total_amount: int | None = None
+    created_at: datetime
+    items: list[OrderItemRead]
 
     class Config:
         from_attributes = True
@@ -79,7 +95,8 @@ class CommentRead(BaseModel):
     id: int
     product_id: int 
     user_id: int
-    content: str
+    comment: str | None = None
+    helpful_count: int = 0
 
     class Config:
       from_attributes = True
@@ -138,6 +155,7 @@ class CheckoutSessionResponse(BaseModel):
 
 class PaymentSuccessResponse(BaseModel):
     message: str
+    order_id: int
     orders_count: int
     total_amount: int
 
@@ -154,4 +172,125 @@ class ProductSuggestionResponse(BaseModel):
     stock: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class RelatedProduct(BaseModel):
+    id: int
+    name: str
+    price: int
+    image_url: str | None = None
+    score: float
+
+class ProductImportRow(BaseModel):
+    sku: str = Field(..., min_length=1, max_length=64)
+    name: str = Field(..., min_length=1)
+    description: str = ""
+    price: int = Field(..., ge=0)
+    image_url: str = ""
+    category: int | None = None
+    stock: int = Field(..., ge=0)
+
+class ProductImportError(BaseModel):
+    row: int
+    sku: str | None = None
+    error: str
+
+class ProductImportResult(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    errors: list[ProductImportError]
+    seconds: float
+
+class StockPriceChange(BaseModel):
+    product_id: int
+    stock_delta: int = 0
+    price: int | None = Field(None, ge=0)
+
+class BulkStockPriceUpdate(BaseModel):
+    changes: list[StockPriceChange] = Field(..., min_length=1, max_length=10_000)
+
+class BulkUpdateRejection(BaseModel):
+    product_id: int
+    reason: str
+
+class BulkStockPriceResult(BaseModel):
+    updated: int
+    rejected: list[BulkUpdateRejection]
+
+class ReviewAuthor(BaseModel):
+    author_id: int
+    author_name: str
+    verified_purchase: bool
+
+class CommentListItem(ReviewAuthor):
+    id: int
+    comment: str | None = None
+    helpful_count: int
+    updated_at: datetime
+
+class RatingListItem(ReviewAuthor):
+    id: int
+    rating: int
+    updated_at: datetime
+
+class CommentPage(BaseModel):
+    items: list[CommentListItem]
+    next_cursor: str | None = None
+
+class RatingPage(BaseModel):
+    items: list[RatingListItem]
+    next_cursor: str | None = None
+
+class ReviewSummary(BaseModel):
+    product_id: int
+    rating_count: int
+    rating_average: float | None = None
+    histogram: dict[int, int]
+    latest_comments: list[CommentListItem]
+    next_cursor: str | None = None
+
+class ProductFilters(BaseModel):
+    min_price: int | None = Field(None, ge=0)
+    max_price: int | None = Field(None, ge=0)
+    in_stock: bool = False
+    min_rating: int | None = Field(None, ge=1, le=5)
+
+class CategoryFacet(BaseModel):
+    category: int | None = None
+    count: int
+
+class PriceFacet(BaseModel):
+    min_price: int
+    max_price: int | None = None
+    count: int
+
+class RatingFacet(BaseModel):
+    min_rating: int
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    in_stock: int
+    categories: list[CategoryFacet]
+    prices: list[PriceFacet]
+    ratings: list[RatingFacet]
+
+class SalesBucket(BaseModel):
+    bucket_start: datetime
+    orders: int
+    units: int
+    revenue: int
+
+class SalesSeries(BaseModel):
+    period: str
+    start: datetime
+    end: datetime
+    buckets: list[SalesBucket]
+
+class SalesRanking(BaseModel):
+    entity_id: int
+    category_id: int | None = None
+    orders: int
+    units: int
+    revenue: int
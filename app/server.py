@@ -0,0 +1,146 @@
+"""
+Production runner: pre-forked uvicorn workers sharing preloaded code.
+
+The parent imports the app once, fills the shared caches (app.warmup), binds
+the listening socket and forks WEB_CONCURRENCY workers. The workers share
+the parent's loaded modules copy-on-write; ``gc.freeze()`` keeps the
+collector from touching those pages. Each worker runs its own warm-up in the
+lifespan startup before it accepts from the socket. A worker that dies is
+replaced.
+
+On SIGTERM or SIGINT the parent marks every worker as draining, so
+``/health/ready`` answers 503. After SERVER_DRAIN_DELAY_SECONDS it passes
+SIGTERM on: each worker stops accepting, finishes its in-flight requests
+within SERVER_GRACEFUL_TIMEOUT_SECONDS and exits. Workers still running
+after that are killed. The orchestrator's grace period must cover both::
+
+    python -m app.server --host 0.0.0.0 --port 8000 --workers 4
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import time
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# Time for the load balancer to see the failing readiness check before workers stop
+# accepting; keep it at least one health-check interval (10s by default on Kubernetes)
+SERVER_DRAIN_DELAY_SECONDS = float(os.getenv("SERVER_DRAIN_DELAY_SECONDS", "10"))
+SERVER_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "20"))
+# A worker exiting sooner than this after its start counts as a failed boot
+WORKER_MIN_UPTIME_SECONDS = 5
+KILL_MARGIN_SECONDS = 5
+
+
+def _spawn(config: uvicorn.Config, sock) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        gc.enable()
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker %s crashed", os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _reap(workers: dict[int, float]) -> list[tuple[int, float]]:
+    """Removes exited workers and returns them with their uptime."""
+    exited = []
+    while workers:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        started = workers.pop(pid, None)
+        if started is not None:
+            exited.append((pid, time.monotonic() - started))
+    return exited
+
+
+def serve(host: str, port: int, workers: int, warm_caches: bool = True) -> None:
+    # Collect nothing while the app loads; what it allocates is frozen before forking
+    gc.disable()
+    from app.main import app
+    from app.database import SessionLocal, dispose_engine
+    from app.warmup import warm_shared_caches
+    from app import health
+
+    if warm_caches:
+        db = SessionLocal()
+        try:
+            logger.info("Shared caches warmed: %s", warm_shared_caches(db))
+        except Exception:
+            logger.exception("Shared cache warm-up failed")
+        finally:
+            db.close()
+    # Workers must not inherit the parent's pooled connections
+    dispose_engine()
+
+    config = uvicorn.Config(app, host=host, port=port, lifespan="on",
+                            timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT_SECONDS)
+    sock = config.bind_socket()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    gc.freeze()
+
+    running: dict[int, float] = {}
+    failed_boots = 0
+    while not stopping:
+        while len(running) < workers and not stopping:
+            running[_spawn(config, sock)] = time.monotonic()
+        for pid, uptime in _reap(running):
+            logger.warning("Worker %s exited after %.1fs; replacing it", pid, uptime)
+            failed_boots = failed_boots + 1 if uptime < WORKER_MIN_UPTIME_SECONDS else 0
+        # Back off while workers keep failing to boot, e.g. on a bad setting
+        time.sleep(min(0.5 * 2 ** failed_boots, 5))
+
+    health.start_draining()
+    time.sleep(SERVER_DRAIN_DELAY_SECONDS)
+    for pid in running:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT_SECONDS + KILL_MARGIN_SECONDS
+    while running and time.monotonic() < deadline:
+        _reap(running)
+        time.sleep(0.1)
+    for pid in running:
+        logger.warning("Worker %s did not drain in time; killing it", pid)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-forking API server")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--no-warm-caches", dest="warm_caches", action="store_false",
+                        help="Skip filling the shared caches before forking")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+    serve(args.host, args.port, max(1, args.workers), args.warm_caches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Per-user data sharded by user_id.
+
+Carts, wishlists and orders (with their lines) belong to one user and are
+reached through that user, so they can be spread over several databases.
+Catalog tables, users, reviews, stock reservations and everything derived
+from orders stay on the primary (``DATABASE_URL``).
+
+A user's bucket is ``user_id % SHARD_BUCKETS``. The ``shard_buckets`` table on
+the primary maps buckets to shards, and a bucket without a row is on shard 0:
+the primary itself. Extra shards are listed in SHARD_DATABASE_URLS and
+numbered from 1. Listing one moves nothing until the rebalance tool gives it
+buckets. Work on shard 0 shares the caller's session, so without extra
+shards everything runs in one transaction as before.
+
+A write that spans a shard and the primary, such as an order taking stock,
+commits the two databases one after the other (commit_pair).
+
+Rebalancing moves one bucket at a time. The bucket is marked moving, and
+after the map TTL every process refuses writes for its users with 503; reads
+still go to the old shard. The rows are then copied with their ids, the map
+is pointed at the new shard, and the old rows are deleted::
+
+    python -m app.sharding create-schema    # sharded tables on the extra shards
+    python -m app.sharding status
+    python -m app.sharding rebalance [--dry-run] [--max-moves N]
+
+On PostgreSQL, create-schema makes the id sequences of shard k step by
+SHARD_ID_STRIDE from an offset of k, so moved rows never collide. Elsewhere a
+move that would collide fails and the bucket stays where it was. Jobs that
+read orders incrementally keep a watermark per shard. Moved orders can be
+counted again on their new shard, so rebuild the sales rollups and the
+co-occurrence matrix after a rebalance.
+"""
+from contextlib import contextmanager
+from sqlalchemy import MetaData, delete, func, insert, select, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.database import SHARD_DATABASE_URLS, get_engine, get_shard_engine
+from app.models import models
+import argparse
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHARD_BUCKETS = int(os.getenv("SHARD_BUCKETS", "1024"))
+SHARD_MAP_TTL_SECONDS = float(os.getenv("SHARD_MAP_TTL_SECONDS", "5"))
+# Most shards there can ever be: on PostgreSQL, ids on shard k are k modulo this
+SHARD_ID_STRIDE = 64
+# Ids left free above the highest one in use when sequences are re-based
+SEQUENCE_HEADROOM = 100_000
+MOVE_BATCH_ROWS = 1000
+# Parents first, so copied order lines always find their order
+SHARDED_MODELS = (models.Cart, models.Wishlist, models.Order, models.OrderItem)
+
+
+class BucketMoving(Exception):
+    """The user's rows are being copied to another shard; retry shortly."""
+
+
+_map: dict[int, tuple[int, bool]] = {}
+_map_expires = float("-inf")
+_map_lock = threading.Lock()
+
+
+def shard_count() -> int:
+    return 1 + len(SHARD_DATABASE_URLS)
+
+
+def bucket_of(user_id: int) -> int:
+    # User ids are sequential, so the remainder spreads them evenly, and SQL can filter on it
+    return user_id % SHARD_BUCKETS
+
+
+def bucket_map() -> dict[int, tuple[int, bool]]:
+    """``bucket -> (shard, moving)`` for the mapped buckets, reloaded every SHARD_MAP_TTL_SECONDS."""
+    global _map, _map_expires
+    if not SHARD_DATABASE_URLS:
+        return {}
+    if time.monotonic() >= _map_expires:
+        with _map_lock:
+            if time.monotonic() >= _map_expires:
+                Bucket = models.ShardBucket
+                with get_engine().connect() as connection:
+                    rows = connection.execute(select(Bucket.bucket, Bucket.shard, Bucket.moving)).all()
+                _map = {bucket: (shard, moving) for bucket, shard, moving in rows}
+                _map_expires = time.monotonic() + SHARD_MAP_TTL_SECONDS
+    return _map
+
+
+def forget_map() -> None:
+    global _map_expires
+    _map_expires = float("-inf")
+
+
+def shard_for(user_id: int, writing: bool = True) -> int:
+    """The shard holding `user_id`'s rows. Raises BucketMoving for a write while the bucket is copied."""
+    shard, moving = bucket_map().get(bucket_of(user_id), (0, False))
+    if moving and writing:
+        raise BucketMoving(f"Bucket {bucket_of(user_id)} is moving off shard {shard}")
+    return shard
+
+
+def shards_of(user_ids) -> dict[int, list[int]]:
+    """`user_ids` grouped by the shard they are read from."""
+    grouped: dict[int, list[int]] = {}
+    for user_id in set(user_ids):
+        grouped.setdefault(shard_for(user_id, writing=False), []).append(user_id)
+    return grouped
+
+
+@contextmanager
+def session_on(db, shard: int):
+    """A session on `shard`: `db` itself for shard 0, otherwise a new one, closed on exit."""
+    if shard == 0:
+        yield db
+        return
+    session = Session(bind=get_shard_engine(shard), autoflush=False)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def user_session(db, user_id: int, writing: bool = True):
+    return session_on(db, shard_for(user_id, writing))
+
+
+def commit_pair(first: Session, second: Session, undo=None) -> None:
+    """
+    Commits `first`, then `second`; one commit when they are the same
+    session. If the second commit fails, `undo` reverts the first
+    database's changes in a new transaction and the error is re-raised.
+    """
+    first.commit()
+    if second is first:
+        return
+    try:
+        second.commit()
+    except SQLAlchemyError:
+        second.rollback()
+        if undo is not None:
+            undo()
+            first.commit()
+        raise
+
+
+def _owned_by(model, condition):
+    """WHERE clause for the rows of `model` whose user matches `condition(user_id column)`."""
+    if model is models.OrderItem:
+        return models.OrderItem.order_id.in_(select(models.Order.order_id).where(condition(models.Order.user_id)))
+    return condition(model.user_id)
+
+
+def delete_user_rows(db: Session, user_id: int) -> None:
+    """
+    Deletes a user's rows on their shard. On shard 0 the ORM cascades from
+    the user delete them, so this only matters elsewhere.
+    """
+    shard = shard_for(user_id, writing=False)
+    if shard == 0:
+        return
+    with session_on(db, shard) as shard_db:
+        for model in reversed(SHARDED_MODELS):
+            shard_db.execute(delete(model.__table__).where(_owned_by(model, lambda column: column == user_id)))
+        shard_db.commit()
+
+
+def shard_metadata() -> MetaData:
+    """The sharded tables, minus foreign keys to tables that stay on the primary."""
+    metadata = MetaData()
+    names = {model.__tablename__ for model in SHARDED_MODELS}
+    for model in SHARDED_MODELS:
+        table = model.__table__.to_metadata(metadata)
+        for constraint in list(table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] in names:
+                continue
+            table.constraints.discard(constraint)
+            for element in constraint.elements:
+                element.parent.foreign_keys.discard(element)
+                table.foreign_keys.discard(element)
+    return metadata
+
+
+def interleave_ids() -> list[str]:
+    """
+    PostgreSQL only: restarts the id sequences of shard k at the next id
+    above every shard's highest that is k modulo SHARD_ID_STRIDE, stepping by
+    SHARD_ID_STRIDE. Returns the sequences changed.
+    """
+    changed = []
+    for model in SHARDED_MODELS:
+        table = model.__table__
+        key = list(table.primary_key.columns)[0]
+        highest = 0
+        for shard in range(shard_count()):
+            with get_shard_engine(shard).connect() as connection:
+                highest = max(highest, connection.execute(select(func.max(key))).scalar() or 0)
+        base = (highest + SEQUENCE_HEADROOM) // SHARD_ID_STRIDE * SHARD_ID_STRIDE + SHARD_ID_STRIDE
+        for shard in range(shard_count()):
+            engine = get_shard_engine(shard)
+            if engine.dialect.name != "postgresql":
+                continue
+            with engine.begin() as connection:
+                sequence = connection.execute(
+                    text("SELECT pg_get_serial_sequence(:table, :column)"), {"table": table.name, "column": key.name}
+                ).scalar()
+                connection.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE} RESTART WITH {base + shard}"))
+            changed.append(f"shard {shard}: {sequence}")
+    return changed
+
+
+def create_schema() -> list[str]:
+    """Creates the sharded tables on every extra shard and interleaves the id sequences."""
+    metadata = shard_metadata()
+    for shard in range(1, shard_count()):
+        metadata.create_all(get_shard_engine(shard))
+    return interleave_ids()
+
+
+def status(db: Session) -> list[dict]:
+    """Buckets and rows per shard."""
+    buckets = {shard: 0 for shard in range(shard_count())}
+    for bucket in range(SHARD_BUCKETS):
+        shard, _ = bucket_map().get(bucket, (0, False))
+        buckets[shard] = buckets.get(shard, 0) + 1
+    report = []
+    for shard in range(shard_count()):
+        with session_on(db, shard) as shard_db:
+            rows = {model.__tablename__: shard_db.execute(select(func.count()).select_from(model)).scalar()
+                    for model in SHARDED_MODELS}
+        report.append({"shard": shard, "buckets": buckets.get(shard, 0), **rows})
+    return report
+
+
+def plan_moves(current: dict[int, int], shards: int) -> list[tuple[int, int, int]]:
+    """``(bucket, source, target)`` moves that give every shard an even share of buckets, moving as few as possible."""
+    owned: dict[int, list[int]] = {shard: [] for shard in range(shards)}
+    for bucket in range(SHARD_BUCKETS):
+        owned.setdefault(current.get(bucket, 0), []).append(bucket)
+    quota = {shard: SHARD_BUCKETS // shards + (shard < SHARD_BUCKETS % shards) for shard in range(shards)}
+    surplus = []
+    for shard, buckets in owned.items():
+        extra = len(buckets) - quota.get(shard, 0)
+        if extra > 0:
+            surplus.extend((bucket, shard) for bucket in buckets[-extra:])
+    moves = []
+    for shard in range(shards):
+        for _ in range(quota[shard] - len(owned[shard])):
+            bucket, source = surplus.pop()
+            moves.append((bucket, source, shard))
+    return moves
+
+
+def _set_bucket(db: Session, bucket: int, shard: int, moving: bool) -> None:
+    row = db.get(models.ShardBucket, bucket)
+    if row is None:
+        db.add(models.ShardBucket(bucket=bucket, shard=shard, moving=moving))
+    else:
+        row.shard = shard
+        row.moving = moving
+    db.commit()
+
+
+def move_bucket(db: Session, bucket: int, source: int, target: int, settle_seconds: float) -> int:
+    """
+    Moves a bucket's rows from `source` to `target` and returns how many were
+    copied. `settle_seconds` must cover the map TTL plus requests in flight.
+    """
+    in_bucket = lambda column: column % SHARD_BUCKETS == bucket  # noqa: E731
+    _set_bucket(db, bucket, source, True)
+    time.sleep(settle_seconds)
+    copied = 0
+    with session_on(db, source) as source_db, session_on(db, target) as target_db:
+        try:
+            for model in SHARDED_MODELS:
+                table = model.__table__
+                key = list(table.primary_key.columns)[0]
+                query = select(table).where(_owned_by(model, in_bucket)).order_by(key).limit(MOVE_BATCH_ROWS)
+                after = None
+                while True:
+                    rows = source_db.execute(query if after is None else query.where(key > after)).mappings().all()
+                    if not rows:
+                        break
+                    target_db.execute(insert(table), [dict(row) for row in rows])
+                    copied += len(rows)
+                    after = rows[-1][key.name]
+            target_db.commit()
+        except IntegrityError:
+            target_db.rollback()
+            _set_bucket(db, bucket, source, False)
+            raise
+    _set_bucket(db, bucket, target, False)
+    # Until every process has seen the new shard, reads may still go to the old rows
+    time.sleep(settle_seconds)
+    with session_on(db, source) as source_db:
+        for model in reversed(SHARDED_MODELS):
+            source_db.execute(delete(model.__table__).where(_owned_by(model, in_bucket)))
+        source_db.commit()
+    forget_map()
+    return copied
+
+
+def rebalance(db: Session, max_moves: int | None = None, settle_seconds: float = SHARD_MAP_TTL_SECONDS + 5,
+              dry_run: bool = False) -> list[dict]:
+    """Evens out buckets over the configured shards, one bucket at a time."""
+    forget_map()
+    current = {bucket: shard for bucket, (shard, _) in bucket_map().items()}
+    moves = plan_moves(current, shard_count())[:max_moves]
+    done = []
+    for bucket, source, target in moves:
+        rows = 0 if dry_run else move_bucket(db, bucket, source, target, settle_seconds)
+        done.append({"bucket": bucket, "from": source, "to": target, "rows": rows})
+        print(done[-1])
+    return done
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Shard maintenance for carts, wishlists and orders")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("create-schema", help="Create the sharded tables on every extra shard")
+    subcommands.add_parser("status", help="Buckets and rows per shard")
+    rebalance_command = subcommands.add_parser("rebalance", help="Move buckets until the shards are even")
+    rebalance_command.add_argument("--dry-run", action="store_true", help="Only print the moves")
+    rebalance_command.add_argument("--max-moves", type=int, help="Stop after this many buckets")
+    rebalance_command.add_argument("--settle-seconds", type=float, default=SHARD_MAP_TTL_SECONDS + 5,
+                                   help="Wait after each map change; must exceed SHARD_MAP_TTL_SECONDS")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "create-schema":
+            for change in create_schema():
+                print("Interleaved", change)
+        elif args.command == "status":
+            for row in status(db):
+                print(row)
+        else:
+            moves = rebalance(db, args.max_moves, args.settle_seconds, args.dry_run)
+            if moves and not args.dry_run:
+                print("Rebuild the order-derived data: python -m app.sales_rollups rebuild; "
+                      "python -m app.recommendations build --full")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
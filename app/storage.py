@@ -0,0 +1,215 @@
+"""
+Content-addressed storage for uploaded product images.
+
+Every blob is stored once under its SHA-256 digest and served from
+``/images/<digest>``. Products hold references to blobs through their
+``image_url``; the ``image_blobs`` table keeps a reference count per digest so
+unreferenced blobs can be garbage collected with::
+
+    python -m app.storage gc --grace 3600
+"""
+from fastapi import UploadFile, HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from app.models import models
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+IMAGE_URL_PREFIX = "/images/"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(_DIGEST_RE.match(digest))
+
+
+def blob_path(digest: str) -> str:
+    # Fan out into two directory levels so no single directory grows unbounded
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], digest)
+
+
+def image_url(digest: str) -> str:
+    return f"{IMAGE_URL_PREFIX}{digest}"
+
+
+def digest_from_url(url: str | None) -> str | None:
+    """
+    Returns the blob digest referenced by an image URL, or None for URLs that
+    do not point into this store (external URLs, legacy upload paths).
+    """
+    if not url or not url.startswith(IMAGE_URL_PREFIX):
+        return None
+    digest = url[len(IMAGE_URL_PREFIX):]
+    return digest if is_valid_digest(digest) else None
+
+
+def _hash_upload(file: UploadFile) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    file.file.seek(0)
+    while chunk := file.file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+        hasher.update(chunk)
+    return hasher.hexdigest(), size
+
+
+def _write_blob(file: UploadFile, digest: str) -> None:
+    path = blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        file.file.seek(0)
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := file.file.read(CHUNK_SIZE):
+                buffer.write(chunk)
+        # Atomic publish: readers only ever see complete blobs
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _increment_ref(db: Session, digest: str, content_type: str, size: int) -> None:
+    updated = db.query(models.ImageBlob).filter(models.ImageBlob.digest == digest).update(
+        {models.ImageBlob.ref_count: models.ImageBlob.ref_count + 1}, synchronize_session=False
+    )
+    if updated:
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.ImageBlob(digest=digest, content_type=content_type, size=size, ref_count=1))
+    except IntegrityError:
+        # Another upload of the same content inserted the row first
+        db.query(models.ImageBlob).filter(models.ImageBlob.digest == digest).update(
+            {models.ImageBlob.ref_count: models.ImageBlob.ref_count + 1}, synchronize_session=False
+        )
+
+
+def save_image(file: UploadFile, db: Session) -> str:
+    """
+    Stores an uploaded image by content hash and returns its URL.
+
+    The digest is computed while streaming the upload, so a duplicate resolves
+    to the existing blob without writing it again. The blob reference is added
+    to the caller's transaction and becomes durable with its commit.
+    """
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Uploaded file must be an image")
+    digest, size = _hash_upload(file)
+    # Reference first: gc unlinks a file only while holding the deleted row, so
+    # this waits for it and the check below then sees the file gone
+    _increment_ref(db, digest, file.content_type, size)
+    path = blob_path(digest)
+    if os.path.exists(path):
+        # Refresh mtime so a concurrent gc run keeps the blob inside its grace window
+        os.utime(path)
+    else:
+        _write_blob(file, digest)
+    return image_url(digest)
+
+
+def acquire_image(db: Session, url: str | None) -> None:
+    """Adds a reference for an image URL that points at an existing blob."""
+    digest = digest_from_url(url)
+    if digest is None:
+        return
+    db.query(models.ImageBlob).filter(models.ImageBlob.digest == digest).update(
+        {models.ImageBlob.ref_count: models.ImageBlob.ref_count + 1}, synchronize_session=False
+    )
+
+
+def release_image(db: Session, url: str | None) -> None:
+    """Drops a reference; the blob is removed by the next gc run once unreferenced."""
+    digest = digest_from_url(url)
+    if digest is None:
+        return
+    db.query(models.ImageBlob).filter(
+        models.ImageBlob.digest == digest, models.ImageBlob.ref_count > 0
+    ).update({models.ImageBlob.ref_count: models.ImageBlob.ref_count - 1}, synchronize_session=False)
+
+
+def _is_stale(path: str, cutoff: float) -> bool:
+    try:
+        return os.path.getmtime(path) < cutoff
+    except FileNotFoundError:
+        return True
+
+
+def collect_garbage(db: Session, grace_seconds: int = 3600) -> int:
+    """
+    Deletes unreferenced blobs and orphaned files older than the grace period.
+    Returns the number of files removed.
+    """
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    digests = [row[0] for row in db.query(models.ImageBlob.digest).filter(models.ImageBlob.ref_count <= 0).all()]
+    for digest in digests:
+        path = blob_path(digest)
+        if not _is_stale(path, cutoff):
+            continue
+        # Conditional delete: a concurrent upload may have re-referenced the
+        # blob. The file goes before the commit, while the row is still locked,
+        # so an upload re-adding the blob waits and then writes the file again.
+        deleted = db.query(models.ImageBlob).filter(
+            models.ImageBlob.digest == digest, models.ImageBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if deleted and os.path.exists(path):
+            os.remove(path)
+            removed += 1
+        db.commit()
+
+    # Files without a row: uploads whose transaction rolled back, or interrupted writes
+    if os.path.isdir(UPLOAD_DIR):
+        known = None
+        for root, _dirs, files in os.walk(UPLOAD_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                if not _is_stale(path, cutoff):
+                    continue
+                if name.startswith(".tmp-"):
+                    os.remove(path)
+                    removed += 1
+                    continue
+                if not is_valid_digest(name):
+                    continue
+                if known is None:
+                    known = {row[0] for row in db.query(models.ImageBlob.digest).all()}
+                if name not in known:
+                    os.remove(path)
+                    removed += 1
+    return removed
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Image blob store maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    gc_parser = subcommands.add_parser("gc", help="Remove unreferenced image blobs")
+    gc_parser.add_argument("--grace", type=int, default=3600, help="Keep blobs touched within this many seconds")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        removed = collect_garbage(db, grace_seconds=args.grace)
+    finally:
+        db.close()
+    print(f"Removed {removed} image blob(s)")
+
+
+if __name__ == "__main__":
+    main()
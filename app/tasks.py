@@ -1,5 +1,10 @@
 from app.celery_app import celery_app
+from app.database import SessionLocal
+from app import inventory, purchase_profile, wishlist_alerts, category_listings, sales_rollups
+from app.sharding import BucketMoving
+from app.telemetry import time_external
 import smtplib
+import urllib.request
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
@@ -34,10 +39,145 @@ def send_email(subject: str, email_to: str, body: str):
     msg.attach(MIMEText(body, 'html'))  
     
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        server.sendmail(MAIL_FROM, email_to, msg.as_string())
-        server.quit()
+        with time_external("smtp", "sendmail"):
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            server.starttls()
+            server.login(MAIL_USERNAME, MAIL_PASSWORD)
+            server.sendmail(MAIL_FROM, email_to, msg.as_string())
+            server.quit()
     except Exception as e:
-        print(f"Email send failed: {e}") 
\ No newline at end of file
+        print(f"Email send failed: {e}")
+
+
+@celery_app.task
+def release_expired_reservations():
+    """
+    Returns stock held by checkout sessions that expired without payment.
+    Scheduled by celery beat.
+    """
+    db = SessionLocal()
+    try:
+        return inventory.release_expired_reservations(db)
+    finally:
+        db.close()
+
+
+@celery_app.task(autoretry_for=(BucketMoving,), retry_backoff=True, max_retries=5)
+def refresh_purchase_profile(order_id: int, user_id: int | None = None):
+    """
+    Folds a new order into the user's category affinity and product popularity.
+    """
+    db = SessionLocal()
+    try:
+        return purchase_profile.apply_order(db, order_id, user_id)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def refresh_pending_purchase_profiles():
+    """
+    Catches up on orders whose profile update was lost. Scheduled by celery beat.
+    """
+    db = SessionLocal()
+    try:
+        return purchase_profile.apply_pending(db)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def build_recommendations():
+    """
+    Counts orders placed since the last run into the co-occurrence matrix.
+    Scheduled by celery beat; the matrix file must live on persistent storage.
+    """
+    # Imported here: numpy/scipy would otherwise load with every API worker
+    from app import recommendations
+
+    db = SessionLocal()
+    try:
+        return recommendations.build(db)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def roll_up_sales():
+    """
+    Folds settled orders into the hourly and daily sales rollups.
+    Scheduled by celery beat.
+    """
+    db = SessionLocal()
+    try:
+        return sales_rollups.apply_pending(db)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def refresh_category_listings(category_ids: list[int] | None = None):
+    """
+    Rebuilds the precomputed listings of `category_ids` after product writes,
+    or of every category when scheduled by celery beat.
+    """
+    db = SessionLocal()
+    try:
+        return category_listings.rebuild(db, category_ids)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def fan_out_wishlist_alerts(events: list, after_id: int = 0, shard: int = 0):
+    """
+    Records pending wishlist alerts for `events` (see app.wishlist_alerts),
+    re-queueing itself with its cursor when its share of rows is used up.
+    """
+    db = SessionLocal()
+    try:
+        remaining = wishlist_alerts.fan_out(db, events, after_id, shard)
+    finally:
+        db.close()
+    if remaining:
+        fan_out_wishlist_alerts.delay(*remaining)
+
+
+@celery_app.task
+def send_wishlist_digests():
+    """
+    Sends one email per user with pending wishlist alerts, spread over the
+    run interval. Scheduled by celery beat.
+    """
+    db = SessionLocal()
+    try:
+        digests = wishlist_alerts.claim_digests(db)
+    finally:
+        db.close()
+    for index, (email_to, subject, body) in enumerate(digests):
+        send_email.apply_async((subject, email_to, body), countdown=index / wishlist_alerts.WISHLIST_EMAILS_PER_SECOND)
+    return len(digests)
+
+
+# Fastly-style purge by surrogate key; at most 256 keys per request
+CDN_PURGE_URL = os.getenv("CDN_PURGE_URL")
+CDN_PURGE_TOKEN = os.getenv("CDN_PURGE_TOKEN")
+CDN_PURGE_BATCH = 256
+
+
+@celery_app.task(autoretry_for=(OSError,), retry_backoff=True, max_retries=5)
+def purge_surrogate_keys(keys: list[str]):
+    """
+    Purges CDN responses tagged with any of `keys` (see app.http_cache).
+    Retried with backoff, since a missed purge serves stale pages until the CDN TTL runs out.
+    """
+    if not CDN_PURGE_URL:
+        return 0
+    for start in range(0, len(keys), CDN_PURGE_BATCH):
+        request = urllib.request.Request(CDN_PURGE_URL, method="POST", headers={
+            "Surrogate-Key": " ".join(keys[start:start + CDN_PURGE_BATCH]),
+            **({"Fastly-Key": CDN_PURGE_TOKEN} if CDN_PURGE_TOKEN else {}),
+        })
+        with time_external("cdn", "purge"), urllib.request.urlopen(request, timeout=10):
+            pass
+    return len(keys)
@@ -0,0 +1,330 @@
+"""
+Prometheus-style metrics for the API and the Celery workers.
+
+Counters, gauges and histograms are sharded per thread: each thread updates
+its own dict of samples without taking a lock, and a scrape sums the shards.
+Only the first update a thread makes to a metric registers its shard under a
+lock.
+
+With several worker processes (uvicorn ``--workers``, Celery prefork), set
+``METRICS_MULTIPROC_DIR`` to a directory shared by all of them and emptied on
+deploy. Every process writes its samples to ``<pid>.json`` there every
+``METRICS_FLUSH_SECONDS`` and on exit, and ``/metrics`` merges all files.
+Counters and histograms keep the contribution of processes that have exited.
+Gauges only count processes that are still alive.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._reset()
+        REGISTRY.register(self)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            REGISTRY.ensure_flusher()
+        return shard
+
+    def _check_labels(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    @abstractmethod
+    def samples(self) -> dict[tuple, object]:
+        """Current values by label tuple, summed over threads."""
+
+    def describe(self) -> dict:
+        return {"kind": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        shard = self._shard()
+        key = self._check_labels(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def samples(self) -> dict[tuple, float]:
+        totals: dict[tuple, float] = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+class Gauge(Counter):
+    """A gauge moved with inc/dec, such as requests in flight."""
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class GaugeFunction(_Metric):
+    """A gauge whose samples are read from `function` at collection time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], function):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def samples(self) -> dict[tuple, float]:
+        return {self._check_labels(tuple(key)): float(value) for key, value in self.function().items()}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, *labels) -> None:
+        shard = self._shard()
+        key = self._check_labels(labels)
+        # Per-bucket (not cumulative) counts plus a +Inf slot, then the sum
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> dict[tuple, list]:
+        totals: dict[tuple, list] = {}
+        for shard in list(self._shards):
+            for key, counts in list(shard.items()):
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = list(counts)
+                else:
+                    for i, value in enumerate(counts):
+                        total[i] += value
+        return totals
+
+    def describe(self) -> dict:
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        return {
+            name: {**metric.describe(), "samples": [[list(key), value] for key, value in metric.samples().items()]}
+            for name, metric in self._metrics.items()
+        }
+
+    def reset_after_fork(self) -> None:
+        # A forked worker starts from zero; the parent's samples stay in the parent's file
+        for metric in self._metrics.values():
+            metric._reset()
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def ensure_flusher(self) -> None:
+        if METRICS_MULTIPROC_DIR is None or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_forever, name="metrics-flusher", daemon=True).start()
+
+    def _flush_forever(self) -> None:
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            self.write_snapshot()
+
+    def write_snapshot(self) -> None:
+        if METRICS_MULTIPROC_DIR is None:
+            return
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+        payload = {"pid": os.getpid(), "metrics": self.snapshot()}
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_MULTIPROC_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as handle:
+                json.dump(payload, handle)
+            os.replace(tmp_path, os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}.json"))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def collect(self) -> dict:
+        """Samples of this process, merged with the other processes' files when multiprocess."""
+        if METRICS_MULTIPROC_DIR is None:
+            return self.snapshot()
+        self.write_snapshot()
+        merged: dict = {}
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+            try:
+                with open(path) as handle:
+                    payload = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(payload["pid"])
+            for name, metric in payload["metrics"].items():
+                if metric["kind"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for key, value in metric["samples"]:
+                    key = tuple(key)
+                    current = target["samples"].get(key)
+                    if current is None:
+                        target["samples"][key] = value
+                    elif isinstance(value, list):
+                        target["samples"][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target["samples"][key] = current + value
+        for metric in merged.values():
+            metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+        return merged
+
+    def render(self) -> str:
+        """The Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric["labelnames"]
+            for key, value in sorted(metric["samples"], key=lambda sample: sample[0]):
+                pairs = list(zip(labelnames, key))
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY.reset_after_fork)
+atexit.register(REGISTRY.write_snapshot)
+
+
+# API
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route", ("method", "route")
+)
+HTTP_REQUESTS = Counter("http_requests_total", "Responses sent, by route and status code", ("method", "route", "status"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests currently being handled", ("method",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result (hit or miss)", ("result",))
+
+
+def _pool_samples() -> dict:
+    from app.database import pool_stats
+    return pool_stats()
+
+
+DB_POOL_CONNECTIONS = GaugeFunction(
+    "db_pool_connections", "Connections per engine pool by state", ("engine", "state"), _pool_samples
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time a checkout waited for a pooled connection",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+
+# Requests turned away before reaching a handler
+RATE_LIMITED_REQUESTS = Counter("rate_limited_requests_total", "Requests refused with 429, by limit", ("limit",))
+SHED_REQUESTS = Counter("load_shed_requests_total", "Requests refused with 503 while the database pool was saturated")
+
+# Celery
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    "celery_task_queue_wait_seconds", "Time between publishing a task and a worker starting it", ("task",), TASK_BUCKETS
+)
+TASK_RUNTIME_SECONDS = Histogram(
+    "celery_task_runtime_seconds", "Task run time, by final state", ("task", "state"), TASK_BUCKETS
+)
+
+# Calls to other services, so a slow request can be pinned on Stripe, SMTP, ...
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_duration_seconds", "Time spent calling external services", ("service", "operation", "outcome")
+)
+
+
+@contextmanager
+def time_external(service: str, operation: str):
+    """Times a call to another service, labelled ok or error by whether it raised."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - started, service, operation, outcome)
@@ -0,0 +1,85 @@
+"""
+Warm-up before an API process takes traffic.
+
+A new worker pays for its first requests: it opens database connections,
+compiles the hot catalog statements and loads the JWT backend. Running
+``warm_worker`` in the lifespan startup moves that cost to before uvicorn
+accepts connections, so a rolling deploy does not hand it to live requests.
+
+``warm_shared_caches`` fills what workers share through the cache: every
+category listing that is missing, and the related products of the
+WARMUP_POPULAR_PRODUCTS most popular products. The runner (app.server)
+calls it once, before forking the workers.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import Connection, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.database import get_engine, get_replicas
+from app.models import models
+from app.category_listings import ListingSort, page_ids
+from app.related import related_products
+from app.routers.Oauth2 import create_token, verifyToken
+from app.routers.categories import CATEGORY_ROWS
+from app.routers.product import PRODUCT_BY_ID, PRODUCTS_BY_IDS
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Pool connections to open up front; beyond the pool size they are closed again
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "5"))
+WARMUP_POPULAR_PRODUCTS = int(os.getenv("WARMUP_POPULAR_PRODUCTS", "100"))
+
+
+def popular_product_ids(db: Session | Connection, limit: int = WARMUP_POPULAR_PRODUCTS) -> list[int]:
+    return list(db.execute(select(models.ProductPopularity.product_id).order_by(
+        models.ProductPopularity.score.desc()
+    ).limit(limit)).scalars())
+
+
+def warm_shared_caches(db: Session) -> dict:
+    """Builds missing category listings and caches related products of the most popular products."""
+    category_ids = list(db.execute(select(models.Product.category).where(
+        models.Product.category.isnot(None)
+    ).distinct()).scalars())
+    for category_id in category_ids:
+        for sort in ListingSort:
+            page_ids(db, category_id, sort, 0, 1)
+    popular = popular_product_ids(db)
+    for product_id in popular:
+        related_products(db, product_id)
+    db.commit()
+    return {"categories": len(category_ids), "popular_products": len(popular)}
+
+
+def _warm_engine(engine, connections: int) -> None:
+    opened = [engine.connect() for _ in range(connections)]
+    try:
+        # Compiled statements are cached per engine, so each one runs the hot reads once
+        connection = opened[0]
+        popular = popular_product_ids(connection)
+        connection.execute(CATEGORY_ROWS).all()
+        connection.execute(PRODUCT_BY_ID, {"product_id": popular[0] if popular else 0}).all()
+        connection.execute(PRODUCTS_BY_IDS, {"ids": popular or [0]}).all()
+        connection.rollback()
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+def warm_worker() -> bool:
+    """Opens pool connections, compiles the catalog reads and checks the JWT settings. False if the database failed."""
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    verifyToken(create_token({"id": 0, "role": "warmup"}), credentials_exception)
+    try:
+        _warm_engine(get_engine(), max(1, WARMUP_CONNECTIONS))
+        for replica in get_replicas():
+            if replica.is_usable():
+                _warm_engine(replica.engine, max(1, WARMUP_CONNECTIONS))
+    except SQLAlchemyError as e:
+        logger.error("Warm-up could not reach the database: %s", e)
+        return False
+    return True
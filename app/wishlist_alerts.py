@@ -0,0 +1,191 @@
+"""
+Price-drop and back-in-stock emails for wishlisted products.
+
+Writes that lower a price or bring stock back from zero call
+``queue_alerts`` after their commit, which hands the events to the
+``fan_out_wishlist_alerts`` task in groups of WISHLIST_EVENTS_PER_TASK.
+The task walks each product's wishlist rows by id through
+ix_wishlist_product_id_id, WISHLIST_BATCH_SIZE at a time, and records one
+pending ``WishlistAlert`` per user with ``ON CONFLICT DO NOTHING``. A user who
+was already told about the same product and kind within
+WISHLIST_ALERT_COOLDOWN_HOURS is skipped. After WISHLIST_ROWS_PER_TASK rows
+the task re-queues itself with its cursor, so a product on 500k wishlists is
+handled by a short chain of tasks instead of one long one. With sharding
+(app.sharding) the walk covers each shard in turn; the alerts themselves are
+recorded on the primary.
+
+Every WISHLIST_DIGEST_INTERVAL_SECONDS celery beat runs
+``send_wishlist_digests``. It claims the pending alerts of up to
+WISHLIST_DIGESTS_PER_RUN users and sends each user one email listing all of
+them. Alerts that no longer hold are dropped: the product left the wishlist,
+its price went back up, or it sold out again. The emails are spread over
+the interval at WISHLIST_EMAILS_PER_SECOND. Any users left over wait for the
+next run.
+
+Stock released by expired checkout reservations does not raise alerts.
+"""
+from datetime import datetime, timedelta
+from html import escape
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.celery_app import celery_app
+from app.models import models
+from app.sharding import session_on, shard_count, shards_of
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WISHLIST_BATCH_SIZE = int(os.getenv("WISHLIST_BATCH_SIZE", "5000"))
+WISHLIST_ROWS_PER_TASK = int(os.getenv("WISHLIST_ROWS_PER_TASK", "50000"))
+WISHLIST_EVENTS_PER_TASK = int(os.getenv("WISHLIST_EVENTS_PER_TASK", "1000"))
+WISHLIST_ALERT_COOLDOWN_HOURS = int(os.getenv("WISHLIST_ALERT_COOLDOWN_HOURS", "24"))
+WISHLIST_DIGEST_INTERVAL_SECONDS = int(os.getenv("WISHLIST_DIGEST_INTERVAL_SECONDS", "300"))
+WISHLIST_DIGESTS_PER_RUN = int(os.getenv("WISHLIST_DIGESTS_PER_RUN", "2000"))
+WISHLIST_EMAILS_PER_SECOND = float(os.getenv("WISHLIST_EMAILS_PER_SECOND", "10"))
+
+PRICE_DROP = "price_drop"
+BACK_IN_STOCK = "back_in_stock"
+DIGEST_SUBJECT = "Updates on your wishlist"
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def alert_events(product_id: int, old_price: int, new_price: int, old_stock: int, new_stock: int) -> list:
+    """The ``[product_id, kind, old_price]`` events a product change raises, if any."""
+    events = []
+    if new_price < old_price:
+        events.append([product_id, PRICE_DROP, old_price])
+    if old_stock <= 0 < new_stock:
+        events.append([product_id, BACK_IN_STOCK, None])
+    return events
+
+
+def queue_alerts(events: list) -> None:
+    """Hands events to the fan-out task. Call after the change is committed."""
+    for start in range(0, len(events), WISHLIST_EVENTS_PER_TASK):
+        # By name: app.tasks imports this module
+        celery_app.send_task("app.tasks.fan_out_wishlist_alerts", args=[events[start:start + WISHLIST_EVENTS_PER_TASK]])
+
+
+def _record(db: Session, product_id: int, kind: str, old_price, user_ids: list[int], now: datetime) -> None:
+    Alert = models.WishlistAlert
+    cooling = {user_id for (user_id,) in db.query(Alert.user_id).filter(
+        Alert.product_id == product_id, Alert.kind == kind, Alert.user_id.in_(user_ids),
+        Alert.sent_at >= now - timedelta(hours=WISHLIST_ALERT_COOLDOWN_HOURS),
+    ).all()}
+    rows = [
+        {"user_id": user_id, "product_id": product_id, "kind": kind, "old_price": old_price, "created_at": now}
+        for user_id in user_ids if user_id not in cooling
+    ]
+    if not rows:
+        return
+    # A pending alert for the same drop keeps its original, higher old price
+    statement = _INSERTS[db.bind.dialect.name](Alert).on_conflict_do_nothing(
+        index_elements=[Alert.user_id, Alert.product_id, Alert.kind], index_where=Alert.sent_at.is_(None)
+    )
+    db.execute(statement, rows)
+
+
+def fan_out(db: Session, events: list, after_id: int = 0, shard: int = 0):
+    """
+    Records pending alerts for the wishlisters of each event's product,
+    shard by shard, committing every batch. Returns ``(events, after_id,
+    shard)`` to continue from once WISHLIST_ROWS_PER_TASK rows have been read,
+    or None when done.
+    """
+    budget = WISHLIST_ROWS_PER_TASK
+    for index, (product_id, kind, old_price) in enumerate(events):
+        while shard < shard_count():
+            with session_on(db, shard) as wishlist_db:
+                while True:
+                    if budget <= 0:
+                        return events[index:], after_id, shard
+                    rows = wishlist_db.query(models.Wishlist.id, models.Wishlist.user_id).filter(
+                        models.Wishlist.product_id == product_id, models.Wishlist.id > after_id
+                    ).order_by(models.Wishlist.id).limit(WISHLIST_BATCH_SIZE).all()
+                    if rows:
+                        _record(db, product_id, kind, old_price, [row.user_id for row in rows], datetime.utcnow())
+                        db.commit()
+                        budget -= len(rows)
+                    if len(rows) < WISHLIST_BATCH_SIZE:
+                        break
+                    after_id = rows[-1].id
+            shard += 1
+            after_id = 0
+        shard = 0
+    return None
+
+
+def _wishlisted(db: Session, user_ids: list[int], product_ids: set[int]) -> set[tuple[int, int]]:
+    """The ``(user_id, product_id)`` pairs still on the users' wishlists."""
+    pairs = set()
+    for shard, shard_user_ids in shards_of(user_ids).items():
+        with session_on(db, shard) as wishlist_db:
+            pairs.update(wishlist_db.query(models.Wishlist.user_id, models.Wishlist.product_id).filter(
+                models.Wishlist.user_id.in_(shard_user_ids), models.Wishlist.product_id.in_(product_ids)
+            ).all())
+    return pairs
+
+
+def _still_holds(row) -> bool:
+    if row.kind == PRICE_DROP:
+        return row.price < row.old_price
+    return row.stock > 0
+
+
+def _digest_body(rows) -> str:
+    lines = []
+    for row in rows:
+        if row.kind == PRICE_DROP:
+            lines.append(
+                f"<li>{escape(row.name)}: now ${row.price / 100:.2f} "
+                f"(was ${row.old_price / 100:.2f})</li>"
+            )
+        else:
+            lines.append(f"<li>{escape(row.name)} is back in stock</li>")
+    items_html = "".join(lines)
+    return f"""
+    <h2>Updates on your wishlist</h2>
+    <ul>{items_html}</ul>
+    """
+
+
+def claim_digests(db: Session, limit: int = WISHLIST_DIGESTS_PER_RUN) -> list[tuple[str, str, str]]:
+    """
+    Marks the pending alerts of up to `limit` users as sent and returns one
+    ``(email, subject, body)`` digest per user that still has something to
+    report. Only the alerts read here are marked, under a row lock that
+    overlapping runs skip, so an alert queued meanwhile waits for the next
+    digest instead of being lost. Sent alerts past the cooldown are deleted
+    on the way.
+    """
+    Alert = models.WishlistAlert
+    now = datetime.utcnow()
+    user_ids = [user_id for (user_id,) in db.query(Alert.user_id).filter(
+        Alert.sent_at.is_(None)
+    ).distinct().order_by(Alert.user_id).limit(limit).all()]
+    digests = []
+    if user_ids:
+        rows = db.query(
+            Alert.id, Alert.user_id, Alert.product_id, Alert.kind, Alert.old_price,
+            models.Product.name, models.Product.price, models.Product.stock, models.User.email
+        ).join(
+            models.Product, models.Product.id == Alert.product_id
+        ).join(models.User, models.User.id == Alert.user_id).filter(
+            Alert.user_id.in_(user_ids), Alert.sent_at.is_(None)
+        ).order_by(Alert.user_id, Alert.id).with_for_update(of=Alert, skip_locked=True).all()
+        # Wishlists may be on other shards than the alerts (app.sharding)
+        wishlisted = _wishlisted(db, user_ids, {row.product_id for row in rows})
+        by_user: dict[str, list] = {}
+        for row in rows:
+            if (row.user_id, row.product_id) in wishlisted and _still_holds(row):
+                by_user.setdefault(row.email, []).append(row)
+        db.query(Alert).filter(Alert.id.in_([row.id for row in rows])).update(
+            {Alert.sent_at: now}, synchronize_session=False
+        )
+        digests = [(email, DIGEST_SUBJECT, _digest_body(user_rows)) for email, user_rows in by_user.items()]
+    db.query(Alert).filter(Alert.sent_at < now - timedelta(hours=WISHLIST_ALERT_COOLDOWN_HOURS)).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    return digests
@@ -0,0 +1,84 @@
+"""
+Compares two ways to serve one page of a --products product category sorted
+by price, at a few offsets:
+
+- query: ``ORDER BY price LIMIT .. OFFSET ..`` on every request
+- listing: slice the precomputed id array and fetch the page by primary key
+  (app.category_listings.page_ids)
+
+Uses an in-memory SQLite database. With Redis unreachable, the listing is
+kept in the cache's in-process fallback, so the numbers leave out the Redis
+round trip::
+
+    python benchmarks/category_listings.py --products 50000 --rounds 500
+"""
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("CACHE_REDIS_URL", "redis://127.0.0.1:1/0")
+
+from app.database import Base  # noqa: E402
+from app.models import models  # noqa: E402
+from app.category_listings import ListingSort, page_ids  # noqa: E402
+
+PAGE_SIZE = 24
+
+
+def make_session(products: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(insert(models.Category), [{"id": 1, "name": "Bench"}])
+    db.execute(insert(models.Product), [
+        {"id": i + 1, "name": f"Kettle {i + 1}", "description": "steel kettle", "price": (i * 7919) % 10_000,
+         "image_url": "", "category": 1, "stock": 100}
+        for i in range(products)
+    ])
+    db.commit()
+    return db
+
+
+def query_page(db, offset: int) -> list[int]:
+    return [product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.category == 1).order_by(
+        models.Product.price, models.Product.id.desc()
+    ).offset(offset).limit(PAGE_SIZE).all()]
+
+
+def listing_page(db, offset: int) -> list[int]:
+    ids, _ = page_ids(db, 1, ListingSort.price, offset, PAGE_SIZE)
+    rows = {row.id: row for row in db.query(models.Product.id, models.Product.name, models.Product.price).filter(
+        models.Product.id.in_(ids)
+    ).all()}
+    return [product_id for product_id in ids if product_id in rows]
+
+
+def measure(function, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    db = make_session(args.products)
+    for offset in (0, args.products // 2, args.products - PAGE_SIZE):
+        if query_page(db, offset) != listing_page(db, offset):
+            raise SystemExit(f"The two paths returned different pages at offset {offset}")
+        query = measure(lambda: query_page(db, offset), args.rounds)
+        listing = measure(lambda: listing_page(db, offset), args.rounds)
+        print(f"offset {offset:>8}: query {query * 1e3:8.2f} ms  listing {listing * 1e3:8.3f} ms  ({query / listing:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
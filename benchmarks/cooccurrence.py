@@ -0,0 +1,86 @@
+"""
+Benchmark for the co-occurrence build in app.recommendations.
+
+Generates synthetic order lines with Zipf-distributed product popularity and
+times the full count, an incremental fold of new orders, and top-k ranking,
+with and without a mask of products that still exist.
+
+    python benchmarks/cooccurrence.py --lines 10000000 --products 100000
+"""
+import numpy as np
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommendations import count_cooccurrences, top_neighbors  # noqa: E402
+
+
+def synthetic_lines(n_lines: int, n_products: int, mean_basket: float, seed: int):
+    rng = np.random.default_rng(seed)
+    sizes = rng.poisson(mean_basket - 1, size=int(n_lines / mean_basket) + 1) + 1
+    order_ids = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)[:n_lines]
+    product_ids = (rng.zipf(1.3, size=len(order_ids)) - 1) % n_products
+    return order_ids, product_ids.astype(np.int64)
+
+
+def timed(label: str, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label:<38} {time.perf_counter() - started:8.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--basket", type=float, default=4.0, help="Mean lines per order")
+    parser.add_argument("--incremental", type=float, default=0.01, help="Share of lines folded in incrementally")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--deleted", type=float, default=0.1, help="Share of products masked out as deleted")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    order_ids, product_ids = timed(
+        f"generate {args.lines:,} lines", lambda: synthetic_lines(args.lines, args.products, args.basket, args.seed)
+    )
+    split = int(len(order_ids) * (1 - args.incremental))
+    # Keep whole orders on one side of the split
+    while 0 < split < len(order_ids) and order_ids[split] == order_ids[split - 1]:
+        split += 1
+
+    full = timed("full count", lambda: count_cooccurrences(order_ids, product_ids, args.products))
+    print(f"{'  non-zero pairs':<38} {full.nnz:>12,}")
+
+    base = count_cooccurrences(order_ids[:split], product_ids[:split], args.products)
+    delta = timed(
+        f"incremental count ({len(order_ids) - split:,} lines)",
+        lambda: count_cooccurrences(order_ids[split:], product_ids[split:], args.products),
+    )
+    merged = timed("merge into matrix", lambda: (base + delta).tocsr())
+    if (merged != full).nnz:
+        print("FAIL: incremental matrix differs from full count")
+        sys.exit(1)
+
+    touched = np.unique(product_ids[split:]).astype(merged.indices.dtype)
+    timed(
+        f"top-{args.top_k} for {len(touched):,} touched products",
+        lambda: sum(1 for _ in top_neighbors(merged, touched, args.top_k)),
+    )
+    everything = np.flatnonzero(merged.diagonal()).astype(merged.indices.dtype)
+    timed(
+        f"top-{args.top_k} for all {len(everything):,} products",
+        lambda: sum(1 for _ in top_neighbors(merged, everything, args.top_k)),
+    )
+    allowed = np.random.default_rng(args.seed).random(args.products) >= args.deleted
+    timed(
+        f"top-{args.top_k} for all, {args.deleted:.0%} deleted",
+        lambda: sum(1 for _ in top_neighbors(merged, everything, args.top_k, allowed=allowed)),
+    )
+
+
+if __name__ == "__main__":
+    main()
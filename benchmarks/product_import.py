@@ -0,0 +1,94 @@
+"""
+Throughput of the bulk product import (app/product_import.py).
+
+Writes --rows products as CSV or NDJSON, imports them into an empty catalog
+(all inserts), then imports them again with new prices and stock (all
+updates), and prints rows per second for both passes::
+
+    DATABASE_URL=sqlite:///bench-import.db python benchmarks/product_import.py --reset --rows 100000
+    DATABASE_URL=postgresql://... python benchmarks/product_import.py --reset --batch-size 2000
+
+--reset recreates the schema, like benchmarks/seed.py --reset.
+"""
+from sqlalchemy import insert
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed import ADJECTIVES, CATEGORY_NAMES, NOUNS, reset_schema  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import models  # noqa: E402
+from app.product_import import FIELDS, import_products, read_records  # noqa: E402
+import orjson  # noqa: E402
+
+
+def catalog(rows: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {"sku": f"SKU-{i:07d}", "name": f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}",
+         "description": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for everyday use",
+         "price": rng.randint(5, 500), "image_url": "", "category": rng.randint(1, len(CATEGORY_NAMES)),
+         "stock": rng.randint(0, 1000)}
+        for i in range(rows)
+    ]
+
+
+def encode(products: list[dict], format: str) -> str:
+    if format == "ndjson":
+        return "".join(orjson.dumps(product).decode() + "\n" for product in products)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(products)
+    return buffer.getvalue()
+
+
+def run_pass(label: str, data: str, format: str, batch_size: int) -> None:
+    db = SessionLocal()
+    try:
+        result = import_products(db, read_records(io.StringIO(data, newline=""), format), batch_size)
+    finally:
+        db.close()
+    rows = result["inserted"] + result["updated"]
+    print(f"{label:<8}{rows:>9} rows {result['seconds']:>8.2f}s {rows / result['seconds']:>10.0f} rows/s"
+          f"  (inserted {result['inserted']}, updated {result['updated']}, failed {result['failed']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reset", action="store_true", help="Drop all tables and migrate from scratch first")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.reset:
+        reset_schema()
+    db = SessionLocal()
+    try:
+        if db.query(models.Product.id).first() is not None:
+            raise SystemExit("Database already has products; pass --reset to start over")
+        if db.query(models.Category.id).first() is None:
+            db.execute(insert(models.Category), [{"id": i + 1, "name": name} for i, name in enumerate(CATEGORY_NAMES)])
+            db.commit()
+    finally:
+        db.close()
+
+    products = catalog(args.rows, args.seed)
+    run_pass("insert", encode(products, args.format), args.format, args.batch_size)
+    rng = random.Random(args.seed + 1)
+    for product in products:
+        product["price"], product["stock"] = rng.randint(5, 500), rng.randint(0, 1000)
+    run_pass("update", encode(products, args.format), args.format, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
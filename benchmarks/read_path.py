@@ -0,0 +1,101 @@
+"""
+Compares two ways to run the query of an anonymous product page, pool
+checkout to return included:
+
+- session: a Session per request running ``db.query(Product)``, committed
+  and closed, as the read handlers did through get_read_db
+- connection: a pooled connection in autocommit mode executing a prebuilt
+  Core statement, as they do through get_read_connection
+
+Uses a SQLite file, so connections come from a real pool; a network round
+trip saved per request on PostgreSQL (the BEGIN and COMMIT) is not in the
+numbers::
+
+    python benchmarks/read_path.py --products 1000 --rounds 20000
+"""
+from sqlalchemy import bindparam, create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.database import Base  # noqa: E402
+from app.models import models  # noqa: E402
+from app.schemas import schemas  # noqa: E402
+from app.serialization import schema_columns, rows_content  # noqa: E402
+
+PRODUCT_BY_ID = select(
+    models.Product.id, models.Product.updated_at, *schema_columns(schemas.ProductCreate, models.Product)
+).where(models.Product.id == bindparam("product_id"))
+
+
+def make_engine(path: str, products: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Category), [{"id": 1, "name": "Bench"}])
+        connection.execute(insert(models.Product), [
+            {"id": i + 1, "name": f"Kettle {i + 1}", "description": "steel kettle", "price": 20 + i % 50,
+             "image_url": "", "category": 1, "stock": 100}
+            for i in range(products)
+        ])
+    return engine
+
+
+def session_read(Session, product_id: int) -> dict:
+    db = Session()
+    try:
+        product = db.query(models.Product).filter(models.Product.id == product_id).first()
+        db.commit()
+        return schemas.ProductCreate.model_validate(product).model_dump()
+    finally:
+        db.close()
+
+
+def connection_read(engine, product_id: int) -> dict:
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        row = connection.execute(PRODUCT_BY_ID, {"product_id": product_id}).first()
+        return rows_content([row], schemas.ProductCreate)[0]
+
+
+def measure(function, ids: list[int]) -> float:
+    started = time.perf_counter()
+    for product_id in ids:
+        function(product_id)
+    return (time.perf_counter() - started) / len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(os.path.join(directory, "bench.db"), args.products)
+        Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        if session_read(Session, 1) != connection_read(engine, 1):
+            raise SystemExit("The two paths returned different products")
+
+        ids = [random.randint(1, args.products) for _ in range(args.rounds)]
+        paths = {"session": lambda product_id: session_read(Session, product_id),
+                 "connection": lambda product_id: connection_read(engine, product_id)}
+        for function in paths.values():
+            measure(function, ids[:max(1, args.rounds // 10)])
+        results = {name: measure(function, ids) for name, function in paths.items()}
+        engine.dispose()
+    for name, seconds in results.items():
+        print(f"{name:<11}{seconds * 1e6:>10.1f} us/request")
+    print(f"connection saves {(results['session'] - results['connection']) * 1e6:.1f} us/request "
+          f"({results['session'] / results['connection']:.2f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Seeds a database with a storefront-sized data set for load tests.
+
+Creates categories, a catalog with searchable names, customers with carts,
+an order history with line items, ratings, comments and the purchase
+profiles. Benchmark accounts ``bench-<n>@example.com`` (password
+``benchmark``) start with empty carts so the load test can check out.
+The same --seed always produces the same data.
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/seed.py --reset
+    DATABASE_URL=postgresql://... python benchmarks/seed.py --reset --products 20000 --orders 100000
+
+The schema is created with the Alembic migrations, as in production.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert, inspect, text
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from app.database import Base, SessionLocal, get_engine  # noqa: E402
+from app.models import models  # noqa: E402
+from app import purchase_profile  # noqa: E402
+from app.utils import hashPassword  # noqa: E402
+
+BENCH_PASSWORD = "benchmark"
+CHUNK = 5_000
+
+ADJECTIVES = ["red", "blue", "black", "white", "green", "classic", "slim", "organic", "wireless", "vintage",
+              "compact", "premium", "smart", "leather", "wooden", "steel", "cotton", "travel", "kids", "outdoor"]
+NOUNS = ["shirt", "jacket", "lamp", "headphones", "backpack", "mug", "sneakers", "watch", "chair", "blender",
+         "notebook", "keyboard", "bottle", "tent", "scarf", "speaker", "desk", "camera", "pillow", "kettle"]
+CATEGORY_NAMES = ["Apparel", "Footwear", "Electronics", "Home", "Kitchen", "Outdoors", "Office", "Toys",
+                  "Beauty", "Sports", "Garden", "Books", "Audio", "Travel", "Pets", "Tools"]
+
+
+def bench_email(index: int) -> str:
+    return f"bench-{index}@example.com"
+
+
+def alembic_config() -> Config:
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    return config
+
+
+def reset_schema() -> None:
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    command.upgrade(alembic_config(), "head")
+
+
+def insert_chunked(db, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[start:start + CHUNK])
+
+
+def seed(args) -> dict:
+    rng = random.Random(args.seed)
+    if args.reset:
+        reset_schema()
+    elif not inspect(get_engine()).has_table("products"):
+        command.upgrade(alembic_config(), "head")
+
+    db = SessionLocal()
+    try:
+        if db.query(models.Product.id).first() is not None:
+            raise SystemExit("Database already has products; pass --reset to start over")
+        # One hash for every account: bcrypt per user would dominate seeding
+        password = hashPassword(BENCH_PASSWORD)
+
+        categories = CATEGORY_NAMES[:args.categories] + [f"Category {i}" for i in range(len(CATEGORY_NAMES), args.categories)]
+        insert_chunked(db, models.Category, [{"id": i + 1, "name": name} for i, name in enumerate(categories)])
+
+        insert_chunked(db, models.Product, [
+            {
+                "id": i + 1,
+                "name": f"{rng.choice(ADJECTIVES).title()} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i + 1}",
+                "description": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for everyday use",
+                "price": rng.randint(5, 500),
+                "image_url": f"/images/{i + 1:064x}",
+                "category": rng.randint(1, args.categories),
+                "stock": args.stock,
+            }
+            for i in range(args.products)
+        ])
+
+        users = [{"id": i + 1, "email": f"customer-{i + 1}@example.com", "password": password, "role": "customer"}
+                 for i in range(args.customers)]
+        users += [{"id": args.customers + i + 1, "email": bench_email(i), "password": password, "role": "customer"}
+                  for i in range(args.bench_users)]
+        insert_chunked(db, models.User, users)
+
+        # Skewed popularity: a few products appear in most baskets, as in real catalogs
+        def pick_product() -> int:
+            return min(args.products, int(rng.paretovariate(1.2))) if rng.random() < 0.5 else rng.randint(1, args.products)
+
+        carts = {}
+        for user_id in range(1, args.customers + 1):
+            for _ in range(rng.randint(0, 4)):
+                carts[(user_id, pick_product())] = rng.randint(1, 3)
+        insert_chunked(db, models.Cart, [
+            {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+            for (user_id, product_id), quantity in carts.items()
+        ])
+
+        now = datetime.utcnow()
+        prices = dict(db.query(models.Product.id, models.Product.price).all())
+        orders, lines = [], []
+        for order_id in range(1, args.orders + 1):
+            basket = {pick_product() for _ in range(rng.randint(1, 4))}
+            items = [(product_id, rng.randint(1, 3)) for product_id in basket]
+            orders.append({
+                "order_id": order_id,
+                "user_id": rng.randint(1, args.customers),
+                "address": f"{rng.randint(1, 999)} Bench Street",
+                "stripe_session_id": f"cs_seed_{order_id}",
+                "payment_status": "paid",
+                "total_amount": sum(prices[product_id] * quantity for product_id, quantity in items),
+                "created_at": now - timedelta(seconds=rng.randint(0, 90 * 86400)),
+            })
+            lines += [{"order_id": order_id, "product_id": product_id, "quantity": quantity,
+                       "unit_price": prices[product_id]} for product_id, quantity in items]
+        insert_chunked(db, models.Order, orders)
+        insert_chunked(db, models.OrderItem, lines)
+
+        insert_chunked(db, models.Rating, [
+            {"product_id": pick_product(), "user_id": rng.randint(1, args.customers), "rating": rng.randint(1, 5)}
+            for _ in range(args.ratings)
+        ])
+        insert_chunked(db, models.Comment, [
+            {"product_id": pick_product(), "user_id": rng.randint(1, args.customers),
+             "comment": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}, would buy again"}
+            for _ in range(args.comments)
+        ])
+        insert_profiles(db, orders, lines)
+        db.commit()
+        _reset_sequences(db)
+    finally:
+        db.close()
+    return {"categories": args.categories, "products": args.products, "users": len(users), "carts": len(carts),
+            "orders": len(orders), "order_items": len(lines)}
+
+
+def insert_profiles(db, orders: list[dict], lines: list[dict]) -> None:
+    """
+    Writes the purchase profiles in bulk, with the same weights as
+    app.purchase_profile, and marks the orders as profiled. Folding the
+    history in one order at a time would dominate seeding time.
+    """
+    categories = dict(db.query(models.Product.id, models.Product.category).all())
+    by_id = {order["order_id"]: order for order in orders}
+    popularity, affinity = {}, {}
+    for line in lines:
+        order = by_id[line["order_id"]]
+        at, quantity = order["created_at"], line["quantity"]
+        score, units, last = popularity.get(line["product_id"], (0.0, 0, at))
+        popularity[line["product_id"]] = (score + quantity * purchase_profile.popularity_weight(at),
+                                          units + quantity, max(last, at))
+        key = (order["user_id"], categories[line["product_id"]])
+        count, last = affinity.get(key, (0, at))
+        affinity[key] = (count + quantity, max(last, at))
+    insert_chunked(db, models.ProductPopularity, [
+        {"product_id": product_id, "score": score, "units_sold": units, "last_ordered_at": last}
+        for product_id, (score, units, last) in popularity.items()
+    ])
+    insert_chunked(db, models.UserCategoryAffinity, [
+        {"user_id": user_id, "category_id": category_id, "purchase_count": count, "last_purchased_at": last}
+        for (user_id, category_id), (count, last) in affinity.items()
+    ])
+    db.query(models.Order).update({models.Order.profiled_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def _reset_sequences(db) -> None:
+    """Explicit ids leave PostgreSQL sequences behind; move them past the seeded rows."""
+    if db.bind.dialect.name != "postgresql":
+        return
+    for table, column in (("categories", "id"), ("products", "id"), ("users", "id"), ("orders", "order_id")):
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), COALESCE(MAX({column}), 1)) FROM {table}"
+        ))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reset", action="store_true", help="Drop all tables and migrate from scratch first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--categories", type=int, default=16)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--customers", type=int, default=2_000)
+    parser.add_argument("--bench-users", type=int, default=64)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--ratings", type=int, default=20_000)
+    parser.add_argument("--comments", type=int, default=10_000)
+    parser.add_argument("--stock", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = seed(args)
+    print({**stats, "seconds": round(time.perf_counter() - started, 1)})
+
+
+if __name__ == "__main__":
+    main()
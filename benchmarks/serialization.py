@@ -0,0 +1,90 @@
+"""
+Compares the two ways a list endpoint can build its JSON body, on a search
+response of --items products:
+
+- orm: load Product objects, validate them into the response model and
+  JSON-encode the result, as FastAPI does for a returned list
+- rows: select the schema's columns as tuples and encode them with orjson
+  (app.serialization.rows_response)
+
+Uses an in-memory SQLite database, so the numbers cover loading and
+serialization only::
+
+    python benchmarks/serialization.py --items 100 --rounds 2000
+"""
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.database import Base  # noqa: E402
+from app.models import models  # noqa: E402
+from app.schemas import schemas  # noqa: E402
+from app.serialization import schema_columns, rows_response  # noqa: E402
+
+
+def make_session(items: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(insert(models.Category), [{"id": 1, "name": "Bench"}])
+    db.execute(insert(models.Product), [
+        {"id": i + 1, "name": f"Classic steel kettle {i + 1}", "description": "steel kettle for everyday use",
+         "price": 20 + i % 50, "image_url": f"/images/{i + 1:064x}", "category": 1, "stock": 100}
+        for i in range(items)
+    ])
+    db.commit()
+    return db
+
+
+def orm_body(db, adapter: TypeAdapter, items: int) -> bytes:
+    products = db.query(models.Product).order_by(models.Product.id).limit(items).all()
+    validated = adapter.validate_python(products, from_attributes=True)
+    body = json.dumps(adapter.dump_python(validated, mode="json"), separators=(",", ":")).encode()
+    db.expunge_all()
+    return body
+
+
+def rows_body(db, items: int) -> bytes:
+    rows = db.query(
+        models.Product.id, models.Product.updated_at, *schema_columns(schemas.ProductCreate, models.Product)
+    ).order_by(models.Product.id).limit(items).all()
+    return rows_response(rows, schemas.ProductCreate).body
+
+
+def measure(function, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = make_session(args.items)
+    adapter = TypeAdapter(list[schemas.ProductCreate])
+    if json.loads(orm_body(db, adapter, args.items)) != json.loads(rows_body(db, args.items)):
+        raise SystemExit("The two paths produced different bodies")
+
+    paths = {"orm": lambda: orm_body(db, adapter, args.items), "rows": lambda: rows_body(db, args.items)}
+    for function in paths.values():
+        measure(function, max(1, args.rounds // 10))
+    results = {name: measure(function, args.rounds) for name, function in paths.items()}
+    for name, seconds in results.items():
+        print(f"{name:<6}{seconds * 1e6:>10.1f} us/response")
+    print(f"rows is {results['orm'] / results['rows']:.2f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Load test for the storefront's hot paths.
+
+Each virtual user logs in with its own benchmark account (see
+benchmarks/seed.py) and loops: browse a category, open products, search,
+add to cart, create a checkout session and confirm the payment. Stripe is
+served by benchmarks/stripe_stub.py. Throughput and p50/p95/p99 latency per
+endpoint are printed and saved as JSON, named after the commit, so runs can
+be compared across commits::
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/seed.py --reset
+    DATABASE_URL=sqlite:///bench.db python benchmarks/storefront.py run --spawn --users 16 --duration 60
+    python benchmarks/storefront.py compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+--spawn starts the Stripe stub and ``uvicorn app.main:app`` with the current
+environment. Without it, the test targets --base-url, which must already run
+with STRIPE_API_BASE pointing at a stub. Order confirmation enqueues Celery
+tasks, so REDIS_URL must be reachable either way.
+"""
+from urllib.parse import urlencode, urlsplit
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed import BENCH_PASSWORD, CATEGORY_NAMES, NOUNS, bench_email  # noqa: E402
+import stripe_stub  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.recording = False
+        self.lock = threading.Lock()
+
+    def add(self, endpoint: str, seconds: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class Client:
+    """One keep-alive connection per virtual user."""
+
+    def __init__(self, base_url: str, recorder: Recorder):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.recorder = recorder
+        self.token = None
+
+    def request(self, endpoint: str, method: str, path: str, body=None, form: bool = False):
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded" if form else "application/json"
+            body = urlencode(body) if form else json.dumps(body)
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            payload, status = b"", 599
+        self.recorder.add(endpoint, time.perf_counter() - started, status < 400)
+        return status, (json.loads(payload) if payload and status < 500 else None)
+
+
+def token_user_id(token: str) -> int:
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["id"]
+
+
+def virtual_user(index: int, args, recorder: Recorder, stop: threading.Event) -> None:
+    rng = random.Random(args.seed + index)
+    client = Client(args.base_url, recorder)
+    iteration = 0
+    while not stop.is_set():
+        if iteration % args.login_every == 0:
+            status, body = client.request("login", "POST", "/login",
+                                          {"username": bench_email(index), "password": BENCH_PASSWORD}, form=True)
+            if status != 200:
+                time.sleep(1)
+                continue
+            client.token = body["access_token"]
+            user_id = token_user_id(client.token)
+        iteration += 1
+
+        status, products = client.request("browse_category", "GET", f"/getProducts/{rng.randint(1, args.categories)}")
+        product_ids = [rng.randint(1, args.products) for _ in range(args.views)]
+        for product_id in product_ids:
+            client.request("view_product", "GET", f"/getProduct/{product_id}?id={product_id}")
+        client.request("search", "GET", "/searchProducts?" + urlencode({"query": rng.choice(NOUNS)}))
+
+        for product_id in set(product_ids[:rng.randint(1, 3)]):
+            client.request("add_to_cart", "POST", "/addToCart", {"user_id": user_id, "product_id": product_id, "quantity": 1})
+        status, session = client.request("create_session", "POST", "/api/checkout/create-session", {
+            "success_url": "http://bench.local/success",
+            "cancel_url": "http://bench.local/cancel",
+            "address": f"{index} Bench Street",
+        })
+        if status == 200:
+            client.request("confirm_payment", "POST",
+                           "/api/checkout/confirm-payment?" + urlencode({"session_id": session["session_id"]}))
+
+
+def summarize(recorder: Recorder, seconds: float) -> dict:
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        endpoints[endpoint] = {
+            "requests": len(ordered),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput_rps": round(len(ordered) / seconds, 2),
+            **{f"p{p}_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2)
+               for p in PERCENTILES},
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+    total = sum(stats["requests"] for stats in endpoints.values())
+    return {"seconds": round(seconds, 2), "requests": total, "throughput_rps": round(total / seconds, 2),
+            "endpoints": endpoints}
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def wait_until_up(base_url: str, timeout: float = 30) -> None:
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            connection.request("GET", "/openapi.json")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"API at {base_url} did not come up within {timeout}s")
+
+
+def spawn_api(args):
+    stub = stripe_stub.serve(port=args.stripe_port, latency_ms=args.stripe_latency_ms)
+    env = {**os.environ, "STRIPE_API_BASE": f"http://127.0.0.1:{args.stripe_port}"}
+    env.setdefault("STRIPE_SECRET_KEY", "sk_test_benchmark")
+    # Every virtual user shares one IP; per-client limits would throttle the test itself
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+    port = urlsplit(args.base_url).port or 80
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    wait_until_up(args.base_url)
+    return stub, server
+
+
+def run(args) -> None:
+    stub = server = None
+    if args.spawn:
+        stub, server = spawn_api(args)
+    try:
+        recorder = Recorder()
+        stop = threading.Event()
+        users = [threading.Thread(target=virtual_user, args=(i, args, recorder, stop), daemon=True)
+                 for i in range(args.users)]
+        for user in users:
+            user.start()
+        time.sleep(args.warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        recorder.recording = False
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for user in users:
+            user.join(timeout=30)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if stub is not None:
+            stub.shutdown()
+
+    revision = git_revision()
+    result = {
+        "revision": revision,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key != "func"},
+        **summarize(recorder, elapsed),
+    }
+    print_summary(result)
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{revision}.json")
+    with open(path, "w") as handle:
+        json.dump(result, handle, indent=2)
+    print(f"Saved {path}")
+
+
+def print_summary(result: dict) -> None:
+    print(f"{'endpoint':<18}{'req':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<18}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+    print(f"total {result['requests']} requests, {result['throughput_rps']} req/s over {result['seconds']}s")
+
+
+def compare(args) -> None:
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)
+    print(f"{baseline['revision']} -> {candidate['revision']}")
+    print(f"{'endpoint':<18}{'p95 ms':>20}{'change':>9}{'rps':>20}")
+    regressions = []
+    for endpoint, new in candidate["endpoints"].items():
+        old = baseline["endpoints"].get(endpoint)
+        if old is None:
+            continue
+        change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        print(f"{endpoint:<18}{old['p95_ms']:>9} -> {new['p95_ms']:<8}{change:>+8.1f}%"
+              f"{old['throughput_rps']:>9} -> {new['throughput_rps']:<8}")
+        if change > args.max_regression:
+            regressions.append(endpoint)
+    if regressions:
+        raise SystemExit(f"p95 regressed by more than {args.max_regression}% on: {', '.join(regressions)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subcommands.add_parser("run", help="Drive the API and record latencies")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8765")
+    run_parser.add_argument("--spawn", action="store_true", help="Start the Stripe stub and the API")
+    run_parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    run_parser.add_argument("--stripe-port", type=int, default=12111)
+    run_parser.add_argument("--stripe-latency-ms", type=float, default=0.0)
+    run_parser.add_argument("--users", type=int, default=16, help="Concurrent virtual users (<= seeded bench users)")
+    run_parser.add_argument("--duration", type=float, default=60.0)
+    run_parser.add_argument("--warmup", type=float, default=5.0)
+    run_parser.add_argument("--login-every", type=int, default=10, help="Iterations between logins")
+    run_parser.add_argument("--views", type=int, default=3, help="Product pages per iteration")
+    run_parser.add_argument("--categories", type=int, default=len(CATEGORY_NAMES))
+    run_parser.add_argument("--products", type=int, default=5_000)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--results-dir", default=os.path.join(ROOT, "benchmarks", "results"))
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subcommands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--max-regression", type=float, default=10.0, help="Allowed p95 increase in percent")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Local stand-in for the two Stripe Checkout calls the API makes.
+
+Creates sessions that are immediately paid, so create-session and
+confirm-payment can be load tested without network calls or rate limits.
+Point the API at it with ``STRIPE_API_BASE``::
+
+    python benchmarks/stripe_stub.py --port 12111 --latency-ms 80
+    STRIPE_API_BASE=http://127.0.0.1:12111 uvicorn app.main:app
+
+--latency-ms adds a fixed delay per call to approximate the real API.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+
+_NESTED_KEY = re.compile(r"^(\w+)\[(\w+)\]")
+
+
+def _parse_form(body: str) -> dict:
+    """Decodes Stripe's form encoding far enough for metadata[...] fields."""
+    params: dict = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        nested = _NESTED_KEY.match(key)
+        if nested and nested.group(1) == "metadata":
+            params.setdefault("metadata", {})[nested.group(2)] = value
+        else:
+            params[key] = value
+    return params
+
+
+class StripeStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.sessions: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StripeStub
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = _parse_form(self.rfile.read(length).decode())
+        time.sleep(self.server.latency)
+        if self.path != "/v1/checkout/sessions":
+            return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+        session_id = f"cs_test_stub_{next(self.server.ids)}"
+        metadata = params.get("metadata", {})
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"http://stripe.stub/pay/{session_id}",
+            "client_secret": None,
+            "payment_status": "paid",
+            "status": "complete",
+            "customer_email": params.get("customer_email"),
+            "amount_total": int(metadata.get("total_amount", 0)),
+            "currency": "usd",
+            "metadata": metadata,
+        }
+        with self.server.lock:
+            self.server.sessions[session_id] = session
+        self._reply(200, session)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        prefix = "/v1/checkout/sessions/"
+        with self.server.lock:
+            session = self.server.sessions.get(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if session is None:
+            return self._reply(404, {"error": {"type": "invalid_request_error", "message": "No such checkout.session"}})
+        self._reply(200, session)
+
+
+def serve(host: str = "127.0.0.1", port: int = 12111, latency_ms: float = 0.0) -> StripeStub:
+    """Starts the stub on a background thread and returns the server."""
+    server = StripeStub((host, port), latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, name="stripe-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StripeStub((args.host, args.port), args.latency_ms / 1000)
+    print(f"Stripe stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Test setup: a SQLite primary and two SQLite shards in a temporary directory.
+
+The app reads its settings at import time, so the environment is set here,
+before anything from ``app`` is imported. Redis is pointed at a closed port:
+the cache and the rate limiter fall back to per-process stores, and Celery
+messages are captured instead of sent.
+"""
+import os
+import tempfile
+
+_DATA_DIR = tempfile.mkdtemp(prefix="ecommerce-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_DATA_DIR}/primary.db",
+    SHARD_DATABASE_URLS=f"sqlite:///{_DATA_DIR}/shard1.db,sqlite:///{_DATA_DIR}/shard2.db",
+    SHARD_BUCKETS="4",
+    SHARD_MAP_TTL_SECONDS="0",
+    SECRET_KEY="test-secret",
+    ALGORITHM="HS256",
+    STRIPE_SECRET_KEY="sk_test_unused",
+    REDIS_URL="redis://127.0.0.1:1/0",
+    UPLOAD_DIR=os.path.join(_DATA_DIR, "uploads"),
+)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from app import cache, sharding, tasks  # noqa: E402
+from app.celery_app import celery_app  # noqa: E402
+from app.database import SessionLocal, get_engine, get_shard_engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import models  # noqa: E402
+from app.routers.Oauth2 import create_token  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schemas():
+    models.Base.metadata.create_all(get_engine())
+    sharding.create_schema()
+
+
+@pytest.fixture(autouse=True)
+def databases(schemas):
+    """Empty tables on the primary and on every shard, and no cached shard map or listings."""
+    metadata = sharding.shard_metadata()
+    for shard in range(sharding.shard_count()):
+        tables = (models.Base.metadata if shard == 0 else metadata).sorted_tables
+        with get_shard_engine(shard).begin() as connection:
+            for table in reversed(tables):
+                connection.execute(table.delete())
+    sharding.forget_map()
+    cache._local.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def sent_tasks(monkeypatch):
+    """Celery messages the code under test sent, as ``(name, args)``."""
+    sent = []
+    monkeypatch.setattr(celery_app, "send_task", lambda name, args=None, **kwargs: sent.append((name, args)))
+    for task in (tasks.send_email, tasks.refresh_purchase_profile):
+        monkeypatch.setattr(task, "delay", lambda *args, name=task.name, **kwargs: sent.append((name, args)))
+    return sent
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_user(db):
+    def make(email: str, role: str = "customer") -> tuple[int, dict]:
+        user = models.User(email=email, password="unused", role=role)
+        db.add(user)
+        db.commit()
+        return user.id, {"Authorization": "Bearer " + create_token({"id": user.id, "role": role})}
+    return make
+
+
+@pytest.fixture
+def make_product(db):
+    def make(**values) -> int:
+        product = models.Product(**{"name": "Product", "price": 1000, "stock": 100, "description": "", "image_url": "", **values})
+        db.add(product)
+        db.commit()
+        return product.id
+    return make
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from app import inventory
+from app.database import SessionLocal
+from app.models import models
+
+WORKERS = 12
+
+
+def run_concurrently(call, count: int) -> list:
+    """Runs ``call(index)`` `count` times over WORKERS threads, each in its own session."""
+    def attempt(index):
+        db = SessionLocal()
+        try:
+            result = call(db, index)
+            db.commit()
+            return result
+        finally:
+            db.close()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        return list(pool.map(attempt, range(count)))
+
+
+def stock_and_held(db, product_id: int) -> tuple[int, int]:
+    db.expire_all()
+    stock = db.get(models.Product, product_id).stock
+    held = db.query(func.coalesce(func.sum(models.StockReservation.quantity), 0)).filter(
+        models.StockReservation.product_id == product_id, models.StockReservation.status == "pending"
+    ).scalar()
+    return stock, held
+
+
+def test_concurrent_decrements_never_oversell(db, make_user, make_product):
+    product = make_product(stock=50)
+    user_id, _ = make_user("customer@example.com")
+    expires_at = inventory.reservation_expiry()
+
+    def take(db, index):
+        # Every third caller sells two units outright; the others hold one for checkout
+        if index % 3 == 0:
+            return ("sold", 2) if inventory.decrement_stock(db, product, 2) else ("sold", 0)
+        return ("held", 1) if inventory.reserve(db, user_id, product, 1, expires_at) else ("held", 0)
+
+    results = run_concurrently(take, 120)
+
+    sold = sum(units for kind, units in results if kind == "sold")
+    stock, held = stock_and_held(db, product)
+    assert stock >= 0
+    assert held == sum(units for kind, units in results if kind == "held")
+    assert sold + held + stock == 50
+    # Callers wanting one unit keep going until nothing is left
+    assert stock == 0
+
+
+def test_releases_racing_reservations_keep_the_count(db, make_user, make_product):
+    product = make_product(stock=30)
+    user_id, _ = make_user("customer@example.com")
+    expires_at = inventory.reservation_expiry()
+    assert sum(run_concurrently(lambda db, _: inventory.reserve(db, user_id, product, 1, expires_at) is not None, 60)) == 30
+    reservations = [reservation.id for reservation in db.query(models.StockReservation.id)]
+
+    def churn(db, index):
+        # Releases race new reservations for the stock they give back; each reservation is released twice
+        if index < 2 * len(reservations):
+            reservation = db.get(models.StockReservation, reservations[index // 2])
+            inventory.release_reservation(db, reservation)
+        else:
+            inventory.reserve(db, user_id, product, 1, expires_at)
+
+    run_concurrently(churn, 2 * len(reservations) + 60)
+
+    stock, held = stock_and_held(db, product)
+    assert stock >= 0
+    assert stock + held == 30
+    assert db.query(models.StockReservation).filter_by(status="released").count() == len(reservations)
+
+
+def test_update_product_leaves_stock_alone(db, client, make_user, make_product):
+    product = make_product(stock=10)
+    _, headers = make_user("seller@example.com", "seller")
+    assert inventory.decrement_stock(db, product, 3)
+    db.commit()
+
+    response = client.put(f"/updateProduct/{{product_id}}?id={product}", json={
+        "name": "Renamed", "description": "", "price": 1000, "image_url": "", "stock": 10,
+    }, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["stock"] == 7
+    db.expire_all()
+    assert (db.get(models.Product, product).name, db.get(models.Product, product).stock) == ("Renamed", 7)
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/metrics/queries"])
+def test_metrics_need_an_admin(client, make_user, path):
+    _, customer = make_user("customer@example.com")
+    _, admin = make_user("admin@example.com", "admin")
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=customer).status_code == 403
+    assert client.get(path, headers=admin).status_code == 200
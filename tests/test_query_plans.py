@@ -0,0 +1,59 @@
+"""
+Fails when a hot lookup query falls back to a sequential scan.
+
+Every list endpoint filters on a foreign key; each of those statements is
+EXPLAINed on PostgreSQL with sequential scans disabled for the session, so a
+remaining "Seq Scan" means no usable index exists rather than a planner choice
+on a small table. Needs a scratch database in TEST_POSTGRES_URL; the schema is
+created there from the models and dropped afterwards.
+"""
+import os
+import pytest
+from sqlalchemy import create_engine, exists, select, text
+from app.models import models
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(
+    not (TEST_POSTGRES_URL or "").startswith("postgresql"), reason="TEST_POSTGRES_URL is not a PostgreSQL database"
+)
+
+_PURCHASED = exists().where(
+    models.OrderItem.product_id == models.Product.id,
+    models.OrderItem.order_id == models.Order.order_id,
+    models.Order.user_id == 1,
+)
+# (name, table that must not be scanned, statement)
+HOT_QUERIES = [
+    ("cart by user", "cart", select(models.Cart).where(models.Cart.user_id == 1)),
+    ("wishlist by user", "wishlist", select(models.Wishlist).where(models.Wishlist.user_id == 1)),
+    ("wishlist by product", "wishlist", select(models.Wishlist.user_id).where(models.Wishlist.product_id == 1)),
+    ("orders by user", "orders", select(models.Order).where(models.Order.user_id == 1)
+        .order_by(models.Order.order_id.desc()).limit(10)),
+    ("items by order", "order_items", select(models.OrderItem).where(models.OrderItem.order_id.in_([1, 2, 3]))),
+    ("items by product", "order_items", select(models.OrderItem.order_id).where(models.OrderItem.product_id == 1)),
+    ("ratings by product", "ratings", select(models.Rating).where(models.Rating.product_id == 1).limit(10)),
+    ("comments by product", "comments", select(models.Comment).where(models.Comment.product_id == 1).limit(10)),
+    ("products by category", "products", select(models.Product).where(models.Product.category == 1).limit(10)),
+    ("suggestion anti-join", "order_items", select(models.Product.id).where(models.Product.id == 1, ~_PURCHASED)),
+]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    engine = create_engine(TEST_POSTGRES_URL)
+    models.Base.metadata.create_all(engine)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SET enable_seqscan = off"))
+            yield connection
+    finally:
+        models.Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+@pytest.mark.parametrize("table, statement", [query[1:] for query in HOT_QUERIES], ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_an_index(connection, table, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    plan = [row[0] for row in connection.execute(text("EXPLAIN " + sql))]
+    assert not [line.strip() for line in plan if "Seq Scan on " + table in line], "\n".join(plan)
@@ -0,0 +1,15 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.rate_limit import RateLimitMiddleware, TokenBuckets
+
+
+def test_default_limit_has_a_bucket_per_route():
+    app = FastAPI()
+    app.get("/products")(lambda: [])
+    app.get("/products/{product_id}")(lambda product_id: {})
+    app.add_middleware(RateLimitMiddleware, limits={}, default="2/60", buckets=TokenBuckets("redis://127.0.0.1:1/0"))
+    client = TestClient(app)
+
+    assert [client.get("/products").status_code for _ in range(3)] == [200, 200, 429]
+    # Another route keeps its own budget, shared across its parameter values
+    assert [client.get(f"/products/{product_id}").status_code for product_id in (1, 2, 3)] == [200, 200, 429]
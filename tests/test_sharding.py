@@ -0,0 +1,181 @@
+from sqlalchemy import inspect
+from app import purchase_profile, sales_rollups, sharding, wishlist_alerts
+from app.database import get_shard_engine
+from app.models import models
+
+
+def rows_by_shard(db, model, **filters) -> dict[int, list]:
+    found = {}
+    for shard in range(sharding.shard_count()):
+        with sharding.session_on(db, shard) as shard_db:
+            found[shard] = shard_db.query(model).filter_by(**filters).all()
+    return found
+
+
+def place_order(client, headers, *items) -> int:
+    response = client.post("/createOrder", json={
+        "address": "1 Test Street", "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items],
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["order_id"]
+
+
+def mark_all_paid(db) -> None:
+    for shard in range(sharding.shard_count()):
+        with sharding.session_on(db, shard) as shard_db:
+            shard_db.query(models.Order).update({models.Order.payment_status: "paid"})
+            shard_db.commit()
+
+
+def spread_users(db, make_user, count: int = 4) -> list[tuple[int, dict]]:
+    """`count` customers, rebalanced so that every shard holds some of them."""
+    users = [make_user(f"customer{index}@example.com") for index in range(count)]
+    sharding.rebalance(db, settle_seconds=0)
+    assert {sharding.shard_for(user_id) for user_id, _ in users} == {0, 1, 2}
+    return users
+
+
+def test_create_schema_makes_sharded_tables_without_primary_foreign_keys():
+    for shard in (1, 2):
+        inspector = inspect(get_shard_engine(shard))
+        assert set(inspector.get_table_names()) == {"cart", "wishlist", "orders", "order_items"}
+        referred = {key["referred_table"] for table in ("cart", "wishlist", "orders", "order_items")
+                    for key in inspector.get_foreign_keys(table)}
+        assert referred == {"orders"}
+
+
+def test_rebalance_copies_each_bucket_to_its_new_shard(db, client, make_user, make_product):
+    product = make_product()
+    users = [make_user(f"customer{index}@example.com") for index in range(4)]
+    orders = {}
+    for user_id, headers in users:
+        assert client.post("/addToCart", json={"user_id": user_id, "product_id": product, "quantity": 1},
+                           headers=headers).status_code == 200
+        assert client.post("/createWishlist", json={"product_id": product}, headers=headers).status_code == 200
+        orders[user_id] = place_order(client, headers, (product, 2))
+
+    moves = sharding.rebalance(db, settle_seconds=0)
+
+    assert sorted(move["to"] for move in moves) == [1, 2]
+    assert [entry["buckets"] for entry in sharding.status(db)] == [2, 1, 1]
+    for user_id, headers in users:
+        owner = sharding.shard_for(user_id)
+        for model in (models.Cart, models.Wishlist, models.Order):
+            placed = rows_by_shard(db, model, user_id=user_id)
+            assert [shard for shard, rows in placed.items() if rows] == [owner]
+        order_rows = rows_by_shard(db, models.Order, user_id=user_id)[owner]
+        assert [order.order_id for order in order_rows] == [orders[user_id]]
+        assert len(rows_by_shard(db, models.OrderItem, order_id=orders[user_id])[owner]) == 1
+        assert len(client.get("/getAllCartItems", headers=headers).json()) == 1
+        assert len(client.get(f"/getOrders/{user_id}", headers=headers).json()) == 1
+
+
+def test_user_writes_go_to_the_owning_shard(db, client, make_user, make_product):
+    first, second = make_product(name="First"), make_product(name="Second")
+    for user_id, headers in spread_users(db, make_user):
+        owner = sharding.shard_for(user_id)
+        cart = client.post("/addToCart", json={"user_id": user_id, "product_id": first, "quantity": 1}, headers=headers)
+        assert cart.status_code == 200
+        moved = client.put(f"/updateCart?id={cart.json()['id']}",
+                           json={"user_id": user_id, "product_id": second, "quantity": 3}, headers=headers)
+        assert moved.status_code == 200
+        assert client.post("/createWishlist", json={"product_id": first}, headers=headers).status_code == 200
+        order_id = place_order(client, headers, (first, 1), (second, 1))
+
+        assert [shard for shard, rows in rows_by_shard(db, models.Cart, user_id=user_id).items() if rows] == [owner]
+        assert [shard for shard, rows in rows_by_shard(db, models.Wishlist, user_id=user_id).items() if rows] == [owner]
+        assert [shard for shard, rows in rows_by_shard(db, models.Order, user_id=user_id).items() if rows] == [owner]
+        assert len(rows_by_shard(db, models.OrderItem, order_id=order_id)[owner]) == 2
+        assert client.get(f"/getOrder/{{order_id}}?id={order_id}", headers=headers).status_code == 200
+
+    db.expire_all()
+    # Stock stays on the primary whichever shard took the order
+    assert db.get(models.Product, first).stock == 96
+
+
+def test_writes_get_503_while_the_bucket_moves(db, client, make_user, make_product):
+    product = make_product()
+    user_id, headers = make_user("customer@example.com")
+    bucket = sharding.bucket_of(user_id)
+    sharding._set_bucket(db, bucket, 0, True)
+
+    response = client.post("/addToCart", json={"user_id": user_id, "product_id": product, "quantity": 1}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/getAllCartItems", headers=headers).status_code == 200
+
+    sharding._set_bucket(db, bucket, 0, False)
+    response = client.post("/addToCart", json={"user_id": user_id, "product_id": product, "quantity": 1}, headers=headers)
+    assert response.status_code == 200
+
+
+def test_rollups_and_purchase_profiles_read_every_shard(db, client, make_user, make_product, monkeypatch):
+    category = models.Category(name="Lamps")
+    db.add(category)
+    db.commit()
+    lamp = make_product(name="Lamp", price=500, category=category.id)
+    users = spread_users(db, make_user)
+    for user_id, headers in users:
+        place_order(client, headers, (lamp, 2))
+    mark_all_paid(db)
+    monkeypatch.setattr(sales_rollups, "ORDER_SETTLE_SECONDS", -60)
+
+    assert purchase_profile.apply_pending(db) == len(users)
+    assert sales_rollups.apply_pending(db)["lines"] == len(users)
+
+    assert db.get(models.ProductPopularity, lamp).units_sold == 2 * len(users)
+    affinities = db.query(models.UserCategoryAffinity).filter_by(category_id=category.id).all()
+    assert sorted(row.user_id for row in affinities) == sorted(user_id for user_id, _ in users)
+    total = db.query(models.SalesRollup).filter_by(period="day", dimension=sales_rollups.TOTAL).one()
+    assert (total.orders, total.units, total.revenue) == (len(users), 2 * len(users), 1000 * len(users))
+    watermarks = {row.name for row in db.query(models.JobWatermark)}
+    assert {"sales_rollups", "sales_rollups:1", "sales_rollups:2"} <= watermarks
+
+    # Nothing is folded twice
+    assert purchase_profile.apply_pending(db) == 0
+    assert sales_rollups.apply_pending(db)["lines"] == 0
+
+
+def test_wishlist_alerts_reach_wishlisters_on_every_shard(db, client, make_user, make_product, monkeypatch):
+    product = make_product(price=1000)
+    users = spread_users(db, make_user)
+    for user_id, headers in users:
+        assert client.post("/createWishlist", json={"product_id": product}, headers=headers).status_code == 200
+    monkeypatch.setattr(wishlist_alerts, "WISHLIST_BATCH_SIZE", 1)
+    monkeypatch.setattr(wishlist_alerts, "WISHLIST_ROWS_PER_TASK", 2)
+    db.query(models.Product).filter_by(id=product).update({models.Product.price: 800})
+    db.commit()
+
+    remaining = wishlist_alerts.fan_out(db, [[product, wishlist_alerts.PRICE_DROP, 1000]])
+    runs = 1
+    while remaining:
+        remaining = wishlist_alerts.fan_out(db, *remaining)
+        runs += 1
+
+    assert runs > 1
+    alerted = sorted(user_id for (user_id,) in db.query(models.WishlistAlert.user_id))
+    assert alerted == sorted(user_id for user_id, _ in users)
+
+    # An alert for a product that left the wishlist is dropped from the digest
+    gone_id, gone_headers = users[-1]
+    wishlist_id = rows_by_shard(db, models.Wishlist, user_id=gone_id)[sharding.shard_for(gone_id)][0].id
+    assert client.delete(f"/deleteWishlist/{wishlist_id}?id={wishlist_id}", headers=gone_headers).status_code == 200
+    digests = wishlist_alerts.claim_digests(db)
+    assert sorted(email for email, _, _ in digests) == sorted(f"customer{index}@example.com" for index in range(len(users) - 1))
+    assert db.query(models.WishlistAlert).filter(models.WishlistAlert.sent_at.is_(None)).count() == 0
+
+
+def test_order_export_covers_every_shard(db, client, make_user, make_product):
+    product = make_product()
+    users = spread_users(db, make_user)
+    placed = {user_id: place_order(client, headers, (product, 1)) for user_id, headers in users}
+    _, admin_headers = make_user("admin@example.com", "admin")
+
+    response = client.get("/admin/export/orders?format=csv", headers=admin_headers)
+
+    assert response.status_code == 200
+    header, *lines = response.text.strip().splitlines()
+    columns = header.split(",")
+    exported = sorted((int(line.split(",")[columns.index("user_id")]), int(line.split(",")[columns.index("order_id")]))
+                      for line in lines)
+    assert exported == sorted(placed.items())
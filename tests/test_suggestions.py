@@ -0,0 +1,26 @@
+from app import purchase_profile
+from app.models import models
+
+
+def test_suggestions_skip_purchases_and_read_a_bounded_number(db, client, make_user, make_product, monkeypatch):
+    category = models.Category(name="Lamps")
+    db.add(category)
+    db.commit()
+    lamps = [make_product(name=f"Lamp {index}", category=category.id) for index in range(6)]
+    user_id, headers = make_user("customer@example.com")
+    response = client.post("/createOrder", json={
+        "address": "1 Test Street", "items": [{"product_id": lamps[0], "quantity": 3}],
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    purchase_profile.apply_pending(db)
+
+    suggested = client.get("/api/checkout/suggestions?limit=50", headers=headers)
+    assert suggested.status_code == 200, suggested.text
+    assert sorted(product["id"] for product in suggested.json()) == sorted(lamps[1:])
+
+    monkeypatch.setattr(purchase_profile, "SUGGESTION_MAX_CANDIDATES", 3)
+    # The purchased lamp ranks first, so three candidates leave two suggestions
+    assert len(client.get("/api/checkout/suggestions?limit=5", headers=headers).json()) == 2
+
+    assert client.get("/api/checkout/suggestions?limit=51", headers=headers).status_code == 422
+    assert client.get("/api/checkout/suggestions?limit=0", headers=headers).status_code == 422